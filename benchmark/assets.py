@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Measure the cost of embedding the styles and scripts in every log."""
+
+# © 2023 National Technology & Engineering Solutions of Sandia, LLC
+# (NTESS).  Under the terms of Contract DE-NA0003525 with NTESS, the
+# U.S. Government retains certain rights in this software.
+
+# SPDX-License-Identifier: BSD-3-Clause
+
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from shell_logger import ShellLogger
+
+LOGS = 200
+
+with tempfile.TemporaryDirectory() as log_dir:
+    asset_dir = Path(log_dir) / "assets"
+    for title, assets in [("Embedded", None), ("Shared", asset_dir)]:
+        loggers = []
+        for i in range(LOGS):
+            logger = ShellLogger(
+                f"{title} {i}", log_dir=Path(log_dir), asset_dir=assets
+            )
+            logger.html_print("A short log.")
+            loggers.append(logger)
+        start = perf_counter()
+        for logger in loggers:
+            logger.finalize()
+        seconds = perf_counter() - start
+        size = sum(logger.html_file.stat().st_size for logger in loggers)
+        if assets is not None:
+            size += sum(path.stat().st_size for path in assets.iterdir())
+        print(
+            f"{title}:  {LOGS} logs finalized in {seconds:.2f} s, "
+            f"{size:,} bytes in all"
+        )
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Measure the per-command overhead of capturing auxiliary information."""
+
+# © 2023 National Technology & Engineering Solutions of Sandia, LLC
+# (NTESS).  Under the terms of Contract DE-NA0003525 with NTESS, the
+# U.S. Government retains certain rights in this software.
+
+# SPDX-License-Identifier: BSD-3-Clause
+
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from shell_logger import ShellLogger
+
+ITERATIONS = 200
+AUXILIARY_COMMANDS = {
+    "pwd": "pwd",
+    "environment": "env",
+    "umask": "umask",
+    "hostname": "hostname",
+    "user": "whoami",
+    "group": "id -gn",
+    "shell": "printenv SHELL",
+    "ulimit": "ulimit -a",
+}
+
+
+def one_round_trip_per_command(sl: ShellLogger) -> None:
+    """
+    Capture the auxiliary information the way it used to be done.
+
+    Parameters:
+        sl:  The logger whose shell to query.
+    """
+    for command in AUXILIARY_COMMANDS.values():
+        sl.shell.auxiliary_command(posix=command)
+
+
+def uncached(sl: ShellLogger) -> None:
+    """
+    Capture all the auxiliary information in one batch, ignoring the cache.
+
+    Parameters:
+        sl:  The logger whose shell to query.
+    """
+    sl.refresh_aux()
+    sl.auxiliary_information()
+
+
+def time_per_call(function, sl: ShellLogger) -> float:
+    """
+    Determine the average time taken by a function.
+
+    Parameters:
+        function:  The function to time.
+        sl:  The logger to pass to the function.
+
+    Returns:
+        The average number of milliseconds per call.
+    """
+    start = perf_counter()
+    for _ in range(ITERATIONS):
+        function(sl)
+    return (perf_counter() - start) * 1000 / ITERATIONS
+
+
+with tempfile.TemporaryDirectory() as log_dir:
+    sl = ShellLogger("Auxiliary Information Benchmark", log_dir=Path(log_dir))
+    before = time_per_call(one_round_trip_per_command, sl)
+    batched = time_per_call(uncached, sl)
+    after = time_per_call(ShellLogger.auxiliary_information, sl)
+    log = time_per_call(lambda logger: logger.log("No-op", ":"), sl)
+print(f"One round trip per auxiliary command:   {before:.3f} ms")
+print(f"Batched auxiliary information:          {batched:.3f} ms")
+print(f"Batched, caching invariant information: {after:.3f} ms")
+print(f"Total per-log() overhead for `:`:       {log:.3f} ms")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Measure how long it takes to finalize a deep tree of loggers."""
+
+# © 2023 National Technology & Engineering Solutions of Sandia, LLC
+# (NTESS).  Under the terms of Contract DE-NA0003525 with NTESS, the
+# U.S. Government retains certain rights in this software.
+
+# SPDX-License-Identifier: BSD-3-Clause
+
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from shell_logger import ShellLogger, ShellLoggerDecoder
+
+DEPTH = 8
+LINES = 20000
+COMMAND = f"seq -f 'Line %g of the output of a chatty build step.' {LINES}"
+
+
+def minify(logger: ShellLogger, minify_html: bool) -> None:  # noqa: FBT001
+    """
+    Choose whether to minify the HTML for a whole tree of loggers.
+
+    Parameters:
+        logger:  The top of the tree.
+        minify_html:  Whether or not to minify the HTML.
+    """
+    logger.minify_html = minify_html
+    for log in logger.log_book:
+        if isinstance(log, ShellLogger):
+            minify(log, minify_html)
+
+
+with tempfile.TemporaryDirectory() as log_dir:
+    logger = ShellLogger("Finalize Benchmark", log_dir=Path(log_dir))
+    child = logger
+    for depth in range(DEPTH):
+        child.log(f"Depth {depth}.", COMMAND)
+        child = child.add_child(f"Depth {depth + 1}")
+    logger.finalize()
+    json_file = logger.stream_dir / "Finalize_Benchmark.json"
+    for title, minify_html in [("Indented", False), ("Minified", True)]:
+        with json_file.open() as jf:
+            loaded = json.load(jf, cls=ShellLoggerDecoder)
+        minify(loaded, minify_html)
+        loaded.html_file = loaded.stream_dir / f"{title}.html"
+        shutil.rmtree(logger.stream_dir / "fragments", ignore_errors=True)
+        start = perf_counter()
+        loaded.finalize()
+        seconds = perf_counter() - start
+        print(
+            f"{title}:  {DEPTH} levels of {LINES:,} lines each in "
+            f"{seconds:.2f} s ({loaded.html_file.stat().st_size:,} bytes)"
+        )
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Measure how many lines of output per second are rendered to HTML."""
+
+# © 2023 National Technology & Engineering Solutions of Sandia, LLC
+# (NTESS).  Under the terms of Contract DE-NA0003525 with NTESS, the
+# U.S. Government retains certain rights in this software.
+
+# SPDX-License-Identifier: BSD-3-Clause
+
+from time import perf_counter
+from typing import Iterator, List, Union
+
+from shell_logger.html_utilities import (
+    Nested,
+    flatten,
+    output_batches_html,
+    output_line_html,
+)
+
+LINES = 1_000_000
+INDENT = " " * 4 * 12
+OUTPUT = [
+    f"[{i:>7}/{LINES}] Building CXX object src/CMakeFiles/lib.dir/{i}.cpp.o"
+    if i % 100
+    else f"\x1b[1;31merror:\x1b[0m line {i} <failed> & stopped"
+    for i in range(LINES)
+]
+
+
+def line_by_line(lines: List[str]) -> Iterator[Union[str, Nested]]:
+    """
+    Render each line of output on its own.
+
+    Parameters:
+        lines:  The lines of output.
+
+    Yields:
+        The HTML for the lines, nested within a deep tree of cards.
+    """
+    yield Nested(
+        INDENT,
+        (
+            output_line_html(line, line_no)
+            for line_no, line in enumerate(lines)
+        ),
+    )
+
+
+def batched(lines: List[str]) -> Iterator[Union[str, Nested]]:
+    """
+    Render the lines of output a batch at a time.
+
+    Parameters:
+        lines:  The lines of output.
+
+    Yields:
+        The HTML for the lines, nested within a deep tree of cards.
+    """
+    yield Nested(INDENT, output_batches_html(lines))
+
+
+results = {}
+for title, render in [("Line by line", line_by_line), ("Batched", batched)]:
+    start = perf_counter()
+    results[title] = "".join(flatten(render(OUTPUT)))
+    seconds = perf_counter() - start
+    print(
+        f"{title}:  {LINES:,} lines in {seconds:.2f} s "
+        f"({LINES / seconds:,.0f} lines/s)"
+    )
+assert results["Line by line"] == results["Batched"]
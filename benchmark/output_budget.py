@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Measure rendering huge output to HTML, with and without a budget."""
+
+# © 2023 National Technology & Engineering Solutions of Sandia, LLC
+# (NTESS).  Under the terms of Contract DE-NA0003525 with NTESS, the
+# U.S. Government retains certain rights in this software.
+
+# SPDX-License-Identifier: BSD-3-Clause
+
+import tempfile
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+from typing import Optional, Tuple
+
+from shell_logger.html_utilities import flatten, output_block
+
+LINES = 2_000_000
+BUDGET = (1000, 1000)
+
+
+def render(output_file: Path, budget: Optional[Tuple[int, int]]) -> int:
+    """
+    Render an output file to HTML.
+
+    Parameters:
+        output_file:  The output file.
+        budget:  How many lines at the start and at the end to show.
+
+    Returns:
+        The size of the HTML.
+    """
+    return sum(
+        len(element)
+        for element in flatten(
+            output_block(output_file, "stdout", "0", output_budget=budget)
+        )
+    )
+
+
+with tempfile.TemporaryDirectory() as output_dir:
+    output_file = Path(output_dir) / "stdout"
+    with output_file.open("w") as f:
+        f.writelines(f"test_case_{i} PASSED\n" for i in range(LINES))
+    for title, budget in [("No budget", None), (f"Budget {BUDGET}", BUDGET)]:
+        start = perf_counter()
+        size = render(output_file, budget)
+        seconds = perf_counter() - start
+        tracemalloc.start()
+        render(output_file, budget)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{title}:  {LINES:,} lines to {size:,} bytes of HTML in "
+            f"{seconds:.2f} s (peak memory {peak / 2**20:.1f} MB)"
+        )
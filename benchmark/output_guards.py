@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Measure rendering binary output and very long lines to HTML."""
+
+# © 2023 National Technology & Engineering Solutions of Sandia, LLC
+# (NTESS).  Under the terms of Contract DE-NA0003525 with NTESS, the
+# U.S. Government retains certain rights in this software.
+
+# SPDX-License-Identifier: BSD-3-Clause
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from time import perf_counter
+from typing import Iterator, Union
+
+from shell_logger.html_utilities import (
+    MAX_LINE_WIDTH,
+    Nested,
+    flatten,
+    output_block,
+    output_block_html,
+)
+
+SIZE = 20 * 2**20
+BINARY = os.urandom(SIZE)
+JSON = json.dumps(
+    [
+        {"id": i, "name": f"item {i}", "tags": ["a", "b"]}
+        for i in range(400_000)
+    ]
+).encode()
+
+
+def render(
+    output_file: Path, *, guarded: bool
+) -> Iterator[Union[str, Nested]]:
+    """
+    Render an output file to HTML.
+
+    Parameters:
+        output_file:  The output file.
+        guarded:  Whether or not to summarize binary output and truncate
+            long lines.
+
+    Yields:
+        The HTML for the output block.
+    """
+    if guarded:
+        yield from output_block(
+            output_file, "stdout", "0", max_line_width=MAX_LINE_WIDTH
+        )
+        return
+    with output_file.open(encoding="utf-8", errors="replace") as f:
+        yield from output_block_html(f, "stdout", "0")
+
+
+with tempfile.TemporaryDirectory() as output_dir:
+    for title, output in [("Binary", BINARY), ("Minified JSON", JSON)]:
+        output_file = Path(output_dir) / "stdout"
+        output_file.write_bytes(output)
+        for guarded in [False, True]:
+            start = perf_counter()
+            size = sum(
+                len(element.encode())
+                for element in flatten(render(output_file, guarded=guarded))
+            )
+            seconds = perf_counter() - start
+            print(
+                f"{title} ({'guarded' if guarded else 'as is'}):  "
+                f"{len(output):,} bytes of output to {size:,} bytes of HTML "
+                f"in {seconds:.2f} s"
+            )
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Measure rendering progress bars to HTML, with and without collapsing."""
+
+# © 2023 National Technology & Engineering Solutions of Sandia, LLC
+# (NTESS).  Under the terms of Contract DE-NA0003525 with NTESS, the
+# U.S. Government retains certain rights in this software.
+
+# SPDX-License-Identifier: BSD-3-Clause
+
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from shell_logger.html_utilities import flatten, output_block
+from shell_logger.terminal import ProgressCollapser
+
+DOWNLOADS = 200
+REDRAWS = 500
+STEPS = 20_000
+
+
+def download(i: int) -> str:
+    """
+    Generate the output of a download, redrawing its progress bar.
+
+    Parameters:
+        i:  Which download this is.
+
+    Returns:
+        The output, as ``pip`` or ``wget`` would write it.
+    """
+    bars = (
+        f"\r\x1b[32m{'━' * (40 * j // REDRAWS):<40}\x1b[0m "
+        f"{j * 100 // REDRAWS:>3}% {j * 17 // REDRAWS}.{j % 10} MB"
+        for j in range(REDRAWS + 1)
+    )
+    return f"Downloading package_{i}.whl\n" + "".join(bars) + "\n"
+
+
+OUTPUT = "".join(download(i) for i in range(DOWNLOADS)) + "".join(
+    f"\r\x1b[K[{i}/{STEPS}] Building CXX object src/{i}.cpp.o"
+    for i in range(1, STEPS + 1)
+)
+
+with tempfile.TemporaryDirectory() as output_dir:
+    output_file = Path(output_dir) / "progress_stdout"
+    output_file.write_text(OUTPUT)
+    print(f"Output:  {output_file.stat().st_size:,} bytes")
+    for title, collapser in [
+        ("As is", None),
+        ("Collapsed", ProgressCollapser()),
+    ]:
+        start = perf_counter()
+        html = "".join(
+            flatten(
+                output_block(output_file, "stdout", "0", collapser=collapser)
+            )
+        )
+        seconds = perf_counter() - start
+        print(
+            f"{title}:  {len(html.encode()):,} bytes of HTML in "
+            f"{seconds:.2f} s"
+            + (f" ({collapser.elided:,} bytes elided)" if collapser else "")
+        )
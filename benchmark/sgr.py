@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Measure how quickly colorized output is converted to HTML."""
+
+# © 2023 National Technology & Engineering Solutions of Sandia, LLC
+# (NTESS).  Under the terms of Contract DE-NA0003525 with NTESS, the
+# U.S. Government retains certain rights in this software.
+
+# SPDX-License-Identifier: BSD-3-Clause
+
+from time import perf_counter
+from typing import Callable, List
+
+from shell_logger.html_utilities import (
+    html_encode,
+    sgr_4bit_color_and_style_to_html,
+    sgr_8bit_color_to_html,
+    sgr_24bit_color_to_html,
+)
+
+LINES = 200_000
+COMPILER = [
+    f"\x1b[01m\x1b[Ksrc/module_{i}.cpp:{i}:5:\x1b[m\x1b[K "
+    "\x1b[01;35m\x1b[Kwarning: \x1b[m\x1b[Kunused variable "
+    "'\x1b[01m\x1b[Kcount\x1b[m\x1b[K' [\x1b[01;35m\x1b[K"
+    "-Wunused-variable\x1b[m\x1b[K]"
+    for i in range(LINES)
+]
+PYTEST = [
+    f"test/test_module.py::test_case_{i} "
+    + (
+        "\x1b[32mPASSED\x1b[0m"
+        if i % 10
+        else "\x1b[31m\x1b[1mFAILED\x1b[0m\x1b[31m (assert 1 == 2)\x1b[0m"
+    )
+    + f"\x1b[32m [{i * 100 // LINES:>3}%]\x1b[0m"
+    for i in range(LINES)
+]
+PLAIN = [f"Line {i} of output without any color." for i in range(LINES)]
+RAINBOW = "".join(f"\x1b[38;5;{i % 256}m#" for i in range(20_000)) + "\x1b[0m"
+
+
+def find_and_splice(text: str) -> str:
+    r"""
+    Convert SGR to HTML the way ``sgr_to_html`` used to.
+
+    Note:
+        This never finishes given a CSI sequence other than SGR that
+        isn't followed by an ``m`` somewhere later in the text (e.g.,
+        the ``\x1b[K`` ending each line of GCC's diagnostics), so
+        it isn't run on the compiler output.
+
+    Parameters:
+        text:  The input text.
+
+    Returns:
+        The same text, with the escape codes translated to HTML/CSS.
+    """
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    span_count = 0
+    while text.find("\x1b[") >= 0:
+        start = text.find("\x1b[")
+        finish = text.find("m", start)
+        sgrs = text[start + 2 : finish].split(";")
+        span_string = ""
+        while sgrs:
+            if sgrs[0] == "0":
+                span_string += "</span>" * span_count
+                span_count = 0
+                sgrs = sgrs[1:]
+            elif len(sgrs) >= 5 and sgrs[:2] in [  # noqa: PLR2004
+                ["38", "2"],
+                ["48", "2"],
+            ]:
+                span_count += 1
+                span_string += sgr_24bit_color_to_html(sgrs[:5])
+                sgrs = sgrs[5:]
+            elif len(sgrs) >= 3 and sgrs[:2] in [  # noqa: PLR2004
+                ["38", "5"],
+                ["48", "5"],
+            ]:
+                span_count += 1
+                span_string += sgr_8bit_color_to_html(sgrs[:3])
+                sgrs = sgrs[3:]
+            else:
+                span_count += 1
+                span_string += sgr_4bit_color_and_style_to_html(sgrs[0])
+                sgrs = sgrs[1:]
+        text = text[:start] + span_string + text[finish + 1 :]
+    return text
+
+
+def measure(
+    title: str, lines: List[str], converters: List[Callable[[str], str]]
+) -> None:
+    """
+    Time converting some lines with the given converters.
+
+    Parameters:
+        title:  What the lines are.
+        lines:  The lines to convert.
+        converters:  The functions converting a line to HTML.
+    """
+    for converter in converters:
+        start = perf_counter()
+        for line in lines:
+            converter(line)
+        seconds = perf_counter() - start
+        print(
+            f"{title} ({converter.__name__}):  {len(lines):,} lines in "
+            f"{seconds:.2f} s ({len(lines) / seconds:,.0f} lines/s)"
+        )
+
+
+both = [find_and_splice, html_encode]
+measure("Compiler output", COMPILER, [html_encode])
+measure("Pytest output", PYTEST, both)
+measure("Plain output", PLAIN, both)
+measure("One long rainbow line", [RAINBOW], both)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""Measure the throughput of splitting a command's output between sinks."""
+
+# © 2023 National Technology & Engineering Solutions of Sandia, LLC
+# (NTESS).  Under the terms of Contract DE-NA0003525 with NTESS, the
+# U.S. Government retains certain rights in this software.
+
+# SPDX-License-Identifier: BSD-3-Clause
+
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from shell_logger.shell import Shell
+
+MEGABYTES = 1024
+COMMAND = (
+    f"yes 'A line of output from a chatty test suite.' | head -c {MEGABYTES}M;"
+    f"yes 'A line of error output.' | head -c {MEGABYTES // 4}M 1>&2"
+)
+
+shell = Shell()
+with tempfile.TemporaryDirectory() as stream_dir:
+    for title, kwargs in [
+        ("Stream files only", {}),
+        ("Stream files and strings", {"stdout_str": True, "stderr_str": True}),
+    ]:
+        start = perf_counter()
+        result = shell.run(
+            COMMAND,
+            quiet_stdout=True,
+            quiet_stderr=True,
+            stdout_path=Path(stream_dir) / "stdout",
+            stderr_path=Path(stream_dir) / "stderr",
+            **kwargs,
+        )
+        seconds = perf_counter() - start
+        total = result.stdout_bytes + result.stderr_bytes
+        print(
+            f"{title}:  {result.stdout_bytes:,} bytes of stdout and "
+            f"{result.stderr_bytes:,} bytes of stderr in {seconds:.2f} s "
+            f"({total / seconds / 2**20:.1f} MB/s)"
+        )
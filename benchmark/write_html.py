@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Measure the throughput of writing a deeply nested HTML document."""
+
+# © 2023 National Technology & Engineering Solutions of Sandia, LLC
+# (NTESS).  Under the terms of Contract DE-NA0003525 with NTESS, the
+# U.S. Government retains certain rights in this software.
+
+# SPDX-License-Identifier: BSD-3-Clause
+
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+from typing import Iterator, Union
+
+from shell_logger.html_utilities import Nested, append_html
+
+DEPTH = 2 * sys.getrecursionlimit()
+LINES = 20
+LINE = "<span>A line of output from a chatty build step.</span>\n"
+
+
+def card(depth: int) -> Iterator[Union[str, Nested]]:
+    """
+    Generate a card nested within ``depth`` others.
+
+    Parameters:
+        depth:  How many cards to nest within this one.
+
+    Yields:
+        The card's header, its (nested) contents, and its footer.
+    """
+    yield f'<div class="card" id="depth-{depth}">\n'
+    yield Nested("  ", [LINE] * LINES + ([card(depth - 1)] if depth else []))
+    yield "</div>\n"
+
+
+with tempfile.TemporaryDirectory() as html_dir:
+    html_file = Path(html_dir) / "write_html.html"
+    for buffer_size in [2**13, 2**16, 2**20, 2**23]:
+        html_file.unlink(missing_ok=True)
+        start = perf_counter()
+        append_html(card(DEPTH), output=html_file, buffer_size=buffer_size)
+        seconds = perf_counter() - start
+        size = html_file.stat().st_size
+        print(
+            f"{buffer_size:>9,} byte buffer:  {DEPTH:,} levels of {LINES} "
+            f"lines each ({size:,} bytes) in {seconds:.2f} s "
+            f"({size / seconds / 2**20:.1f} MB/s)"
+        )
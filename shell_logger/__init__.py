@@ -6,7 +6,13 @@
 
 # SPDX-License-Identifier: BSD-3-Clause
 
+from .scheduler import CommandScheduler
 from .shell_logger import ShellLogger, ShellLoggerDecoder, ShellLoggerEncoder
 
-__all__ = ["ShellLogger", "ShellLoggerDecoder", "ShellLoggerEncoder"]
+__all__ = [
+    "CommandScheduler",
+    "ShellLogger",
+    "ShellLoggerDecoder",
+    "ShellLoggerEncoder",
+]
 __version__ = "1.0.4"
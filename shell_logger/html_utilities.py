@@ -6,14 +6,126 @@
 
 # SPDX-License-Identifier: BSD-3-Clause
 
+import codecs
+import functools
+import hashlib
+import io
+import itertools
+import os
 import pkgutil
 import re
+import string
 import textwrap
+from collections import deque
 from collections.abc import Iterable, Mapping
 from datetime import datetime
 from pathlib import Path
 from types import SimpleNamespace
-from typing import Iterator, List, TextIO, Tuple, Union
+from typing import (
+    Callable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+)
+from urllib.parse import quote
+
+from .terminal import ProgressCollapser
+
+
+class Nested(NamedTuple):
+    """
+    HTML elements nested within another element.
+
+    Rather than indenting the HTML of its contents itself, an element
+    yields them wrapped in a :class:`Nested`, and :func:`flatten`
+    indents each line once, by the combined indentation of all the
+    elements it's nested within.
+
+    Attributes:
+        indent (str):  The indentation of the contents relative to the
+            enclosing element.
+        content (Iterable):  The HTML elements nested within.
+    """
+
+    indent: str
+    content: Iterable
+
+
+class Lines(str):
+    """
+    HTML whose lines all have content, separated by plain newlines alone.
+
+    Such HTML can be indented by :func:`flatten` with a single
+    :meth:`str.replace`, rather than line by line.
+    """
+
+
+DEFAULT_BUFFER_SIZE = 1 << 20
+"""The default size (in bytes) of the buffer used to write HTML files."""
+
+OUTPUT_LINES_PER_BATCH = 4096
+"""The number of lines of output rendered to HTML at a time."""
+
+ESCAPE_SEQUENCE = re.compile(
+    "\x1b(?:"
+    "\\[(?:(?P<params>[0-9:;]*)|[0-?]*)[ -/]*(?P<final>[@-~])"  # CSI
+    "|\\][^\x07\x1b]*(?:\x07|\x1b\\\\)?"  # OSC
+    "|[ -/]*[0-~]"  # Any other escape sequence
+    ")?"
+)
+"""Matches an escape sequence, along with a lone escape character.  The
+parameters of CSI sequences are captured, unless they're private (e.g.,
+``?25`` in ``\\x1b[?25l``), as is their final character."""
+
+LINE_BREAKS = "\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+"""The line breaks, other than plain newlines, that
+:meth:`str.splitlines` splits on."""
+
+MAX_LINE_WIDTH = 10_000
+"""The default number of characters of a line of output shown before the
+rest is hidden, to be expanded on demand."""
+
+BINARY_SAMPLE_SIZE = 8192
+"""The number of bytes at the start of an output file checked to see
+whether it's binary."""
+
+BINARY_NUL_RATIO = 0.01
+"""The fraction of NUL bytes beyond which output is considered binary."""
+
+BINARY_INVALID_RATIO = 0.1
+"""The fraction of invalid UTF-8 beyond which output is considered
+binary."""
+
+HEXDUMP_SIZE = 256
+"""The number of bytes of binary output shown as a hex dump."""
+
+STYLES = [
+    "bootstrap.min.css",
+    "Chart.min.css",
+    "top_level_style_adjustments.css",
+    "parent_logger_style.css",
+    "child_logger_style.css",
+    "command_style.css",
+    "message_style.css",
+    "detail_list_style.css",
+    "code_block_style.css",
+    "output_style.css",
+    "diagnostics_style.css",
+    "search_controls.css",
+]
+"""The style files included in the HTML header, in order."""
+
+SCRIPTS = [
+    "jquery.slim.min.js",
+    "bootstrap.bundle.min.js",
+    "Chart.bundle.min.js",
+    "search_output.js",
+]
+"""The script files included in the HTML header, in order."""
 
 
 def nested_simplenamespace_to_dict(
@@ -64,15 +176,19 @@ def get_human_time(milliseconds: float) -> str:
     return datetime.fromtimestamp(seconds).strftime("%Y-%m-%d %H:%M:%S.%f")
 
 
-def opening_html_text() -> str:
+def opening_html_text(asset_url: Optional[str] = None) -> str:
     """
     Get the opening HTML text.
 
+    Parameters:
+        asset_url:  The URL of the directory of shared assets, if any
+            (see :func:`html_header`).
+
     Returns:
         A string containing the first line of the HTML document through
         ``</head>``.
     """
-    return "<!DOCTYPE html><html>" + html_header()
+    return "<!DOCTYPE html><html>" + html_header(asset_url)
 
 
 def closing_html_text() -> str:
@@ -85,38 +201,41 @@ def closing_html_text() -> str:
     return "</html>"
 
 
-def append_html(*args: Union[str, Iterator[str]], output: Path) -> None:
+def append_html(
+    *args: Union[str, Iterator[str]],
+    output: Path,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+) -> None:
     """
     Append whatever is given to the ``output`` HTML file.
 
     Parameters:
         *args:  The argument(s) to write.
         output:  The HTML file to append to.
+        buffer_size:  The size (in bytes) of the write buffer.
     """
+    with output.open("a", buffering=buffer_size) as output_file:
+        write_html(*args, output=output_file)
 
-    def _append_html(
-        f: TextIO, *inner_args: Union[str, bytes, Iterable]
-    ) -> None:
-        """
-        Write some text to the given HTML log file.
-
-        Parameters:
-            f:  The HTML file to write to.
-            *inner_args:  The argument(s) to write.
-        """
-        for arg in inner_args:
-            if isinstance(arg, str):
-                f.write(arg)
-            elif isinstance(arg, bytes):
-                f.write(arg.decode())
-            elif isinstance(arg, Iterable):
-                _append_html(f, *arg)
-            else:
-                message = f"Unsupported type: {type(arg)}"
-                raise TypeError(message)
 
-    with output.open("a") as output_file:
-        _append_html(output_file, *args)
+def write_html(*args: Union[str, Iterator[str]], output: TextIO) -> None:
+    """
+    Write whatever is given to an open HTML file.
+
+    Parameters:
+        *args:  The argument(s) to write.
+        output:  The HTML file to write to.
+
+    Raises:
+        TypeError:  If anything other than strings, bytes, or (nested)
+            iterables thereof is given.
+    """
+    write = output.write
+    for element in flatten(args):
+        if not isinstance(element, str):
+            message = f"Unsupported type: {type(element)}"
+            raise TypeError(message)
+        write(element)
 
 
 def fixed_width(text: str) -> str:
@@ -135,30 +254,71 @@ def fixed_width(text: str) -> str:
     return f"<pre><code>{html_encode(text)}</code></pre>"
 
 
-def flatten(element: Union[str, bytes, Iterable]) -> Iterator[str]:
+def flatten(
+    element: Union[str, bytes, Iterable], indent: str = ""
+) -> Iterator[str]:
     """
     Turn a tree of lists into a flat iterable of strings.
 
+    The tree is walked with an explicit stack, rather than recursively,
+    so arbitrarily deep trees (e.g., of nested loggers) neither run into
+    the recursion limit nor pass each string up through every level.
+
     Parameters:
         element:  An element of a tree.
+        indent:  The indentation of the element.  The contents of any
+            :class:`Nested` elements are indented further.
 
     Yields:
-        The string representation of the given element.
-    """
-    if isinstance(element, str):
-        yield element
-    elif isinstance(element, bytes):
-        yield element.decode()
-    elif isinstance(element, Iterable):
-        for _element in element:
-            yield from flatten(_element)
-    else:
-        yield element
+        The string representation of the given element, with each line
+        indented.
+    """
+    stack = [(iter((element,)), indent)]
+    while stack:
+        elements, indent = stack[-1]
+        for _element in elements:
+            if isinstance(_element, bytes):
+                _element = _element.decode()
+            if isinstance(_element, Lines):
+                yield indent_lines(_element, indent) if indent else _element
+            elif isinstance(_element, str):
+                yield textwrap.indent(_element, indent) if indent else _element
+            elif isinstance(_element, Nested):
+                stack.append(
+                    (iter(_element.content), indent + _element.indent)
+                )
+                break
+            elif isinstance(_element, Iterable):
+                stack.append((iter(_element), indent))
+                break
+            else:
+                yield _element
+        else:
+            stack.pop()
+
+
+def indent_lines(lines: Lines, indent: str) -> str:
+    """
+    Indent each line of some HTML.
+
+    This is equivalent to :func:`textwrap.indent`, given HTML with no
+    blank lines, and no line breaks other than plain newlines.
+
+    Parameters:
+        lines:  The HTML to indent.
+        indent:  The indentation to add to each line.
+
+    Returns:
+        The indented HTML.
+    """
+    if lines.endswith("\n"):
+        return indent + lines[:-1].replace("\n", "\n" + indent) + "\n"
+    return indent + lines.replace("\n", "\n" + indent)
 
 
 def parent_logger_card_html(
-    name: str, *args: List[Iterator[str]]
-) -> Iterator[str]:
+    name: str, *args: List[Iterator[str]], minify: bool = False
+) -> Iterator[Union[str, Nested]]:
     """
     Generate the HTML for a parent logger card.
 
@@ -171,20 +331,92 @@ def parent_logger_card_html(
         name:  The name of the :class:`ShellLogger`.
         *args:  A list of generators to lazily yield string HTML
             elements for the contents of the parent card.
+        minify:  Whether or not to leave out cosmetic whitespace.
 
     Yields:
         The header, followed by all the contents of the
         :class:`ShellLogger`, and then the footer.
     """
-    header, indent, footer = split_template(
-        parent_logger_template, "parent_body", name=name
-    )
+    header, indent, footer = parent_logger_card_parts(name, minify=minify)
     yield header
-    for arg in flatten(args):
-        yield textwrap.indent(arg, indent)
+    yield Nested(indent, args)
     yield footer
 
 
+def parent_logger_card_parts(
+    name: str, *, minify: bool = False
+) -> Tuple[str, str, str]:
+    """
+    Get the pieces of a parent logger card.
+
+    This is for writing the card a piece at a time, as the
+    :class:`ShellLogger` runs, rather than via
+    :func:`parent_logger_card_html` once it's done.
+
+    Parameters:
+        name:  The name of the :class:`ShellLogger`.
+        minify:  Whether or not to leave out cosmetic whitespace.
+
+    Returns:
+        The header, the indent for the contents of the card, and the
+        footer.
+    """
+    return split_template(
+        parent_logger_template, "parent_body", minify=minify, name=name
+    )
+
+
+def child_logger_card_parts(
+    name: str, duration: str, *, minify: bool = False
+) -> Tuple[str, str, str]:
+    """
+    Get the pieces of a child logger card.
+
+    This is for writing the card a piece at a time, as the child
+    :class:`ShellLogger` runs, rather than via
+    :func:`child_logger_card_html` once it's done.
+
+    Parameters:
+        name:  The name of the child :class:`ShellLogger`.
+        duration:  The duration of the child :class:`ShellLogger`.
+        minify:  Whether or not to leave out cosmetic whitespace.
+
+    Returns:
+        The header, the indent for the contents of the card, and the
+        footer.
+    """
+    return split_template(
+        child_logger_template,
+        "child_body",
+        minify=minify,
+        name=name,
+        duration=duration,
+    )
+
+
+def child_logger_duration_update(duration: str) -> str:
+    """
+    Generate the HTML to fill in a child logger card's duration.
+
+    When a child logger card is written before the child is done, its
+    duration isn't known yet, so this is written at the end of the
+    card's contents to fill it in.
+
+    Parameters:
+        duration:  The duration of the child :class:`ShellLogger`.
+
+    Returns:
+        A ``<script>`` updating the duration in the card's header.
+    """
+    return (
+        "<script>\n"
+        'document.currentScript.closest("details")'
+        '.querySelector(".duration")'
+        f'.textContent = " (Duration: {duration})";\n'
+        "</script>\n"
+    )
+
+
 def child_logger_card(log) -> Iterator[str]:
     """
     Generate a child logger card.
@@ -196,9 +428,11 @@ def child_logger_card(log) -> Iterator[str]:
         log (ShellLogger):  The child :class:`ShellLogger` for which to
             generate the card.
 
-    Returns:
-        A generator that will lazily yield the elements of the HTML for
-        the card one at a time.
+    Yields:
+        The HTML for the card.  The child's entries aren't converted to
+        HTML until this is first iterated (e.g., by :func:`flatten`), so
+        converting a deep tree of loggers doesn't recurse through every
+        level at once.
 
     Todo:
         * The type hinting for ``log`` is done in the docstring instead
@@ -208,12 +442,17 @@ def child_logger_card(log) -> Iterator[str]:
           such that there's no longer a dependency on ``ShellLogger``.
     """
     child_html = log.to_html()
-    return child_logger_card_html(log.name, log.duration, *child_html)
+    yield child_logger_card_html(
+        log.name, log.duration, *child_html, minify=log.minify_html
+    )
 
 
 def child_logger_card_html(
-    name: str, duration: str, *args: Union[Iterator[str], List[Iterator[str]]]
-) -> Iterator[str]:
+    name: str,
+    duration: str,
+    *args: Union[Iterator[str], List[Iterator[str]]],
+    minify: bool = False,
+) -> Iterator[Union[str, Nested]]:
     """
     Generate the HTML for a child logger card.
 
@@ -227,31 +466,23 @@ def child_logger_card_html(
         duration:  The duration of the child :class:`ShellLogger`.
         *args:  A generator (or list of generators) to lazily yield
             string HTML elements for the contents of the child card.
+        minify:  Whether or not to leave out cosmetic whitespace.
 
     Yields:
         The header, followed by all the contents of the child
         :class:`ShellLogger`, and then the footer.
-
-    Todo:
-      * Should we replace the ``for`` loop with the one found in
-        :func:`parent_logger_card_html`?
     """
-    header, indent, footer = split_template(
-        child_logger_template, "child_body", name=name, duration=duration
+    header, indent, footer = child_logger_card_parts(
+        name, duration, minify=minify
     )
     yield header
-    for arg in args:
-        if isinstance(arg, str):
-            yield textwrap.indent(arg, indent)
-        elif isinstance(arg, Iterable):
-            for _arg in arg:
-                yield textwrap.indent(_arg, indent)
+    yield Nested(indent, args)
     yield footer
 
 
 def command_card_html(
-    log: dict, *args: Iterator[Union[str, Iterable]]
-) -> Iterator[str]:
+    log: dict, *args: Iterator[Union[str, Iterable]], minify: bool = False
+) -> Iterator[Union[str, Nested]]:
     """
     Generate the HTML for a command card.
 
@@ -264,6 +495,7 @@ def command_card_html(
             corresponding to a command that was run.
         *args:  A generator that will yield all the elements to be
             included in the command card one at a time.
+        minify:  Whether or not to leave out cosmetic whitespace.
 
     Yields:
         The header, followed by all the contents of the command card,
@@ -272,6 +504,7 @@ def command_card_html(
     header, indent, footer = split_template(
         command_template,
         "more_info",
+        minify=minify,
         cmd_id=log["cmd_id"],
         command=fixed_width(log["cmd"]),
         message=log["msg"],
@@ -279,16 +512,13 @@ def command_card_html(
         duration=log["duration"],
     )
     yield header
-    for arg in args:
-        if isinstance(arg, str):
-            yield textwrap.indent(arg, indent)
-        elif isinstance(arg, Iterable):
-            for _arg in arg:
-                yield textwrap.indent(_arg, indent)
+    yield Nested(indent, args)
     yield footer
 
 
-def html_message_card(log: dict) -> Iterator[str]:
+def html_message_card(
+    log: dict, *, minify: bool = False
+) -> Iterator[Union[str, Nested]]:
     """
     Generate the HTML for a message card.
 
@@ -299,6 +529,7 @@ def html_message_card(log: dict) -> Iterator[str]:
     Parameters:
         log:  An entry from the :class:`ShellLogger` 's log book
             corresponding to a message.
+        minify:  Whether or not to leave out cosmetic whitespace.
 
     Yields:
         The header, followed by the contents of the message card, and
@@ -314,17 +545,91 @@ def html_message_card(log: dict) -> Iterator[str]:
     header, indent, footer = split_template(
         html_message_template,
         "message",
+        minify=minify,
         title=log["msg_title"],
         timestamp=timestamp,
     )
     text = html_encode(log["msg"])
     text = "<pre>" + text.replace("\n", "<br>") + "</pre>"
     yield header
-    yield textwrap.indent(text, indent) + "\n"
+    yield Nested(indent, [text, "" if minify else "\n"])
     yield footer
 
 
-def message_card(log: dict) -> Iterator[str]:
+def schedule_card(
+    log: dict, *, minify: bool = False
+) -> Iterator[Union[str, Nested]]:
+    """
+    Generate the HTML for a schedule card.
+
+    Generate the HTML for a card summarizing a graph of commands run by
+    a :class:`CommandScheduler`:  when each command started and
+    finished relative to the start of the graph, and which commands
+    were on the critical path.
+
+    Parameters:
+        log:  An entry from the :class:`ShellLogger` 's log book
+            corresponding to a schedule.
+        minify:  Whether or not to leave out cosmetic whitespace.
+
+    Yields:
+        The header, followed by the contents of the schedule card, and
+        then the footer.
+    """
+    schedule = log["schedule"]
+    timestamp = re.sub(r"[ :/.]", "-", log["timestamp"])
+    header, indent, footer = split_template(
+        html_message_template,
+        "message",
+        minify=minify,
+        title="Schedule",
+        timestamp=timestamp,
+    )
+    critical_path = schedule["critical_path"]
+
+    def seconds(milliseconds: Optional[int]) -> str:
+        return "" if milliseconds is None else f"{milliseconds / 1000:.2f}s"
+
+    rows = []
+    for node in schedule["nodes"]:
+        started = node["start"] is not None
+        row_class = (
+            ' class="table-warning"' if node["name"] in critical_path else ""
+        )
+        cells = [
+            node["name"],
+            ", ".join(node["after"]),
+            node["status"],
+            seconds(node["start"] - schedule["start"] if started else None),
+            seconds(node["finish"] - schedule["start"] if started else None),
+            seconds(node["finish"] - node["start"] if started else None),
+        ]
+        rows.append(
+            f"<tr{row_class}>"
+            + "".join(f"<td>{html_encode(str(cell))}</td>" for cell in cells)
+            + "</tr>"
+        )
+    text = (
+        f"<p>{html_encode(log['msg'])}  Wall time:  "
+        f"{seconds(schedule['finish'] - schedule['start'])}.  Critical path "
+        f"({seconds(schedule['critical_path_duration'])}):  "
+        f"{html_encode(' → '.join(critical_path))}</p>\n"
+        '<table class="table table-sm">\n'
+        "<tr><th>Command</th><th>After</th><th>Status</th><th>Start</th>"
+        "<th>Finish</th><th>Duration</th></tr>\n"
+        + "\n".join(rows)
+        + "\n</table>"
+    )
+    if minify:
+        text = text.replace("\n", "")
+    yield header
+    yield Nested(indent, [text, "" if minify else "\n"])
+    yield footer
+
+
+def message_card(
+    log: dict, *, minify: bool = False
+) -> Iterator[Union[str, Nested]]:
     """
     Generate a message card.
 
@@ -334,20 +639,25 @@ def message_card(log: dict) -> Iterator[str]:
     Parameters:
         log:  An entry from the :class:`ShellLogger` 's log book
             corresponding to a message.
+        minify:  Whether or not to leave out cosmetic whitespace.
 
     Yields:
         The header, followed by the contents of the message card, and
         then the footer.
     """
-    header, indent, footer = split_template(message_template, "message")
+    header, indent, footer = split_template(
+        message_template, "message", minify=minify
+    )
     text = html_encode(log["msg"])
     text = "<pre>" + text.replace("\n", "<br>") + "</pre>"
     yield header
-    yield textwrap.indent(text, indent) + "\n"
+    yield Nested(indent, [text, "" if minify else "\n"])
     yield footer
 
 
-def command_detail_list(cmd_id: str, *args: Iterator[str]) -> Iterator[str]:
+def command_detail_list(
+    cmd_id: str, *args: Iterator[str], minify: bool = False
+) -> Iterator[Union[str, Nested]]:
     """
     Generate the list of command details.
 
@@ -359,23 +669,27 @@ def command_detail_list(cmd_id: str, *args: Iterator[str]) -> Iterator[str]:
             was run.
         *args:  All of the details associated with a command that was
             run.
+        minify:  Whether or not to leave out cosmetic whitespace.
 
     Yields:
         The header, followed by each of the details associated with the
         command that was run, and then the footer.
     """
     header, indent, footer = split_template(
-        command_detail_list_template, "details", cmd_id=cmd_id
+        command_detail_list_template, "details", minify=minify, cmd_id=cmd_id
     )
     yield header
-    for arg in args:
-        if isinstance(arg, str):
-            yield textwrap.indent(arg, indent)
+    yield Nested(indent, [arg for arg in args if isinstance(arg, str)])
     yield footer
 
 
 def command_detail(
-    cmd_id: str, name: str, value: str, *, hidden: bool = False
+    cmd_id: str,
+    name: str,
+    value: str,
+    *,
+    hidden: bool = False,
+    minify: bool = False,
 ) -> str:
     """
     Generate the HTML for a command detail.
@@ -390,18 +704,30 @@ def command_detail(
         value:  The value of the detail being recorded.
         hidden:  Whether or not this detail should be hidden (collapsed)
             in the HTML by default.
+        minify:  Whether or not to leave out cosmetic whitespace.
 
     Returns:
         The HTML snippet for this command detail.
     """
-    if hidden:
-        return hidden_command_detail_template.format(
-            cmd_id=cmd_id, name=name, value=value
-        )
-    return command_detail_template.format(name=name, value=value)
+    template = (
+        hidden_command_detail_template if hidden else command_detail_template
+    )
+    return compile_template(template, minify=minify)(
+        cmd_id=cmd_id, name=name, value=value
+    )
 
 
-def command_card(log: dict, stream_dir: Path) -> Iterator[str]:
+def command_card(  # noqa: PLR0913
+    log: dict,
+    stream_dir: Path,
+    aux_store: Optional[Mapping] = None,
+    *,
+    minify: bool = False,
+    collapse_progress: bool = False,
+    max_line_width: Optional[int] = None,
+    html_dir: Optional[Path] = None,
+    output_budget: Optional[Tuple[int, int]] = None,
+) -> Iterator[Union[str, Nested]]:
     """
     Generate a command card.
 
@@ -414,6 +740,24 @@ def command_card(log: dict, stream_dir: Path) -> Iterator[str]:
             corresponding to a command that was run.
         stream_dir:  The stream directory containing the ``stdout``,
             ``stderr``, and ``trace`` output from the command.
+        aux_store:  The mapping from content hashes to the environment
+            and ``ulimit`` text referred to by the ``log`` entry.
+        minify:  Whether or not to leave out cosmetic whitespace.
+        collapse_progress:  Whether or not to collapse the ``stdout``
+            and ``stderr`` redrawn in place (e.g., by progress bars) to
+            their final state.  How many bytes were left out of each is
+            recorded in the ``log`` entry's ``elided_bytes`` once
+            they've been rendered.
+        max_line_width:  The number of characters of each line of the
+            ``stdout``, ``stderr``, and ``trace`` shown before the rest
+            is hidden, if any.
+        html_dir:  The directory the HTML log file is opened from
+            (e.g., the one with a symlink to it), which links to the
+            output files are relative to.  Defaults to the
+            ``stream_dir``.
+        output_budget:  How many lines at the start and at the end of
+            the ``stdout`` and ``stderr`` to show, if not all of them,
+            unless the ``log`` entry has its own ``output_budget``.
 
     Returns:
         A generator to lazily yield the elements of the command card one
@@ -425,30 +769,77 @@ def command_card(log: dict, stream_dir: Path) -> Iterator[str]:
     trace_path = stream_dir / f"{log['timestamp']}_{cmd_id}_trace"
 
     # Collect all the details associated with the command that was run.
+    details = [
+        ("Time", log["timestamp"], False),
+        ("Command", fixed_width(log["cmd"]), False),
+        ("CWD", log["pwd"], True),
+        ("Hostname", log["hostname"], True),
+        ("User", log["user"], True),
+        ("Group", log["group"], True),
+        ("Shell", log["shell"], True),
+        ("umask", log["umask"], True),
+        ("Return Code", log["return_code"], False),
+    ]
     info = [
         command_detail_list(
             cmd_id,
-            command_detail(cmd_id, "Time", log["timestamp"]),
-            command_detail(cmd_id, "Command", fixed_width(log["cmd"])),
-            command_detail(cmd_id, "CWD", log["pwd"], hidden=True),
-            command_detail(cmd_id, "Hostname", log["hostname"], hidden=True),
-            command_detail(cmd_id, "User", log["user"], hidden=True),
-            command_detail(cmd_id, "Group", log["group"], hidden=True),
-            command_detail(cmd_id, "Shell", log["shell"], hidden=True),
-            command_detail(cmd_id, "umask", log["umask"], hidden=True),
-            command_detail(cmd_id, "Return Code", log["return_code"]),
+            *[
+                command_detail(
+                    cmd_id, name, value, hidden=hidden, minify=minify
+                )
+                for name, value, hidden in details
+            ],
+            minify=minify,
         ),
-        output_block_card("stdout", stdout_path, cmd_id, collapsed=False),
-        output_block_card("stderr", stderr_path, cmd_id, collapsed=False),
     ]
+    collapsers = {
+        name: ProgressCollapser() if collapse_progress else None
+        for name in ["stdout", "stderr"]
+    }
+    output_budget = log.get("output_budget", output_budget)
+    for name, path in [("stdout", stdout_path), ("stderr", stderr_path)]:
+        info.append(
+            output_block_card(
+                name,
+                path,
+                cmd_id,
+                collapsed=False,
+                minify=minify,
+                collapser=collapsers[name],
+                max_line_width=max_line_width,
+                html_dir=html_dir,
+                output_budget=output_budget,
+            )
+        )
+    if collapse_progress:
+        info.append(record_elided_bytes(log, collapsers))
 
     # Compile the additional diagnostic information.
-    diagnostics = [
-        output_block_card("Environment", log["environment"], cmd_id),
-        output_block_card("ulimit", log["ulimit"], cmd_id),
-    ]
+    ulimit = aux_text(log, "ulimit", aux_store)
+    diagnostics = [environment_card(log, aux_store, minify=minify)]
+    if log.get("environment_diff"):
+        diagnostics.append(
+            output_block_card(
+                "Environment Changes",
+                log["environment_diff"],
+                cmd_id,
+                minify=minify,
+            )
+        )
+    diagnostics.append(
+        output_block_card("ulimit", ulimit, cmd_id, minify=minify)
+    )
     if trace_path.exists():
-        diagnostics.append(output_block_card("trace", trace_path, cmd_id))
+        diagnostics.append(
+            output_block_card(
+                "trace",
+                trace_path,
+                cmd_id,
+                minify=minify,
+                max_line_width=max_line_width,
+                html_dir=html_dir,
+            )
+        )
 
     # Add in any available statistics (from `StatsCollector`s).
     if log.get("stats"):
@@ -456,7 +847,9 @@ def command_card(log: dict, stream_dir: Path) -> Iterator[str]:
         for stat, stat_title in stats:
             if log["stats"].get(stat):
                 data = log["stats"][stat]
-                diagnostics.append(time_series_plot(cmd_id, data, stat_title))
+                diagnostics.append(
+                    time_series_plot(cmd_id, data, stat_title, minify=minify)
+                )
         if log["stats"].get("disk"):
             uninteresting_disks = [
                 "/var",
@@ -474,13 +867,97 @@ def command_card(log: dict, stream_dir: Path) -> Iterator[str]:
             # We sort because JSON deserialization may change
             # the ordering of the map.
             for disk, data in sorted(disk_stats.items()):
-                diagnostics.append(disk_time_series_plot(cmd_id, data, disk))
-    info.append(diagnostics_card(cmd_id, *diagnostics))
-    return command_card_html(log, *info)
+                diagnostics.append(
+                    disk_time_series_plot(cmd_id, data, disk, minify=minify)
+                )
+    info.append(diagnostics_card(cmd_id, *diagnostics, minify=minify))
+    return command_card_html(log, *info, minify=minify)
+
+
+def record_elided_bytes(
+    log: dict, collapsers: Mapping[str, ProgressCollapser]
+) -> Iterator[str]:
+    """
+    Record how much output was left out of a command card.
+
+    This is included in the card after the output blocks, such that
+    it's run once they've been rendered.
+
+    Parameters:
+        log:  An entry from the :class:`ShellLogger` 's log book
+            corresponding to a command that was run.
+        collapsers:  The :class:`ProgressCollapser` used for each output
+            block, keyed by its name.
+
+    Yields:
+        Nothing; the number of bytes left out of each output block is
+        saved in the ``log`` entry's ``elided_bytes``.
+    """
+    log["elided_bytes"] = {
+        name: collapser.elided for name, collapser in collapsers.items()
+    }
+    yield from ()
+
+
+def environment_card(
+    log: dict, aux_store: Optional[Mapping], *, minify: bool = False
+) -> Union[str, Iterator[Union[str, Nested]]]:
+    """
+    Generate the environment card for a command.
+
+    Parameters:
+        log:  An entry from the :class:`ShellLogger` 's log book
+            corresponding to a command that was run.
+        aux_store:  The mapping from content hashes to auxiliary text.
+        minify:  Whether or not to leave out cosmetic whitespace.
+
+    Returns:
+        The card showing the environment, unless the ``log`` entry
+        refers to an earlier command with the same environment, in
+        which case it's a note linking to that command's card instead.
+        Clicking the link expands the card, and everything it's
+        collapsed inside.
+    """
+    ref = log.get("environment_ref")
+    if not ref:
+        environment = aux_text(log, "environment", aux_store)
+        return output_block_card(
+            "Environment", environment, log["cmd_id"], minify=minify
+        )
+    return output_note(
+        f'The environment is the same as <a href="#{ref}-environment" '
+        "onclick=\"$(this.hash).parents('.collapse').addBack()"
+        ".collapse('show')\">that of an earlier command</a>.",
+        minify=minify,
+    )
+
+
+def aux_text(log: dict, key: str, aux_store: Optional[Mapping]) -> str:
+    """
+    Get a piece of auxiliary text associated with a command.
+
+    Parameters:
+        log:  An entry from the :class:`ShellLogger` 's log book
+            corresponding to a command that was run.
+        key:  The auxiliary information to get (e.g., ``environment``).
+        aux_store:  The mapping from content hashes to auxiliary text.
+
+    Returns:
+        The text, either stored inline in the ``log`` entry (as is the
+        case for older logs), or looked up by its hash in the
+        ``aux_store``.
+    """
+    if log.get(key) is not None:
+        return log[key]
+    return (aux_store or {}).get(log.get(f"{key}_hash"), "")
 
 
 def time_series_plot(
-    cmd_id: str, data_tuples: List[Tuple[float, float]], series_title: str
+    cmd_id: str,
+    data_tuples: List[Tuple[float, float]],
+    series_title: str,
+    *,
+    minify: bool = False,
 ) -> Iterator[str]:
     """
     Create the HTML for a plot of time series data.
@@ -490,6 +967,7 @@ def time_series_plot(
             was run.
         data_tuples:  A list of :math:`x` and :math:`y` locations.
         series_title:  The title of the plot.
+        minify:  Whether or not to leave out cosmetic whitespace.
 
     Returns:
         A HTML snippet for a plot of the given data.
@@ -497,11 +975,17 @@ def time_series_plot(
     labels = [get_human_time(x) for x, _ in data_tuples]
     values = [y for _, y in data_tuples]
     identifier = f"{cmd_id}-{series_title.lower().replace(' ', '-')}-chart"
-    return stat_chart_card(labels, values, series_title, identifier)
+    return stat_chart_card(
+        labels, values, series_title, identifier, minify=minify
+    )
 
 
 def disk_time_series_plot(
-    cmd_id: str, data_tuples: Tuple[float, float], volume_name: str
+    cmd_id: str,
+    data_tuples: Tuple[float, float],
+    volume_name: str,
+    *,
+    minify: bool = False,
 ) -> Iterator[str]:
     """
     Generate a time series plot of disk usage.
@@ -515,6 +999,7 @@ def disk_time_series_plot(
         data_tuples:  A list of :math:`x` and :math:`y` locations.
         volume_name:  The name of the disk volume who's data is being
             plotted.
+        minify:  Whether or not to leave out cosmetic whitespace.
 
     Returns:
         A HTML snippet for a plot of the given data.
@@ -526,11 +1011,18 @@ def disk_time_series_plot(
     values = [y for _, y in data_tuples]
     identifier = f"{cmd_id}-volume{volume_name.replace('/', '_')}-usage"
     stat_title = f"Used Space on {volume_name}"
-    return stat_chart_card(labels, values, stat_title, identifier)
+    return stat_chart_card(
+        labels, values, stat_title, identifier, minify=minify
+    )
 
 
 def stat_chart_card(
-    labels: List[str], data: List[float], title: str, identifier: str
+    labels: List[str],
+    data: List[float],
+    title: str,
+    identifier: str,
+    *,
+    minify: bool = False,
 ) -> Iterator[str]:
     """
     Create the HTML for a two-dimensional plot.
@@ -540,22 +1032,28 @@ def stat_chart_card(
         data:  The :math:`y` values.
         title:  The title for the plot.
         identifier:  A unique identifier for the chart.
+        minify:  Whether or not to leave out cosmetic whitespace.
 
     Yields:
         A HTML snippet for the chart with all the details filled in.
     """
-    yield stat_chart_template.format(
+    yield compile_template(stat_chart_template, minify=minify)(
         labels=labels, data=data, title=title, id=identifier
     )
 
 
-def output_block_card(
+def output_block_card(  # noqa: PLR0913
     title: str,
     output: Union[Path, str],
     cmd_id: str,
     *,
     collapsed: bool = True,
-) -> Iterator[str]:
+    minify: bool = False,
+    collapser: Optional[ProgressCollapser] = None,
+    max_line_width: Optional[int] = None,
+    html_dir: Optional[Path] = None,
+    output_budget: Optional[Tuple[int, int]] = None,
+) -> Iterator[Union[str, Nested]]:
     """
     Generate an output block card.
 
@@ -569,6 +1067,16 @@ def output_block_card(
             was run.
         collapsed:  Whether or not the output block should be collapsed
             by default in the HTML log file.
+        minify:  Whether or not to leave out cosmetic whitespace.
+        collapser:  If given, output redrawn in place (e.g., progress
+            bars) is collapsed to its final state with it.
+        max_line_width:  The number of characters of each line shown
+            before the rest is hidden, if any.
+        html_dir:  The directory the HTML log file is opened from
+            (e.g., the one with a symlink to it), which links to the
+            ``output`` file are relative to.
+        output_budget:  How many lines at the start and at the end of
+            the ``output`` file to show, if not all of them.
 
     Yields:
         The header, followed by each line of the output, and then the
@@ -579,42 +1087,190 @@ def output_block_card(
         output_card_collapsed_template if collapsed else output_card_template
     )
     header, indent, footer = split_template(
-        template, "output_block", name=name, title=title, cmd_id=cmd_id
+        template,
+        "output_block",
+        minify=minify,
+        name=name,
+        title=title,
+        cmd_id=cmd_id,
     )
     yield header
-    for line in output_block(output, name, cmd_id):
-        yield textwrap.indent(line, indent)
+    yield Nested(
+        indent,
+        output_block(
+            output,
+            name,
+            cmd_id,
+            minify=minify,
+            collapser=collapser,
+            max_line_width=max_line_width,
+            html_dir=html_dir,
+            output_budget=output_budget,
+        ),
+    )
     yield footer
 
 
-def output_block(
-    output: Union[Path, str], name: str, cmd_id: str
-) -> Iterator[str]:
+def output_block(  # noqa: PLR0913
+    output: Union[Path, str],
+    name: str,
+    cmd_id: str,
+    *,
+    minify: bool = False,
+    collapser: Optional[ProgressCollapser] = None,
+    max_line_width: Optional[int] = None,
+    html_dir: Optional[Path] = None,
+    output_budget: Optional[Tuple[int, int]] = None,
+) -> Iterator[Union[str, Nested]]:
     """
     Generate an output block.
 
     Given the output from a command, generate the HTML equivalent for
-    inclusion in the log file.
+    inclusion in the log file.  If the ``output`` file looks binary
+    (see :func:`is_binary`), only a summary of it is included, along
+    with a link to the file itself.
 
     Parameters:
         output:  The output from a command.
         name:  The name (title) of the output block.
         cmd_id:  The unique identifier associated with the command that
             was run.
+        minify:  Whether or not to leave out cosmetic whitespace.
+        collapser:  If given, output redrawn in place (e.g., progress
+            bars) in the ``output`` file is collapsed to its final state
+            with it, and a note saying how much was left out follows the
+            output.
+        max_line_width:  The number of characters of each line shown
+            before the rest is hidden, if any.
+        html_dir:  The directory the HTML log file is opened from
+            (e.g., the one with a symlink to it), which links to the
+            ``output`` file are relative to.  Defaults to the directory
+            holding the ``output`` file.
+        output_budget:  How many lines at the start and at the end of
+            the ``output`` file to show, if not all of them.  The lines
+            in between are replaced with a note linking to the file.
 
     Yields:
         The HTML equivalent of each line of the output in turn.
     """
     if isinstance(output, Path):
-        with output.open() as f:
-            for string in output_block_html(f, name, cmd_id):
-                yield string
+        with output.open("rb") as binary:
+            sample = binary.read(BINARY_SAMPLE_SIZE)
+            href = relative_url(output, html_dir or output.parent)
+            if is_binary(sample):
+                yield output_note(
+                    f"Binary output ({output.stat().st_size:,} bytes) isn't "
+                    f'shown.  See the <a href="{href}">raw output</a> for '
+                    f"all of it; the first {min(len(sample), HEXDUMP_SIZE)} "
+                    "bytes are below.",
+                    minify=minify,
+                )
+                yield from output_block_html(
+                    hexdump(sample[:HEXDUMP_SIZE]), name, cmd_id, minify=minify
+                )
+                return
+            binary.seek(0)
+            newline = None if collapser is None else "\n"
+            with io.TextIOWrapper(
+                binary, encoding="utf-8", errors="replace", newline=newline
+            ) as f:
+                lines = f if collapser is None else collapser.collapse(f)
+                yield from output_block_html(
+                    lines,
+                    name,
+                    cmd_id,
+                    minify=minify,
+                    max_line_width=max_line_width,
+                    output_budget=output_budget,
+                    href=href,
+                )
+        if collapser is not None and collapser.elided:
+            yield output_note(
+                f"{collapser.elided:,} bytes of output redrawn in place were "
+                "left out.",
+                minify=minify,
+            )
     if isinstance(output, str):
-        for string in output_block_html(output, name, cmd_id):
-            yield string
+        yield from output_block_html(
+            output, name, cmd_id, minify=minify, max_line_width=max_line_width
+        )
+
+
+def relative_url(path: Path, html_dir: Path) -> str:
+    """
+    Get the URL of a file, or directory, from the HTML log file.
+
+    Parameters:
+        path:  The file or directory.
+        html_dir:  The directory the HTML log file is opened from.
 
+    Returns:
+        The URL of the ``path`` relative to the HTML log file.
+    """
+    relative = Path(os.path.relpath(path, html_dir))
+    return "./" + quote(relative.as_posix())
 
-def diagnostics_card(cmd_id: str, *args: Iterator[str]) -> Iterator[str]:
+
+def output_note(note: str, *, minify: bool = False) -> str:
+    """
+    Generate a note about how an output block was rendered.
+
+    Parameters:
+        note:  The HTML for the note.
+        minify:  Whether or not to leave out cosmetic whitespace.
+
+    Returns:
+        The corresponding HTML snippet.
+    """
+    return f'<p class="output-note">{note}</p>' + ("" if minify else "\n")
+
+
+def is_binary(sample: bytes) -> bool:
+    """
+    Determine whether output looks binary, rather than text.
+
+    Parameters:
+        sample:  The start of the output.
+
+    Returns:
+        Whether more than :data:`BINARY_NUL_RATIO` of the ``sample`` is
+        NUL bytes, or more than :data:`BINARY_INVALID_RATIO` of it isn't
+        valid UTF-8.
+    """
+    if sample.count(0) > BINARY_NUL_RATIO * len(sample):
+        return True
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    text = decoder.decode(sample)
+    return text.count("\ufffd") > BINARY_INVALID_RATIO * len(text)
+
+
+def hexdump(data: bytes) -> List[str]:
+    """
+    Generate a hex dump of some binary data, like ``xxd`` would.
+
+    Parameters:
+        data:  The binary data.
+
+    Returns:
+        A line for each 16 bytes, giving their offset, their values in
+        hexadecimal, and the printable ASCII characters among them.
+    """
+    lines = []
+    for offset in range(0, len(data), 16):
+        chunk = data[offset : offset + 16]
+        values = " ".join(
+            chunk[i : i + 2].hex() for i in range(0, len(chunk), 2)
+        )
+        characters = "".join(
+            chr(byte) if 0x20 <= byte < 0x7F else "." for byte in chunk
+        )
+        lines.append(f"{offset:08x}: {values:<39}  {characters}")
+    return lines
+
+
+def diagnostics_card(
+    cmd_id: str, *args: Iterator[str], minify: bool = False
+) -> Iterator[Union[str, Nested]]:
     """
     Generate a diagnostics card.
 
@@ -626,27 +1282,30 @@ def diagnostics_card(cmd_id: str, *args: Iterator[str]) -> Iterator[str]:
             was run.
         *args:  A generator to lazily yield all the diagnostic
             information, one piece at a time.
+        minify:  Whether or not to leave out cosmetic whitespace.
 
     Yields:
         The header, followed by each piece of diagnostic information,
         and then the footer.
     """
     header, indent, footer = split_template(
-        diagnostics_template, "diagnostics", cmd_id=cmd_id
+        diagnostics_template, "diagnostics", minify=minify, cmd_id=cmd_id
     )
     yield header
-    for arg in args:
-        if isinstance(arg, str):
-            yield textwrap.indent(arg, indent)
-        elif isinstance(arg, Iterable):
-            for _arg in arg:
-                yield textwrap.indent(_arg, indent)
+    yield Nested(indent, args)
     yield footer
 
 
-def output_block_html(
-    lines: Union[TextIO, str], name: str, cmd_id: str
-) -> Iterator[str]:
+def output_block_html(  # noqa: PLR0913
+    lines: Union[Iterable[str], str],
+    name: str,
+    cmd_id: str,
+    *,
+    minify: bool = False,
+    max_line_width: Optional[int] = None,
+    output_budget: Optional[Tuple[int, int]] = None,
+    href: Optional[str] = None,
+) -> Iterator[Union[str, Nested]]:
     """
     Generate the HTML for an output block.
 
@@ -658,6 +1317,12 @@ def output_block_html(
         name:  The name (title) for this output block.
         cmd_id:  The unique identifier associated with the command that
             was run.
+        minify:  Whether or not to leave out cosmetic whitespace.
+        max_line_width:  The number of characters of each line shown
+            before the rest is hidden, if any.
+        output_budget:  How many lines at the start and at the end to
+            show, if not all of them (see :func:`budgeted_batches_html`).
+        href:  The link to the full output, if any.
 
     Yields:
         The header, followed by the HTML corresponding to each line of
@@ -666,16 +1331,226 @@ def output_block_html(
     if isinstance(lines, str):
         lines = lines.split("\n")
     header, indent, footer = split_template(
-        output_block_template, "table_contents", name=name, cmd_id=cmd_id
+        output_block_template,
+        "table_contents",
+        minify=minify,
+        name=name,
+        cmd_id=cmd_id,
     )
     yield header
-    for line_no, line in enumerate(lines):
-        yield textwrap.indent(output_line_html(line, line_no), indent)
+    if output_budget is None:
+        rows = output_batches_html(
+            lines, minify=minify, max_width=max_line_width
+        )
+    else:
+        head, tail = output_budget
+        rows = budgeted_batches_html(
+            lines,
+            head,
+            tail,
+            minify=minify,
+            max_width=max_line_width,
+            href=href,
+        )
+    yield Nested(indent, rows)
     yield footer
 
 
+def budgeted_batches_html(  # noqa: PLR0913
+    lines: Iterable[str],
+    head: int,
+    tail: int,
+    *,
+    minify: bool = False,
+    max_width: Optional[int] = None,
+    href: Optional[str] = None,
+) -> Iterator[str]:
+    """
+    Generate the HTML for the first and last lines of output.
+
+    The first ``head`` lines are rendered as they're read, and only the
+    last ``tail`` lines are held in memory while the rest are skipped,
+    such that huge output needn't be read in all at once.
+
+    Parameters:
+        lines:  The lines of output.
+        head:  How many lines at the start to show.
+        tail:  How many lines at the end to show.
+        minify:  Whether or not to leave out cosmetic whitespace.
+        max_width:  The number of characters of each line shown before
+            the rest is hidden, if any.
+        href:  The link to the full output, if any.
+
+    Yields:
+        The HTML for each batch of the first lines, then a row saying
+        how many lines were left out (if any), and then the HTML for
+        each batch of the last lines.
+    """
+    lines = iter(lines)
+    yield from output_batches_html(
+        itertools.islice(lines, head), minify=minify, max_width=max_width
+    )
+    last_lines: deque = deque(maxlen=tail)
+    omitted = 0
+    for line in lines:
+        if len(last_lines) == tail:
+            omitted += 1
+        last_lines.append(line)
+    if omitted:
+        message = f"{omitted:,} lines left out."
+        if href is not None:
+            message += f'  See the <a href="{href}">raw output</a> for all.'
+        yield compile_template(omitted_lines_template, minify=minify)(
+            message=message
+        )
+    yield from output_batches_html(
+        last_lines,
+        minify=minify,
+        max_width=max_width,
+        line_no=head + omitted,
+    )
+
+
+def output_batches_html(
+    lines: Iterable[str],
+    *,
+    minify: bool = False,
+    max_width: Optional[int] = None,
+    line_no: int = 0,
+) -> Iterator[str]:
+    """
+    Generate the HTML for lines of output, a batch at a time.
+
+    Parameters:
+        lines:  The lines of output.
+        minify:  Whether or not to leave out cosmetic whitespace.
+        max_width:  The number of characters of each line shown before
+            the rest is hidden, if any.
+        line_no:  The line number of the first line.
+
+    Yields:
+        The HTML corresponding to each batch of
+        :data:`OUTPUT_LINES_PER_BATCH` lines.
+    """
+    lines = iter(lines)
+    while True:
+        batch = list(itertools.islice(lines, OUTPUT_LINES_PER_BATCH))
+        if not batch:
+            return
+        yield output_lines_html(
+            batch, line_no, minify=minify, max_width=max_width
+        )
+        line_no += len(batch)
+
+
+def output_lines_html(
+    lines: List[str],
+    line_no: int,
+    *,
+    minify: bool = False,
+    max_width: Optional[int] = None,
+) -> str:
+    """
+    Generate the HTML for a batch of lines of output.
+
+    This is equivalent to joining :func:`output_line_html` for each
+    line, but the whole batch is escaped at once, and only the lines
+    containing escape sequences are scanned for SGR codes.
+
+    Parameters:
+        lines:  The lines of output.
+        line_no:  The line number of the first line.
+        minify:  Whether or not to leave out cosmetic whitespace.
+        max_width:  The number of characters of each line shown before
+            the rest is hidden (see :func:`truncated_line_html`), if
+            any.
+
+    Returns:
+        The corresponding HTML snippet, as :class:`Lines` when it's
+        safe to indent it as such.
+    """
+    text = "\n".join(line.rstrip() for line in lines)
+    encoded_lines = (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .split("\n")
+    )
+    if "\x1b" in text:
+        for i, line in enumerate(lines):
+            if "\x1b" in line:
+                encoded_lines[i] = html_encode(line).rstrip()
+    if max_width is not None:
+        for i, line in enumerate(lines):
+            if len(line) > max_width and len(line.rstrip()) > max_width:
+                encoded_lines[i] = truncated_line_html(
+                    line.rstrip(), max_width
+                )
+    row = output_row_template(minify=minify)
+    html = "".join(
+        [
+            row % (number, line)
+            for number, line in enumerate(encoded_lines, line_no)
+        ]
+    )
+    if any(line_break in text for line_break in LINE_BREAKS):
+        return html
+    return Lines(html)
+
+
+def truncated_line_html(line: str, width: int) -> str:
+    """
+    Generate the HTML for a line of output too long to show in full.
+
+    The first ``width`` characters are shown, followed by a button to
+    show the rest.  Until then, the rest is kept in a ``<template>``,
+    such that the browser doesn't lay it out.
+
+    Parameters:
+        line:  The line of output.
+        width:  The number of characters to show.
+
+    Returns:
+        The corresponding HTML snippet.
+    """
+    cut = width
+    start = line.rfind("\x1b", 0, cut)
+    if start >= 0:
+        match = ESCAPE_SEQUENCE.match(line, start)
+        if match is not None and match.end() > cut:
+            cut = start
+    rest = line[cut:]
+    return (
+        f"{html_encode(line[:cut])}"
+        '<button type="button" class="expand-line" '
+        'onclick="this.replaceWith(this.nextElementSibling.content)">'
+        f"{len(rest):,} more characters</button>"
+        f"<template>{html_encode(rest)}</template>"
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def output_row_template(*, minify: bool = False) -> str:
+    """
+    Compile the template for a line of output, for use in a batch.
+
+    Parameters:
+        minify:  Whether or not to leave out cosmetic whitespace.
+
+    Returns:
+        The template, with printf-style fields for the line number and
+        then the line itself.
+    """
+    before, _, after = (
+        template_text(output_line_template, minify=minify)
+        .replace("%", "%%")
+        .partition("{line_no}")
+    )
+    return before + "%s" + after.replace("{line}", "%s")
+
+
 def split_template(
-    template: str, split_at: str, **kwargs
+    template: str, split_at: str, *, minify: bool = False, **kwargs
 ) -> Tuple[str, str, str]:
     """
     Subdivide a HTML template.
@@ -708,21 +1583,111 @@ def split_template(
         template:  A templated HTML snippet.
         split_at:  A substring used to split the ``template`` into
             before and after chunks.
+        minify:  Whether or not to leave out cosmetic whitespace, in
+            which case the indent is empty.
         **kwargs:  Additional keyword arguments used to replace keywords
             in the ``template``.
 
     Returns:
         The header, indent, and footer.
     """
-    fmt = {k: v for k, v in kwargs.items() if k != split_at}
-    pattern = re.compile(
-        f"(.*\\n)(\\s*)\\{{{split_at}\\}}\\n(.*)", flags=re.DOTALL
+    header, indent, footer = compile_split_template(
+        template, split_at, minify=minify
     )
-    before, indent, after = pattern.search(template).groups()
-    return before.format(**fmt), indent, after.format(**fmt)
+    return header(**kwargs), indent, footer(**kwargs)
+
+
+class SplitTemplate(NamedTuple):
+    """
+    A HTML template, split around the content inserted into it.
 
+    See :func:`split_template`.
 
-def output_line_html(line: str, line_no: int) -> str:
+    Attributes:
+        header (Callable[..., str]):  Formats everything before the
+            content.
+        indent (str):  The indentation of the content.
+        footer (Callable[..., str]):  Formats everything after the
+            content.
+    """
+
+    header: Callable[..., str]
+    indent: str
+    footer: Callable[..., str]
+
+
+@functools.lru_cache(maxsize=None)
+def compile_split_template(
+    template: str,
+    split_at: str,
+    *,
+    minify: bool = False,
+) -> SplitTemplate:
+    """
+    Split a HTML template once, and compile the pieces.
+
+    Parameters:
+        template:  A templated HTML snippet.
+        split_at:  A substring used to split the ``template`` into
+            before and after chunks.
+        minify:  Whether or not to leave out cosmetic whitespace, in
+            which case the indent is empty.
+
+    Returns:
+        Formatters for the header and footer, along with the indent.
+    """
+    if minify:
+        before, _, after = minify_template(template).partition(
+            f"{{{split_at}}}"
+        )
+        indent = ""
+    else:
+        pattern = re.compile(
+            f"(.*\\n)(\\s*)\\{{{split_at}\\}}\\n(.*)", flags=re.DOTALL
+        )
+        before, indent, after = pattern.search(template).groups()
+    return SplitTemplate(
+        compile_template(before), indent, compile_template(after)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def compile_template(
+    template: str,
+    *,
+    minify: bool = False,
+) -> Callable[..., str]:
+    """
+    Compile a HTML template into a fast formatter.
+
+    The replacement fields in the ``template`` are converted to
+    printf-style ones once, such that filling them in doesn't parse the
+    template again.  Templates using anything beyond plain field names
+    (e.g., format specifications) fall back to :meth:`str.format`.
+
+    Parameters:
+        template:  A templated HTML snippet.
+        minify:  Whether or not to leave out cosmetic whitespace.
+
+    Returns:
+        A function taking the template's fields as keyword arguments,
+        and returning the filled-in template.  Any extra keyword
+        arguments are ignored.
+    """
+    text = template_text(template, minify=minify)
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(text):
+        parts.append(literal.replace("%", "%%"))
+        if field is None:
+            continue
+        if spec or conversion or not field.isidentifier():
+            return text.format
+        parts.append(f"%({field})s")
+    printf_text = "".join(parts)
+    return lambda **kwargs: printf_text % kwargs
+
+
+def output_line_html(line: str, line_no: int, *, minify: bool = False) -> str:
     """
     Generate the HTML for a line of output.
 
@@ -733,12 +1698,55 @@ def output_line_html(line: str, line_no: int) -> str:
     Parameters:
         line:  A line of output.
         line_no:  The corresponding line number.
+        minify:  Whether or not to leave out cosmetic whitespace.
 
     Returns:
         The corresponding HTML snippet.
     """
     encoded_line = html_encode(line).rstrip()
-    return output_line_template.format(line=encoded_line, line_no=line_no)
+    return compile_template(output_line_template, minify=minify)(
+        line=encoded_line, line_no=line_no
+    )
+
+
+def template_text(template: str, *, minify: bool) -> str:
+    """
+    Get a template, with or without its cosmetic whitespace.
+
+    Parameters:
+        template:  A templated HTML snippet.
+        minify:  Whether or not to leave out cosmetic whitespace.
+
+    Returns:
+        The ``template``, minified if requested.
+    """
+    return minify_template(template) if minify else template
+
+
+@functools.lru_cache(maxsize=None)
+def minify_template(template: str) -> str:
+    """
+    Remove the cosmetic whitespace from a template.
+
+    Each line is stripped of its indentation, and the lines are joined
+    together, with a space between them only where one is needed to
+    separate attributes or words.
+
+    Parameters:
+        template:  A templated HTML snippet.
+
+    Returns:
+        The ``template`` on a single line.
+    """
+    html = ""
+    for line in template.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if html and not html.endswith(">") and not stripped.startswith("<"):
+            html += " "
+        html += stripped
+    return html
 
 
 def html_encode(text: str) -> str:
@@ -751,53 +1759,108 @@ def html_encode(text: str) -> str:
     Returns:
         The encoded text.
     """
-    return sgr_to_html(
-        text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-    )
+    if "\x1b" in text:
+        return sgr_to_html(text, encode=True)
+    return escape_html(text)
+
+
+def escape_html(text: str) -> str:
+    """
+    Replace the characters HTML treats as markup with their encodings.
 
+    Parameters:
+        text:  The text to escape.
 
-def sgr_to_html(text: str) -> str:
+    Returns:
+        The escaped text.
     """
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def sgr_to_html(text: str, *, encode: bool = False) -> str:
+    r"""
     Convert SGR to HTML.
 
     Translate Select Graphic Rendition (SGR, a.k.a. ANSI escape codes)
-    to valid HTML/CSS.
+    to valid HTML/CSS.  The text is scanned once, a whole escape
+    sequence at a time, so other control sequences (e.g., ``\x1b[2K``
+    to clear the line, or OSC sequences setting the window title) are
+    stripped without consuming any of the text around them.  Any spans
+    still open at the end of the text are closed.
 
     Parameters:
         text:  The input text.
+        encode:  Whether or not to replace special characters with their
+            HTML encodings (see :func:`html_encode`) in the text between
+            the escape sequences.
 
     Returns:
         The same text, with the escape codes translated to HTML/CSS.
     """
-    span_count = 0
-    while text.find("\x1b[") >= 0:
-        start = text.find("\x1b[")
-        finish = text.find("m", start)
-        sgrs = text[start + 2 : finish].split(";")
-        span_string = ""
-        if len(sgrs) == 0:
-            span_string += "</span>" * span_count
-            span_count = 0
+    if "\x1b" not in text:
+        return escape_html(text) if encode else text
+
+    # Splitting on the escape sequences gives the text before the first,
+    # and then the parameters and final character of each (if it's a
+    # CSI sequence) followed by the text after it.
+    pieces = ESCAPE_SEQUENCE.split(text)
+    if encode and ("&" in text or "<" in text or ">" in text):
+        pieces[::3] = [escape_html(segment) for segment in pieces[::3]]
+    html, span_count = [pieces[0]], 0
+    for params, final, segment in zip(  # noqa: B905
+        pieces[1::3], pieces[2::3], pieces[3::3]
+    ):
+        if final == "m" and params is not None:
+            reset, spans, count = sgr_spans(params)
+            if reset:
+                html.append("</span>" * span_count)
+                span_count = 0
+            html.append(spans)
+            span_count += count
+        html.append(segment)
+    html.append("</span>" * span_count)
+    return "".join(html)
+
+
+@functools.lru_cache(maxsize=1024)
+def sgr_spans(params: str) -> Tuple[bool, str, int]:
+    r"""
+    Convert the parameters of a SGR sequence to HTML spans.
+
+    Parameters:
+        params:  The semicolon-separated parameters, e.g., ``1;31`` for
+            ``\x1b[1;31m``.
+
+    Returns:
+        Whether or not the sequence resets the style, in which case any
+        open spans must be closed first; the spans to open; and how
+        many there are.
+    """
+    sgrs = params.split(";")
+    reset, spans, i = False, [], 0
+    while i < len(sgrs):
+        sgr = sgrs[i].lstrip("0")
+        kind = sgrs[i + 1].lstrip("0") if i + 1 < len(sgrs) else None
+        if not sgr:
+            reset, spans = True, []
+            i += 1
+        elif sgr in ("38", "48") and kind == "2" and len(sgrs) - i >= 5:
+            spans.append(
+                sgr_24bit_color_to_html([sgr, kind, *sgrs[i + 2 : i + 5]])
+            )
+            i += 5
+        elif (
+            sgr in ("38", "48")
+            and kind == "5"
+            and len(sgrs) - i >= 3
+            and sgrs[i + 2].isdigit()
+        ):
+            spans.append(sgr_8bit_color_to_html([sgr, kind, sgrs[i + 2]]))
+            i += 3
         else:
-            while sgrs:
-                if sgrs[0] == "0":
-                    span_string += "</span>" * span_count
-                    span_count = 0
-                    sgrs = sgrs[1:]
-                elif len(sgrs) >= 5 and sgrs[:2] in [["38", "2"], ["48", "2"]]:
-                    span_count += 1
-                    span_string += sgr_24bit_color_to_html(sgrs[:5])
-                    sgrs = sgrs[5:]
-                elif len(sgrs) >= 3 and sgrs[:2] in [["38", "5"], ["48", "5"]]:
-                    span_count += 1
-                    span_string += sgr_8bit_color_to_html(sgrs[:3])
-                    sgrs = sgrs[3:]
-                else:
-                    span_count += 1
-                    span_string += sgr_4bit_color_and_style_to_html(sgrs[0])
-                    sgrs = sgrs[1:]
-        text = text[:start] + span_string + text[finish + 1 :]
-    return text
+            spans.append(sgr_4bit_color_and_style_to_html(sgr))
+            i += 1
+    return reset, "".join(spans), len(spans)
 
 
 def sgr_4bit_color_and_style_to_html(sgr: str) -> str:
@@ -915,36 +1978,83 @@ def sgr_24bit_color_to_html(sgr_params: List[str]) -> str:
     return "<span>"
 
 
-def html_header() -> str:
+@functools.lru_cache(maxsize=None)
+def html_header(asset_url: Optional[str] = None) -> str:
     """
-    Get the HTML header, complete with embedded styles and scripts.
+    Get the HTML header, complete with styles and scripts.
+
+    The header is assembled once per process for each ``asset_url``.
+
+    Parameters:
+        asset_url:  The URL (relative to the HTML log file) of the
+            directory the :data:`STYLES` and :data:`SCRIPTS` were
+            written to by :func:`write_assets`, such that they're
+            linked to, rather than embedded.  If ``None``, they're
+            embedded, making the HTML log file self-contained.
 
     Returns:
         A string with the ``<head>...</head>`` contents.
     """
+    if asset_url is None:
+        styles = [embed_style(style) for style in STYLES]
+        scripts = [embed_script(script) for script in SCRIPTS]
+    else:
+        styles = [
+            f'<link rel="stylesheet" href="{asset_url}/{asset_name(style)}">\n'
+            for style in STYLES
+        ]
+        scripts = [
+            f'<script src="{asset_url}/{asset_name(script)}"></script>\n'
+            for script in SCRIPTS
+        ]
     return (
         "<head>"
-        + embed_style("bootstrap.min.css")
-        + embed_style("Chart.min.css")
-        + embed_style("top_level_style_adjustments.css")
-        + embed_style("parent_logger_style.css")
-        + embed_style("child_logger_style.css")
-        + embed_style("command_style.css")
-        + embed_style("message_style.css")
-        + embed_style("detail_list_style.css")
-        + embed_style("code_block_style.css")
-        + embed_style("output_style.css")
-        + embed_style("diagnostics_style.css")
-        + embed_style("search_controls.css")
-        + embed_script("jquery.slim.min.js")
-        + embed_script("bootstrap.bundle.min.js")
-        + embed_script("Chart.bundle.min.js")
-        + embed_script("search_output.js")
+        + "".join(styles)
+        + "".join(scripts)
         + embed_html("search_icon.svg")
         + "</head>"
     )
 
 
+@functools.lru_cache(maxsize=None)
+def asset_name(resource: str) -> str:
+    """
+    Get the name of a resource in the directory of shared assets.
+
+    Parameters:
+        resource:  The name of a style or script file.
+
+    Returns:
+        The name, with a hash of the contents inserted before the
+        extension, such that different versions of the resource can
+        share the directory.
+    """
+    digest = hashlib.sha256(load_resource(resource).encode()).hexdigest()
+    stem, _, extension = resource.rpartition(".")
+    return f"{stem}.{digest[:16]}.{extension}"
+
+
+def write_assets(asset_dir: Path) -> None:
+    """
+    Write the styles and scripts to a directory of shared assets.
+
+    Only those not already there are written, each to a temporary file
+    first, such that loggers sharing the directory never see part of a
+    file.
+
+    Parameters:
+        asset_dir:  The directory of shared assets.
+    """
+    asset_dir.mkdir(parents=True, exist_ok=True)
+    for resource in STYLES + SCRIPTS:
+        asset = asset_dir / asset_name(resource)
+        if asset.exists():
+            continue
+        partial = asset.with_name(f".{asset.name}.{os.getpid()}")
+        partial.write_text(load_resource(resource), encoding="utf-8")
+        partial.replace(asset)
+
+
 def embed_style(resource: str) -> str:
     """
     Embed a style in the HTML.
@@ -962,11 +2072,7 @@ def embed_style(resource: str) -> str:
       * Should we combine this with :func:`embed_script` and
         :func:`embed_html`?
     """
-    return (
-        "<style>\n"
-        + pkgutil.get_data(__name__, f"resources/{resource}").decode()
-        + "\n</style>\n"
-    )
+    return "<style>\n" + load_resource(resource) + "\n</style>\n"
 
 
 def embed_script(resource: str) -> str:
@@ -982,11 +2088,7 @@ def embed_script(resource: str) -> str:
     Returns:
         A string containing the ``<script>...</script>`` block.
     """
-    return (
-        "<script>\n"
-        + pkgutil.get_data(__name__, f"resources/{resource}").decode()
-        + "\n</script>\n"
-    )
+    return "<script>\n" + load_resource(resource) + "\n</script>\n"
 
 
 def embed_html(resource: str) -> str:
@@ -1006,6 +2108,20 @@ def embed_html(resource: str) -> str:
       * Why do we use ``pkgutil.get_data()`` instead of a simple
         ``read()``.
     """
+    return load_resource(resource)
+
+
+@functools.lru_cache(maxsize=None)
+def load_resource(resource: str) -> str:
+    """
+    Load a resource file, reading it only once per process.
+
+    Parameters:
+        resource:  The name of the file to load.
+
+    Returns:
+        The contents of the file.
+    """
     return pkgutil.get_data(__name__, f"resources/{resource}").decode()
 
 
@@ -1035,6 +2151,7 @@ output_card_template = load_template("output_card.html")
 output_card_collapsed_template = load_template("output_card_collapsed.html")
 output_block_template = load_template("output_block.html")
 output_line_template = load_template("output_line.html")
+omitted_lines_template = load_template("omitted_lines.html")
 message_template = load_template("message.html")
 html_message_template = load_template("html_message.html")
 command_template = load_template("command.html")
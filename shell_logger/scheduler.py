@@ -0,0 +1,376 @@
+"""Provides the :class:`CommandScheduler` class."""
+
+# © 2023 National Technology & Engineering Solutions of Sandia, LLC
+# (NTESS).  Under the terms of Contract DE-NA0003525 with NTESS, the
+# U.S. Government retains certain rights in this software.
+
+# SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import annotations
+
+import concurrent.futures
+import json
+from datetime import datetime
+from time import time
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Dict, Iterable, List
+
+from .shell import MILLISECONDS_PER_SECOND
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from .shell_logger import ShellLogger
+
+
+def historical_durations(json_files: Iterable[Path]) -> Dict[str, int]:
+    """
+    Find how long commands took in prior logs.
+
+    Parameters:
+        json_files:  The JSON files written by prior
+            :class:`ShellLogger` objects when they were finalized.
+
+    Returns:
+        A mapping from each command found to its duration (in
+        milliseconds).  If a command was run more than once, its most
+        recent duration is used.
+    """
+    durations = {}
+
+    def visit(obj: object) -> None:
+        if isinstance(obj, dict):
+            if isinstance(obj.get("cmd"), str) and isinstance(
+                obj.get("wall"), (int, float)
+            ):
+                durations[obj["cmd"]] = obj["wall"]
+            for value in obj.values():
+                visit(value)
+        elif isinstance(obj, list):
+            for value in obj:
+                visit(value)
+
+    for json_file in json_files:
+        with json_file.open() as jf:
+            visit(json.load(jf))
+    return durations
+
+
+class CommandScheduler:
+    """
+    Run a graph of commands, each after the commands it depends on.
+
+    Commands whose dependencies have all succeeded run concurrently via
+    :func:`ShellLogger.submit`, up to the logger's ``max_workers`` at a
+    time.  When more commands are ready than can be run, those heading
+    the longest chains of remaining work (based on how long the
+    commands took in prior logs) are started first, which shortens the
+    critical path.  A command fails if it exits with a non-zero return
+    code, or if running it raises an exception (e.g., because its shell
+    exited), and those depending on it are skipped.
+
+    Once the graph has been run, the schedule is recorded in the
+    logger's log book, including when each command started and
+    finished, and the critical path; that is, the chain of dependent
+    commands that took the longest.
+
+    Example::
+
+        scheduler = CommandScheduler(logger, history=[prior_json])
+        scheduler.add("configure", "Configure.", "cmake ..")
+        scheduler.add("build", "Build.", "make", after=["configure"])
+        scheduler.add("test", "Test.", "ctest", after=["build"])
+        scheduler.run()
+
+    Attributes:
+        logger (ShellLogger):  The logger used to run the commands.
+        nodes (Dict[str, SimpleNamespace]):  The commands to run, keyed
+            by name, in the order they were added.
+        durations (Dict[str, int]):  The expected duration (in
+            milliseconds) of each command, keyed by the command itself.
+    """
+
+    def __init__(
+        self, logger: ShellLogger, *, history: Iterable[Path] = ()
+    ) -> None:
+        """
+        Initialize a :class:`CommandScheduler` object.
+
+        Parameters:
+            logger:  The logger used to run the commands.
+            history:  The JSON files written by prior
+                :class:`ShellLogger` objects, from which to estimate
+                how long each command will take.
+        """
+        self.logger = logger
+        self.nodes: Dict[str, SimpleNamespace] = {}
+        self.durations = historical_durations(history)
+
+    def add(
+        self,
+        name: str,
+        msg: str,
+        cmd: str,
+        *,
+        after: Iterable[str] = (),
+        **kwargs,
+    ) -> None:
+        """
+        Add a command to the graph.
+
+        Parameters:
+            name:  A unique name for the command, by which other
+                commands can depend on it.
+            msg:  A message to be recorded with the command.
+            cmd:  The shell command to be executed.
+            after:  The names of the commands that must succeed before
+                this one can run.
+            **kwargs:  Any other keyword arguments accepted by
+                :func:`ShellLogger.log`.
+
+        Raises:
+            ValueError:  If a command with the same ``name`` was
+                already added.
+        """
+        if name in self.nodes:
+            message = f"A command named '{name}' was already scheduled."
+            raise ValueError(message)
+        self.nodes[name] = SimpleNamespace(
+            name=name,
+            msg=msg,
+            cmd=cmd,
+            after=list(after),
+            kwargs=kwargs,
+            status="pending",
+            index=None,
+            return_code=None,
+            start=None,
+            finish=None,
+            error=None,
+        )
+
+    def run(self) -> Dict[str, dict]:
+        """
+        Run the graph of commands.
+
+        Returns:
+            A mapping from the name of each command that was run to the
+            dictionary :func:`ShellLogger.log` returned for it.
+
+        Raises:
+            ValueError:  If a command depends on one that wasn't added,
+                or if the dependencies form a cycle.
+            Exception:  The first exception raised while running a
+                command, once everything that didn't depend on it has
+                run and the schedule has been recorded.
+        """
+        order = self.topological_order()
+        priority = self.priorities(order)
+        dependents = self.dependents()
+        waiting_on = {
+            name: len(node.after) for name, node in self.nodes.items()
+        }
+        rank = {name: i for i, name in enumerate(self.nodes)}
+        ready = [name for name, count in waiting_on.items() if count == 0]
+        running: Dict[concurrent.futures.Future, str] = {}
+        results, errors = {}, []
+        start = round(time() * MILLISECONDS_PER_SECOND)
+        while ready or running:
+            ready.sort(key=lambda name: (-priority[name], rank[name]))
+            while ready and len(running) < self.logger.max_workers:
+                node = self.nodes[ready.pop(0)]
+                future, node.index = self.logger._submit(
+                    node.msg, node.cmd, **node.kwargs
+                )
+                running[future] = node.name
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                node = self.nodes[running.pop(future)]
+                error = future.exception()
+                if error is None:
+                    results[node.name] = future.result()
+                    entry = self.logger.log_book[node.index]
+                    node.return_code = entry["return_code"]
+                    node.start, node.finish = entry["start"], entry["finish"]
+                else:
+                    node.error = str(error)
+                    errors.append(error)
+                if error is not None or node.return_code != 0:
+                    node.status = "failed"
+                    self.skip(dependents, node.name)
+                    continue
+                node.status = "succeeded"
+                for dependent in dependents[node.name]:
+                    waiting_on[dependent] -= 1
+                    if waiting_on[dependent] == 0:
+                        ready.append(dependent)
+        self.record(order, priority, start)
+        if errors:
+            raise errors[0]
+        return results
+
+    def topological_order(self) -> List[str]:
+        """
+        Order the commands such that each follows its dependencies.
+
+        Returns:
+            The names of the commands.
+
+        Raises:
+            ValueError:  If a command depends on one that wasn't added,
+                or if the dependencies form a cycle.
+        """
+        order, visiting, visited = [], set(), set()
+
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                message = f"The commands depending on '{name}' form a cycle."
+                raise ValueError(message)
+            visiting.add(name)
+            for dependency in self.nodes[name].after:
+                if dependency not in self.nodes:
+                    message = (
+                        f"'{name}' depends on '{dependency}', which wasn't "
+                        "scheduled."
+                    )
+                    raise ValueError(message)
+                visit(dependency)
+            visiting.remove(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
+
+    def priorities(self, order: List[str]) -> Dict[str, int]:
+        """
+        Determine which commands to start first.
+
+        Parameters:
+            order:  The names of the commands, such that each follows
+                its dependencies.
+
+        Returns:
+            A mapping from the name of each command to the expected
+            duration (in milliseconds) of the longest chain of commands
+            it starts, where commands without a prior duration are
+            expected to take no time.
+        """
+        dependents, priority = self.dependents(), {}
+        for name in reversed(order):
+            priority[name] = self.durations.get(self.nodes[name].cmd, 0) + max(
+                (priority[dependent] for dependent in dependents[name]),
+                default=0,
+            )
+        return priority
+
+    def dependents(self) -> Dict[str, List[str]]:
+        """
+        Invert the dependencies of the commands.
+
+        Returns:
+            A mapping from the name of each command to the names of the
+            commands that depend on it.
+        """
+        dependents: Dict[str, List[str]] = {name: [] for name in self.nodes}
+        for node in self.nodes.values():
+            for dependency in node.after:
+                dependents[dependency].append(node.name)
+        return dependents
+
+    def skip(self, dependents: Dict[str, List[str]], name: str) -> None:
+        """
+        Skip everything depending on a command that failed.
+
+        Parameters:
+            dependents:  A mapping from the name of each command to the
+                names of the commands that depend on it.
+            name:  The name of the command that failed.
+        """
+        for dependent in dependents[name]:
+            if self.nodes[dependent].status == "pending":
+                self.nodes[dependent].status = "skipped"
+                self.skip(dependents, dependent)
+
+    def critical_path(self, order: List[str]) -> List[str]:
+        """
+        Find the chain of dependent commands that took the longest.
+
+        Parameters:
+            order:  The names of the commands, such that each follows
+                its dependencies.
+
+        Returns:
+            The names of the commands on the critical path, in the
+            order they were run.
+        """
+        longest, previous = {}, {}
+        for name in order:
+            node = self.nodes[name]
+            duration = (
+                node.finish - node.start if node.start is not None else 0
+            )
+            previous[name] = max(
+                node.after, key=lambda d: longest[d], default=None
+            )
+            longest[name] = duration + (
+                longest[previous[name]] if previous[name] else 0
+            )
+        name = max(order, key=lambda n: longest[n], default=None)
+        path = []
+        while name is not None:
+            path.append(name)
+            name = previous[name]
+        return path[::-1]
+
+    def record(
+        self, order: List[str], priority: Dict[str, int], start: int
+    ) -> None:
+        """
+        Save the schedule to the logger's log book.
+
+        Parameters:
+            order:  The names of the commands, such that each follows
+                its dependencies.
+            priority:  The priority each command was given.
+            start:  When the graph started running (in milliseconds
+                since the epoch).
+        """
+        path = self.critical_path(order)
+        self.logger.log_book.append(
+            {
+                "msg": f"Ran {len(self.nodes)} scheduled commands.",
+                "timestamp": str(datetime.now()),
+                "cmd": None,
+                "schedule": {
+                    "start": start,
+                    "finish": round(time() * MILLISECONDS_PER_SECOND),
+                    "critical_path": path,
+                    "critical_path_duration": sum(
+                        self.nodes[name].finish - self.nodes[name].start
+                        for name in path
+                        if self.nodes[name].start is not None
+                    ),
+                    "nodes": [
+                        {
+                            "name": node.name,
+                            "msg": node.msg,
+                            "cmd": node.cmd,
+                            "after": node.after,
+                            "priority": priority[node.name],
+                            "status": node.status,
+                            "return_code": node.return_code,
+                            "start": node.start,
+                            "finish": node.finish,
+                            "error": node.error,
+                        }
+                        for node in self.nodes.values()
+                    ],
+                },
+            }
+        )
@@ -8,20 +8,44 @@
 
 from __future__ import annotations
 
-import _thread
+import asyncio
+import codecs
+import contextlib
+import errno
 import fcntl
 import os
+import secrets
+import selectors
+import shlex
 import subprocess
 import sys
+import threading
 from io import StringIO
 from pathlib import Path
-from threading import Thread
 from time import time
 from types import SimpleNamespace
-from typing import IO, List, Optional, TextIO, Tuple
+from typing import (
+    IO,
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+)
 
 
 END_OF_READ = 4
+MILLISECONDS_PER_SECOND = 10**3
+PIPE_SIZE = 1024 * 1024  # 1 MB
+TEE_BUFFER_SIZE = 256 * 1024  # 256 KB
+TRAILER_SIZE = 256
+SPAWN_LOCK = threading.Lock()
+ZERO_COPY = hasattr(os, "splice")
 
 
 class Shell:
@@ -42,6 +66,20 @@ class Shell:
         aux_stderr_wfd (int):  The write file descriptor for ``stderr``.
         shell_subprocess (Popen[str]):  The subprocess for interacting
             with the shell.
+        tee_engine (TeeEngine):  The long-lived reader that splits the
+            shell's ``stdout`` and ``stderr`` between their sinks.
+        last_pwd (str):  The shell's working directory, as of when it
+            started, or the last command it ran or :func:`cd`.
+        aux_cache (Dict[str, str]):  The output of auxiliary commands
+            whose output shouldn't change over the life of the shell
+            (e.g., ``hostname``), keyed like in
+            :func:`auxiliary_commands`.
+        aux_cache_time (Optional[float]):  When (according to
+            :func:`time.monotonic`) the :attr:`aux_cache` was filled.
+        aux_cache_hits (int):  The number of times the cached auxiliary
+            information was used.
+        aux_cache_misses (int):  The number of times some of it had to
+            be fetched from the shell.
     """
 
     def __init__(
@@ -85,26 +123,50 @@ class Shell:
         )
 
         # Ensure the file descriptors are inheritable by the shell
-        # subprocess.
-        os.set_inheritable(self.aux_stdout_wfd, True)
-        os.set_inheritable(self.aux_stderr_wfd, True)
+        # subprocess.  Shells may be spawned from multiple threads, so
+        # make sure no other shell inherits them in the meantime.
         shell_command = [os.environ.get("SHELL") or "/bin/sh"]
         if self.login_shell:
             shell_command.append("-l")
-        self.shell_subprocess = subprocess.Popen(
-            shell_command,
-            stdin=self.aux_stdin_rfd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            close_fds=False,
+        with SPAWN_LOCK:
+            os.set_inheritable(self.aux_stdout_wfd, True)
+            os.set_inheritable(self.aux_stderr_wfd, True)
+            self.last_pwd = str(Path.cwd())
+            self.shell_subprocess = subprocess.Popen(
+                shell_command,
+                stdin=self.aux_stdin_rfd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                close_fds=False,
+            )
+            os.set_inheritable(self.aux_stdout_wfd, False)
+            os.set_inheritable(self.aux_stderr_wfd, False)
+
+        # Enlarge the `stdout`/`stderr` pipes (where supported) so
+        # commands that write quickly aren't throttled by the logger.
+        if hasattr(fcntl, "F_SETPIPE_SZ"):
+            for pipe in (
+                self.shell_subprocess.stdout,
+                self.shell_subprocess.stderr,
+            ):
+                with contextlib.suppress(OSError):
+                    fcntl.fcntl(pipe.fileno(), fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+        self.tee_engine = TeeEngine(
+            self.shell_subprocess.stdout.fileno(),
+            self.shell_subprocess.stderr.fileno(),
         )
-        os.set_inheritable(self.aux_stdout_wfd, False)
-        os.set_inheritable(self.aux_stderr_wfd, False)
+        self.aux_cache: Dict[str, str] = {}
+        self.aux_cache_time: Optional[float] = None
+        self.aux_cache_hits = 0
+        self.aux_cache_misses = 0
+        self._async_lock: Optional[asyncio.Lock] = None
+        self._async_lock_loop: Optional[asyncio.AbstractEventLoop] = None
 
-        # Start the shell in the given directory.
-        if pwd is None:
-            pwd = Path.cwd()
-        self.cd(pwd)
+        # Start the shell in the given directory.  If there isn't one,
+        # the shell is already in the current working directory, which
+        # shouldn't be touched, in case another thread is changing it.
+        if pwd is not None:
+            self.cd(pwd)
 
     def __del__(self) -> None:
         """Close all the open file descriptors."""
@@ -145,15 +207,69 @@ class Shell:
         directory, _ = self.auxiliary_command(posix="pwd", strip=True)
         return directory
 
-    def cd(self, path: Path) -> None:
+    def cd(self, path: Path, *, chdir: bool = True) -> str:
         """
         Change to the given directory.
 
         Parameters:
             path:  The directory to change to.
+            chdir:  Whether or not to change the process' working
+                directory as well.  It's shared by every thread, so
+                shells used concurrently should leave it alone.
+
+        Returns:
+            The directory the shell was in beforehand.  If the shell
+            couldn't change to the ``path``, it stays there.
         """
-        os.chdir(path)
-        self.auxiliary_command(posix=f"cd {path}")
+        if chdir:
+            os.chdir(path)
+        aux, _ = self.auxiliary_commands(
+            {"pwd": "pwd", "cd": f"cd -- {shlex.quote(str(path))} && pwd"},
+            strip=["pwd", "cd"],
+        )
+        self.last_pwd = str(path) if aux["cd"] else aux["pwd"]
+        return aux["pwd"]
+
+    def async_lock(self) -> asyncio.Lock:
+        """
+        Get the lock guarding the shell in the running event loop.
+
+        A shell can only run one command at a time, so coroutines
+        sharing it (e.g., concurrent :func:`ShellLogger.async_log` calls
+        on one logger, or on children sharing its shell) must hold this
+        lock around everything they write to the shell and read back.
+        A new lock is made for each event loop, as a lock can't be used
+        outside the loop it was first used in.
+
+        Returns:
+            The lock for the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_lock is None or self._async_lock_loop is not loop:
+            self._async_lock = asyncio.Lock()
+            self._async_lock_loop = loop
+        return self._async_lock
+
+    async def async_cd(self, path: Path) -> str:
+        """
+        Change the shell to the given directory without blocking.
+
+        This is the same as :func:`cd` with ``chdir=False``, as the
+        process' working directory is shared by every coroutine in the
+        event loop.
+
+        Parameters:
+            path:  The directory to change to.
+
+        Returns:
+            The directory the shell was in beforehand.
+        """
+        aux, _ = await self.async_auxiliary_commands(
+            {"pwd": "pwd", "cd": f"cd -- {shlex.quote(str(path))} && pwd"},
+            strip=["pwd", "cd"],
+        )
+        self.last_pwd = str(path) if aux["cd"] else aux["pwd"]
+        return aux["pwd"]
 
     def run(self, command: str, **kwargs) -> SimpleNamespace:
         """
@@ -162,35 +278,31 @@ class Shell:
         Write a ``command`` to the :class:`Shell` class' shell
         subprocess' ``stdin``, and pull the ``stdout`` and ``stderr``.
 
+        After the command, the shell writes a trailer to each stream
+        that starts with a random nonce unique to this command, so the
+        end of the output can't be confused with anything the command
+        prints.  The ``stdout`` trailer also carries the return code, the
+        shell-side start/finish times, and the working directory the
+        command left behind, so no additional round trips to the shell
+        are needed.
+
         Parameters:
             command:  The command to run in the shell subprocess.
             **kwargs:  Any additional arguments to pass to :func:`tee`.
+                A ``pwd`` runs just this command in the given directory;
+                the shell changes to it before the command and back
+                afterwards, as part of the same write to the shell.  A
+                true ``subshell`` runs the command in a subshell, such
+                that it can't change the shell's working directory,
+                environment, etc.  Some ``exports`` (the output of
+                ``export -p`` in another shell) are evaluated before the
+                command, such that it sees that shell's environment.
 
         Returns:
             The command run, along with its return code, ``stdout``,
             ``stderr``, start/stop time, and duration.
         """
-        milliseconds_per_second = 10**3
-        start = round(time() * milliseconds_per_second)
-
-        # Wrap the `command` in {braces} to support newlines and
-        # heredocs to tell the shell "this is one giant statement".
-        # Then run the command.
-        if kwargs.get("devnull_stdin"):
-            os.write(
-                self.aux_stdin_wfd, f"{{\n{command}\n}} </dev/null\n".encode()
-            )
-        else:
-            os.write(self.aux_stdin_wfd, f"{{\n{command}\n}}\n".encode())
-
-        # Set the `RET_CODE` environment variable, such that we can
-        # access it later.
-        os.write(self.aux_stdin_wfd, "RET_CODE=$?\n".encode())
-
-        # Because these writes are non-blocking, tell the shell that the
-        # writes are complete.
-        os.write(self.aux_stdin_wfd, "printf '\\4'\n".encode())
-        os.write(self.aux_stdin_wfd, "printf '\\4' 1>&2\n".encode())
+        start, nonce = self._submit(command, **kwargs)
 
         # Tee the output to multiple sinks (files, strings,
         # `stdout`/`stderr`).
@@ -198,125 +310,343 @@ class Shell:
             output = self.tee(
                 self.shell_subprocess.stdout,
                 self.shell_subprocess.stderr,
+                marker=nonce.encode(),
+                engine=self.tee_engine,
                 **kwargs,
             )
+        except EOFError:
+            raise self._exited(command) from None
+        return self._completed(command, output, start)
+
+    async def async_run(self, command: str, **kwargs) -> SimpleNamespace:
+        """
+        Run a command in the underlying shell without blocking.
+
+        This is the same as :func:`run`, but the shell's ``stdout`` and
+        ``stderr`` are read by the running event loop's readers, so many
+        shells can run commands concurrently on a single thread.
+        Coroutines sharing a shell must hold its :func:`async_lock`.
+
+        Parameters:
+            command:  The command to run in the shell subprocess.
+            **kwargs:  Any additional arguments to pass to
+                :func:`async_tee`, along with an optional ``pwd`` (see
+                :func:`run`).
+
+        Returns:
+            The command run, along with its return code, ``stdout``,
+            ``stderr``, start/stop time, and duration.
+        """
+        start, nonce = self._submit(command, **kwargs)
+        try:
+            output = await self.async_tee(
+                marker=nonce.encode(), engine=self.tee_engine, **kwargs
+            )
+        except EOFError:
+            raise self._exited(command) from None
+        return self._completed(command, output, start)
+
+    def _submit(self, command: str, **kwargs) -> Tuple[int, str]:
+        """
+        Write a command, followed by its trailers, to the shell.
+
+        Parameters:
+            command:  The command to run in the shell subprocess.
+            **kwargs:  Any additional arguments passed to :func:`run`.
+
+        Returns:
+            The time the command was submitted (in milliseconds since
+            the epoch), and the nonce starting its trailers.
+        """
+        start = round(time() * MILLISECONDS_PER_SECOND)
+        nonce = secrets.token_hex(16)
 
-        # Note:  If something goes wrong in `tee()`, the only way to reliably
-        # propagate an exception from a thread that's spawned is to raise a
-        # KeyboardInterrupt.
-        except KeyboardInterrupt:
-            os.close(self.aux_stdin_wfd)
-            message = (
-                f"There was a problem running the command `{command}`.  "
-                "This is a fatal error and we cannot continue.  Ensure that "
-                "the syntax of the command is correct."
+        # Record the start time (if the shell supports
+        # `EPOCHREALTIME`), and then wrap the `command` in {braces} to
+        # support newlines and heredocs to tell the shell "this is one
+        # giant statement" (or in (parentheses) to run it in a subshell,
+        # if requested).  If the command is to be run elsewhere,
+        # change to that directory first (failing the command if that
+        # fails), and change back afterwards.  If given, evaluate the
+        # `exports` before the command (keeping the `PWD` of the
+        # directory it's actually in).  Then set the `RET_CODE`
+        # environment variable, and write the trailers, each ending with
+        # the nonce again, as the working directory may contain
+        # newlines.
+        redirect = " </dev/null" if kwargs.get("devnull_stdin") else ""
+        begin, end = ("(", ")") if kwargs.get("subshell") else ("{", "}")
+        prologue, epilogue = "", ""
+        if kwargs.get("pwd"):
+            prologue = (
+                "SHELL_LOGGER_PWD=$PWD\n"
+                f"cd -- {shlex.quote(str(kwargs['pwd']))} &&\n"
             )
-            raise RuntimeError(message) from None
-        finish = round(time() * milliseconds_per_second)
+            epilogue = 'cd -- "$SHELL_LOGGER_PWD" 2>/dev/null\n'
+        if kwargs.get("exports"):
+            begin += (
+                "\nSHELL_LOGGER_HERE=$PWD\n"
+                f"eval {shlex.quote(kwargs['exports'])} 2>/dev/null\n"
+                "PWD=$SHELL_LOGGER_HERE"
+            )
+        os.write(
+            self.aux_stdin_wfd,
+            (
+                "SHELL_LOGGER_START=${EPOCHREALTIME:-}\n"
+                f"{prologue}{begin}\n{command}\n{end}{redirect}\n"
+                "RET_CODE=$?\n"
+                f"{epilogue}"
+                f"printf '{nonce}{nonce}\\n' 1>&2\n"
+                f"printf '{nonce}:%s:%s:%s:%s{nonce}\\n' "
+                '"$RET_CODE" "$SHELL_LOGGER_START" "${EPOCHREALTIME:-}" '
+                '"$PWD"\n'
+            ).encode(),
+        )
+        return start, nonce
+
+    def _exited(self, command: str) -> RuntimeError:
+        """
+        Handle the shell exiting while running a command.
+
+        If the shell exits (e.g., due to a syntax error), its pipes are
+        closed before the trailer is written.
+
+        Parameters:
+            command:  The command that was being run.
+
+        Returns:
+            The error to raise.
+        """
+        os.close(self.aux_stdin_wfd)
+        message = (
+            f"There was a problem running the command `{command}`.  "
+            "This is a fatal error and we cannot continue.  Ensure that "
+            "the syntax of the command is correct."
+        )
+        return RuntimeError(message)
+
+    def _completed(
+        self, command: str, output: SimpleNamespace, start: int
+    ) -> SimpleNamespace:
+        """
+        Summarize a command once its trailers have been read.
+
+        This also records the directory the command left the shell in
+        as :attr:`last_pwd`.
 
-        # Pull the return code and return the results.  Note that if the
-        # command executed spawns a sub-shell, you won't really have a
-        # return code.
-        aux_out, _ = self.auxiliary_command(posix="echo $RET_CODE")
+        Parameters:
+            command:  The command that was run.
+            output:  The output of :func:`tee`.
+            start:  The time the command was submitted (in milliseconds
+                since the epoch).
+
+        Returns:
+            The command run, along with its return code, ``stdout``,
+            ``stderr``, start/stop time, and duration.
+        """
+        finish = round(time() * MILLISECONDS_PER_SECOND)
+
+        # Pull the return code, timing, and working directory out of the
+        # trailer.  Note that if the command executed spawns a sub-shell,
+        # you won't really have a return code.
+        _, return_code, shell_start, shell_finish, pwd, *_ = [
+            *output.trailer.decode(errors="ignore").split(":", 4),
+            "",
+            "",
+            "",
+            "",
+        ]
+        self.last_pwd = pwd or self.last_pwd
         try:
-            return_code = int(aux_out)
+            return_code = int(return_code)
         except ValueError:
             return_code = "N/A"
+        if shell_start and shell_finish:
+            start, finish = (
+                round(float(t.replace(",", ".")) * MILLISECONDS_PER_SECOND)
+                for t in (shell_start, shell_finish)
+            )
         return SimpleNamespace(
             returncode=return_code,
             args=command,
             stdout=output.stdout_str,
             stderr=output.stderr_str,
+            stdout_bytes=output.stdout_bytes,
+            stderr_bytes=output.stderr_bytes,
             start=start,
             finish=finish,
             wall=finish - start,
         )
 
     @staticmethod
-    def tee(  # noqa: C901
-        stdout: Optional[IO[bytes]], stderr: Optional[IO[bytes]], **kwargs
+    def tee(
+        stdout: Optional[IO[bytes]],
+        stderr: Optional[IO[bytes]],
+        *,
+        marker: bytes,
+        engine: Optional[TeeEngine] = None,
+        **kwargs,
     ) -> SimpleNamespace:
         """
         Write output/error streams to multiple files.
 
         Split ``stdout`` and ``stderr`` file objects to write to
-        multiple files.
+        multiple files.  The stream files receive the raw bytes
+        unchanged; the output is decoded only once, and only if it's
+        needed for the console or the returned strings.  When a stream
+        file is the only sink for a stream, the output is moved into it
+        with ``splice()`` (where supported), without passing through
+        Python at all.
 
         Parameters:
             stdout:  The ``stdout`` file object to be split.
             stderr:  The ``stderr`` file object to be split.
+            marker:  The sequence of bytes marking the start of the
+                trailer that ends each stream.  The trailer runs from
+                the ``marker`` through the next ``marker`` followed by a
+                newline.
+            engine:  The :class:`TeeEngine` reading ``stdout`` and
+                ``stderr``.  If omitted, one is created for this call.
             **kwargs:  Additional arguments.
 
         Returns:
-            The ``stdout`` and ``stderr`` as strings.
+            The ``stdout`` and ``stderr`` as strings, along with the
+            ``stdout`` trailer (minus the ``marker`` s and newline), and
+            the number of bytes of output on each stream.
+
+        Raises:
+            EOFError:  If either stream is closed before its trailer is
+                found.
 
         Todo:
           * Replace ``**kwargs`` with function arguments.
         """
+        if engine is None:
+            engine = TeeEngine(stdout.fileno(), stderr.fileno())
+        with Shell._tee_sinks(**kwargs) as sinks:
+            engine.run(marker, sinks.stdout, sinks.stderr)
+            return Shell._tee_output(engine, sinks)
+
+    @staticmethod
+    async def async_tee(
+        *, marker: bytes, engine: TeeEngine, **kwargs
+    ) -> SimpleNamespace:
+        """
+        Write output/error streams to multiple files without blocking.
+
+        This is the same as :func:`tee`, but the streams are read by the
+        running event loop's readers.
+
+        Parameters:
+            marker:  The sequence of bytes marking the start of the
+                trailer that ends each stream.
+            engine:  The :class:`TeeEngine` reading ``stdout`` and
+                ``stderr``.
+            **kwargs:  Additional arguments.
+
+        Returns:
+            The ``stdout`` and ``stderr`` as strings, along with the
+            ``stdout`` trailer (minus the ``marker`` s and newline), and
+            the number of bytes of output on each stream.
+
+        Raises:
+            EOFError:  If either stream is closed before its trailer is
+                found.
+        """
+        with Shell._tee_sinks(**kwargs) as sinks:
+            await engine.async_run(marker, sinks.stdout, sinks.stderr)
+            return Shell._tee_output(engine, sinks)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _tee_sinks(**kwargs) -> Iterator[SimpleNamespace]:
+        """
+        Open the sinks a command's output should be split between.
+
+        Parameters:
+            **kwargs:  The arguments passed to :func:`tee`.
+
+        Yields:
+            The binary and text sinks for ``stdout`` and ``stderr``,
+            along with the ``StringIO`` objects capturing them, if
+            requested.  The stream files are closed afterwards.
+        """
         sys_stdout = None if kwargs.get("quiet_stdout") else sys.stdout
         sys_stderr = None if kwargs.get("quiet_stderr") else sys.stderr
         stdout_io = StringIO() if kwargs.get("stdout_str") else None
         stderr_io = StringIO() if kwargs.get("stderr_str") else None
-        stdout_path = kwargs.get("stdout_path", Path(os.devnull)).open("a")
-        stderr_path = kwargs.get("stderr_path", Path(os.devnull)).open("a")
-        stdout_tee = [sys_stdout, stdout_io, stdout_path]
-        stderr_tee = [sys_stderr, stderr_io, stderr_path]
-
-        def write(input_file: TextIO, output_files: List[TextIO]) -> None:
-            """
-            Write an input to multiple outputs.
-
-            Take the data from an input file object and write it to
-            multiple output file objects.
-
-            Parameters:
-                input_file:  The file object from which to read.
-                output_files:  A list of file objects to write to.
-            """
-            # Read chunks from the input file.
-            chunk_size = 4096  # 4 KB
-            chunk = os.read(input_file.fileno(), chunk_size)
-            while chunk and chunk[-1] != END_OF_READ:
-                for output_file in output_files:
-                    if output_file is not None:
-                        output_file.write(chunk.decode(errors="ignore"))
-                chunk = os.read(input_file.fileno(), chunk_size)
-
-            # If something goes wrong in the `tee()`, the only way to
-            # reliably propagate an exception from a thread that's
-            # spawned is to raise a KeyboardInterrupt.
-            if not chunk:
-                _thread.interrupt_main()
-
-            # Remove the end-of-transmission character, and write the
-            # last chunk.
-            chunk = chunk[:-1]
-            for output_file in output_files:
-                if output_file is not None:
-                    output_file.write(chunk.decode(errors="ignore"))
-
-        # Spawn threads to write to `stdout` and `stderr`.
-        threads = [
-            Thread(target=write, args=(stdout, stdout_tee)),
-            Thread(target=write, args=(stderr, stderr_tee)),
-        ]
-        for thread in threads:
-            thread.daemon = True
-            thread.start()
-        for thread in threads:
-            thread.join()
-        stdout_str = stdout_io.getvalue() if stdout_io is not None else None
-        stderr_str = stderr_io.getvalue() if stderr_io is not None else None
-
-        # Close any open file descriptors and return the `stdout` and
-        # `stderr`.
-        for file in stdout_tee + stderr_tee:
-            if (
-                file not in [None, sys.stdout, sys.stderr, sys.stdin]
-                and not file.closed
-            ):
+        stdout_path = kwargs.get("stdout_path")
+        stderr_path = kwargs.get("stderr_path")
+        stdout_text = [f for f in [sys_stdout, stdout_io] if f is not None]
+        stderr_text = [f for f in [sys_stderr, stderr_io] if f is not None]
+        stdout_files = (
+            [Shell._open_stream_file(stdout_path, only_sink=not stdout_text)]
+            if stdout_path
+            else []
+        )
+        stderr_files = (
+            [Shell._open_stream_file(stderr_path, only_sink=not stderr_text)]
+            if stderr_path
+            else []
+        )
+        try:
+            yield SimpleNamespace(
+                stdout=(stdout_files, stdout_text),
+                stderr=(stderr_files, stderr_text),
+                stdout_io=stdout_io,
+                stderr_io=stderr_io,
+            )
+        finally:
+            for file in stdout_files + stderr_files:
                 file.close()
-        return SimpleNamespace(stdout_str=stdout_str, stderr_str=stderr_str)
+
+    @staticmethod
+    def _tee_output(
+        engine: TeeEngine, sinks: SimpleNamespace
+    ) -> SimpleNamespace:
+        """
+        Collect the results of splitting a command's output.
+
+        Parameters:
+            engine:  The :class:`TeeEngine` that read the output.
+            sinks:  The sinks from :func:`_tee_sinks`.
+
+        Returns:
+            The ``stdout`` and ``stderr`` as strings, along with the
+            ``stdout`` trailer (minus the ``marker`` s and newline), and
+            the number of bytes of output on each stream.
+        """
+        return SimpleNamespace(
+            stdout_str=sinks.stdout_io.getvalue() if sinks.stdout_io else None,
+            stderr_str=sinks.stderr_io.getvalue() if sinks.stderr_io else None,
+            trailer=engine.stdout.trailer,
+            stdout_bytes=engine.stdout.byte_count,
+            stderr_bytes=engine.stderr.byte_count,
+        )
+
+    @staticmethod
+    def _open_stream_file(path: Path, *, only_sink: bool) -> BinaryIO:
+        """
+        Open a file to append a stream's raw output to.
+
+        Parameters:
+            path:  The file to open.
+            only_sink:  Whether or not the file is the only place the
+                stream is written to.
+
+        Returns:
+            The opened file.  If the file is the only sink and
+            ``splice()`` is available, it's opened unbuffered, for
+            reading as well as writing, and positioned at its end,
+            rather than in append mode, because the kernel can't
+            ``splice()`` into a file opened for appending.
+        """
+        if not (only_sink and ZERO_COPY):
+            return path.open("ab")
+        file = os.fdopen(
+            os.open(path, os.O_RDWR | os.O_CREAT, 0o666), "r+b", 0
+        )
+        file.seek(0, os.SEEK_END)
+        return file
 
     def auxiliary_command(
         self, **kwargs
@@ -373,3 +703,520 @@ class Shell:
                 if stderr:
                     stderr = stderr.strip()
         return stdout, stderr
+
+    def refresh_aux(self, keys: Optional[Iterable[str]] = None) -> None:
+        """
+        Forget cached auxiliary information.
+
+        Parameters:
+            keys:  The keys to forget.  If omitted, the whole
+                :attr:`aux_cache` is cleared.
+        """
+        if keys is None:
+            self.aux_cache.clear()
+        for key in keys or ():
+            self.aux_cache.pop(key, None)
+        if not self.aux_cache:
+            self.aux_cache_time = None
+
+    def auxiliary_commands(
+        self,
+        commands: Mapping[str, str],
+        *,
+        strip: Iterable[str] = (),
+        pwd: Optional[Path] = None,
+    ) -> Tuple[Dict[str, str], str]:
+        """
+        Run a batch of auxiliary commands in a single round trip.
+
+        All the ``commands`` are written to the shell at once, and their
+        output is framed on the auxiliary ``stdout`` by delimiter lines
+        containing a random nonce, such that the output of one command
+        can't be mistaken for the delimiter of another.
+
+        Parameters:
+            commands:  A mapping from a key (used in the returned
+                ``dict``) to the command to run.  The keys must consist
+                of letters, digits, and underscores.
+            strip:  The keys whose output should have leading and
+                trailing whitespace stripped.
+            pwd:  The directory in which to run the commands, if not
+                the shell's working directory.  They're run in a
+                subshell, such that the shell itself stays put.
+
+        Returns:
+            A mapping from each key to the ``stdout`` of the
+            corresponding command, along with the combined ``stderr`` of
+            all the commands.
+        """
+        nonce = self._submit_auxiliary(commands, pwd=pwd)
+        terminator = f"\n{nonce}.\n".encode()
+        stdout = self._read_until(self.aux_stdout_rfd, terminator)
+        stderr = self._read_until(self.aux_stderr_rfd, terminator)
+        return self._split_auxiliary(nonce, stdout, stderr, strip)
+
+    async def async_auxiliary_commands(
+        self,
+        commands: Mapping[str, str],
+        *,
+        strip: Iterable[str] = (),
+        pwd: Optional[Path] = None,
+    ) -> Tuple[Dict[str, str], str]:
+        """
+        Run a batch of auxiliary commands without blocking.
+
+        This is the same as :func:`auxiliary_commands`, but the
+        auxiliary pipes are read by the running event loop's readers.
+
+        Parameters:
+            commands:  A mapping from a key (used in the returned
+                ``dict``) to the command to run.
+            strip:  The keys whose output should have leading and
+                trailing whitespace stripped.
+            pwd:  The directory in which to run the commands, if not
+                the shell's working directory.
+
+        Returns:
+            A mapping from each key to the ``stdout`` of the
+            corresponding command, along with the combined ``stderr`` of
+            all the commands.
+        """
+        nonce = self._submit_auxiliary(commands, pwd=pwd)
+        terminator = f"\n{nonce}.\n".encode()
+        stdout = await self._async_read_until(self.aux_stdout_rfd, terminator)
+        stderr = await self._async_read_until(self.aux_stderr_rfd, terminator)
+        return self._split_auxiliary(nonce, stdout, stderr, strip)
+
+    def _submit_auxiliary(
+        self, commands: Mapping[str, str], *, pwd: Optional[Path] = None
+    ) -> str:
+        """
+        Write a batch of auxiliary commands to the shell.
+
+        Parameters:
+            commands:  A mapping from a key to the command to run.
+            pwd:  The directory in which to run the commands, if not
+                the shell's working directory.
+
+        Returns:
+            The nonce used in the delimiters framing the output.
+        """
+        nonce = secrets.token_hex(16)
+        script = "{\n"
+        if pwd:
+            script = f"(\ncd -- {shlex.quote(str(pwd))} 2>/dev/null\n"
+        for key, command in commands.items():
+            script += f"printf '\\n{nonce}:{key}\\n'\n{command}\n"
+        script += f"printf '\\n{nonce}.\\n'\n"
+        script += f"printf '\\n{nonce}.\\n' 1>&2\n"
+        script += ")" if pwd else "}"
+        script += f" 1>&{self.aux_stdout_wfd} 2>&{self.aux_stderr_wfd}\n"
+        os.write(self.aux_stdin_wfd, script.encode())
+        return nonce
+
+    @staticmethod
+    def _split_auxiliary(
+        nonce: str, stdout: bytes, stderr: bytes, strip: Iterable[str]
+    ) -> Tuple[Dict[str, str], str]:
+        """
+        Split the output of a batch of auxiliary commands.
+
+        Parameters:
+            nonce:  The nonce used in the delimiters framing the output.
+            stdout:  The auxiliary ``stdout``, through the terminator.
+            stderr:  The auxiliary ``stderr``, through the terminator.
+            strip:  The keys whose output should have leading and
+                trailing whitespace stripped.
+
+        Returns:
+            A mapping from each key to the ``stdout`` of the
+            corresponding command, along with the combined ``stderr`` of
+            all the commands.
+        """
+        terminator = f"\n{nonce}.\n"
+
+        # Split the `stdout` on the delimiters.  Each section starts with
+        # the key, followed by a newline, and then the command's output.
+        stdout = stdout.decode(errors="ignore")[: -len(terminator)]
+        results = {}
+        for section in stdout.split(f"\n{nonce}:")[1:]:
+            key, _, value = section.partition("\n")
+            results[key] = value.strip() if key in strip else value
+        stderr = stderr.decode(errors="ignore")[: -len(terminator)]
+        return results, stderr
+
+    @staticmethod
+    def _read_until(fd: int, terminator: bytes) -> bytes:
+        """
+        Read from a file descriptor until a terminator is seen.
+
+        Parameters:
+            fd:  The file descriptor to read from.
+            terminator:  The sequence of bytes marking the end of what
+                should be read.
+
+        Returns:
+            Everything read, including the ``terminator``.
+        """
+        max_anonymous_pipe_buffer_size = 65536
+        data = bytearray()
+        while not data.endswith(terminator):
+            chunk = os.read(fd, max_anonymous_pipe_buffer_size)
+            if not chunk:
+                message = "The shell closed its auxiliary pipes unexpectedly."
+                raise RuntimeError(message)
+            data += chunk
+        return bytes(data)
+
+    @staticmethod
+    async def _async_read_until(fd: int, terminator: bytes) -> bytes:
+        """
+        Read from a file descriptor until a terminator is seen.
+
+        This is the same as :func:`_read_until`, but the file
+        descriptor is only read when the running event loop reports it's
+        readable.
+
+        Parameters:
+            fd:  The file descriptor to read from.
+            terminator:  The sequence of bytes marking the end of what
+                should be read.
+
+        Returns:
+            Everything read, including the ``terminator``.
+        """
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+        max_anonymous_pipe_buffer_size = 65536
+        data = bytearray()
+
+        def on_readable() -> None:
+            chunk = os.read(fd, max_anonymous_pipe_buffer_size)
+            if not chunk:
+                message = "The shell closed its auxiliary pipes unexpectedly."
+                finished.set_exception(RuntimeError(message))
+                loop.remove_reader(fd)
+                return
+            data.extend(chunk)
+            if data.endswith(terminator):
+                finished.set_result(bytes(data))
+                loop.remove_reader(fd)
+
+        loop.add_reader(fd, on_readable)
+        try:
+            return await finished
+        finally:
+            loop.remove_reader(fd)
+
+
+class TeeStream:
+    """
+    Track one of the streams being split by a :class:`TeeEngine`.
+
+    Attributes:
+        fd (int):  The file descriptor being read.
+        marker (bytes):  The sequence of bytes marking the start of the
+            trailer that ends the output of the current command.
+        files (List[BinaryIO]):  The binary file objects to write the
+            raw output to.
+        text (List[TextIO]):  The text file objects to write the decoded
+            output to.
+        decoder (codecs.IncrementalDecoder):  The UTF-8 decoder used
+            for the ``text`` sinks, which holds on to any multibyte
+            characters split across reads.
+        zero_copy (bool):  Whether or not the output is moved
+            straight from the stream into its only sink, a file, with
+            ``splice()``, rather than being read into Python.
+        start (int):  Where the output of the current command begins in
+            the file, when using ``splice()``.
+        tail (bytes):  The end of what's been read that might contain
+            the start of the ``marker``, and so hasn't been written yet.
+        trailer (Optional[bytes]):  The trailer (minus the ``marker`` s
+            and newline), once it's been found.
+        byte_count (int):  The number of bytes of output written to the
+            sinks for the current command.
+    """
+
+    def __init__(self, fd: int) -> None:
+        """
+        Initialize a :class:`TeeStream` object.
+
+        Parameters:
+            fd:  The file descriptor to read.
+        """
+        self.fd = fd
+        self.reset(b"\n", ([], []))
+
+    def reset(
+        self, marker: bytes, sinks: Tuple[List[BinaryIO], List[TextIO]]
+    ) -> None:
+        """
+        Prepare to read the output of a new command.
+
+        Parameters:
+            marker:  The sequence of bytes marking the start of the
+                trailer.
+            sinks:  The binary file objects to write the raw output to,
+                and the text file objects to write the decoded output
+                to.
+        """
+        self.marker = marker
+        self.files, self.text = sinks
+        self.zero_copy = ZERO_COPY and len(self.files) == 1 and not self.text
+        self.start = self.files[0].tell() if self.zero_copy else 0
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self.tail = b""
+        self.trailer = None
+        self.byte_count = 0
+
+    @property
+    def done(self) -> bool:
+        """Whether or not the trailer has been found."""
+        return self.trailer is not None
+
+    def read(self, buffer: bytearray) -> int:
+        """
+        Move whatever output is available from the stream to the sinks.
+
+        Parameters:
+            buffer:  The buffer to read into, if the output can't be
+                moved with ``splice()``.
+
+        Returns:
+            The number of bytes read, where zero means the stream has
+            been closed.
+        """
+        if self.zero_copy:
+            try:
+                return self.splice()
+            except OSError as error:
+                if error.errno not in (errno.EINVAL, errno.ENOSYS):
+                    raise
+                self.zero_copy = False
+        bytes_read = os.readv(self.fd, [buffer])
+        with memoryview(buffer) as view:
+            self.feed(view[:bytes_read])
+        return bytes_read
+
+    def splice(self) -> int:
+        """
+        Move output from the stream straight into the file sink.
+
+        The data stays in the kernel, so the ``marker`` is found by
+        reading back just the end of the file.  Nothing follows the
+        trailer until the next command is run, so once the file ends
+        with the ``marker`` and a newline, the trailer is complete, and
+        it's truncated off the end of the file.  The trailer ends with
+        the working directory, which can be arbitrarily long, so the
+        end of the file is read back further, as needed, until the
+        ``marker`` starting the trailer is found.
+
+        Returns:
+            The number of bytes moved, where zero means the stream has
+            been closed.
+        """
+        fd = self.files[0].fileno()
+        bytes_moved = os.splice(self.fd, fd, TEE_BUFFER_SIZE)
+        self.byte_count += bytes_moved
+        end = self.start + self.byte_count
+        terminator = self.marker + b"\n"
+        window = min(self.byte_count, 2 * len(self.marker) + TRAILER_SIZE)
+        tail = os.pread(fd, window, end - window)
+        if not tail.endswith(terminator):
+            return bytes_moved
+        closing = len(tail) - len(terminator)
+        index = tail.find(self.marker)
+        while index == closing and window < self.byte_count:
+            window = min(self.byte_count, 2 * window)
+            tail = os.pread(fd, window, end - window)
+            closing = len(tail) - len(terminator)
+            index = tail.find(self.marker)
+        if index == closing:
+            return bytes_moved
+        self.byte_count -= window - index
+        os.ftruncate(fd, self.start + self.byte_count)
+        os.lseek(fd, self.start + self.byte_count, os.SEEK_SET)
+        self.trailer = tail[index + len(self.marker) : closing]
+        return bytes_moved
+
+    def feed(self, data: Union[bytes, memoryview]) -> None:
+        """
+        Process data read from the stream.
+
+        Write everything up to the trailer to the sinks.  Hold back
+        enough of the end of the data to contain a partial ``marker``,
+        or, once the ``marker`` is found, until the rest of the trailer
+        (through the ``marker`` again and a newline) arrives.
+
+        Parameters:
+            data:  The data read from the stream.
+        """
+        pending = self.tail + data
+        index = pending.find(self.marker)
+        if index < 0:
+            split = max(len(pending) - len(self.marker) + 1, 0)
+            self.write(pending[:split])
+            self.tail = pending[split:]
+            return
+        end = pending.find(self.marker + b"\n", index + len(self.marker))
+        if end < 0:
+            self.tail = pending
+            return
+        self.write(pending[:index], final=True)
+        self.tail = b""
+        self.trailer = pending[index + len(self.marker) : end]
+
+    def write(self, data: bytes, *, final: bool = False) -> None:
+        """
+        Write output to all the sinks.
+
+        Parameters:
+            data:  The output to write.
+            final:  Whether or not this is the last of the output, in
+                which case the decoder is flushed.
+        """
+        self.byte_count += len(data)
+        for file in self.files:
+            file.write(data)
+        if self.text and (data or final):
+            text = self.decoder.decode(data, final=final)
+            for file in self.text:
+                file.write(text)
+
+
+class TeeEngine:
+    """
+    Split a shell's ``stdout`` and ``stderr`` between multiple sinks.
+
+    A single reader, driven by a selector (e.g., ``epoll``), multiplexes
+    both streams on the calling thread, reading into one reusable
+    buffer.  The engine is meant to live as long as the :class:`Shell`,
+    such that running a command doesn't spawn any threads.
+
+    Attributes:
+        selector (selectors.BaseSelector):  The selector used to wait
+            for output.
+        buffer (bytearray):  The buffer reads are done into, when the
+            output can't be moved with ``splice()``.
+        stdout (TeeStream):  The state of the ``stdout`` stream.
+        stderr (TeeStream):  The state of the ``stderr`` stream.
+    """
+
+    def __init__(
+        self,
+        stdout_fd: int,
+        stderr_fd: int,
+        buffer_size: int = TEE_BUFFER_SIZE,
+    ) -> None:
+        """
+        Initialize a :class:`TeeEngine` object.
+
+        Parameters:
+            stdout_fd:  The file descriptor for ``stdout``.
+            stderr_fd:  The file descriptor for ``stderr``.
+            buffer_size:  The maximum number of bytes per read.
+        """
+        self.selector = selectors.DefaultSelector()
+        self.buffer = bytearray(buffer_size)
+        self.stdout = TeeStream(stdout_fd)
+        self.stderr = TeeStream(stderr_fd)
+
+    def run(
+        self,
+        marker: bytes,
+        stdout_sinks: Tuple[List[BinaryIO], List[TextIO]],
+        stderr_sinks: Tuple[List[BinaryIO], List[TextIO]],
+    ) -> None:
+        """
+        Split the output of a command.
+
+        Read from ``stdout`` and ``stderr`` as output becomes available,
+        until the trailer is found on both.
+
+        Parameters:
+            marker:  The sequence of bytes marking the start of the
+                trailer that ends each stream.
+            stdout_sinks:  The binary and text file objects to write
+                ``stdout`` to.
+            stderr_sinks:  The binary and text file objects to write
+                ``stderr`` to.
+
+        Raises:
+            EOFError:  If either stream is closed before its trailer is
+                found.
+        """
+        self.stdout.reset(marker, stdout_sinks)
+        self.stderr.reset(marker, stderr_sinks)
+        for stream in (self.stdout, self.stderr):
+            self.selector.register(stream.fd, selectors.EVENT_READ, stream)
+        try:
+            while self.selector.get_map():
+                for key, _ in self.selector.select():
+                    stream = key.data
+                    if stream.read(self.buffer) == 0:
+                        message = "The stream closed before its trailer."
+                        raise EOFError(message)
+                    if stream.done:
+                        self.selector.unregister(stream.fd)
+        finally:
+            for stream in (self.stdout, self.stderr):
+                with contextlib.suppress(KeyError):
+                    self.selector.unregister(stream.fd)
+
+    async def async_run(
+        self,
+        marker: bytes,
+        stdout_sinks: Tuple[List[BinaryIO], List[TextIO]],
+        stderr_sinks: Tuple[List[BinaryIO], List[TextIO]],
+    ) -> None:
+        """
+        Split the output of a command without blocking.
+
+        This is the same as :func:`run`, but the streams are read by
+        the running event loop's readers instead of the engine's own
+        selector, so other coroutines run while the command does.
+
+        Parameters:
+            marker:  The sequence of bytes marking the start of the
+                trailer that ends each stream.
+            stdout_sinks:  The binary and text file objects to write
+                ``stdout`` to.
+            stderr_sinks:  The binary and text file objects to write
+                ``stderr`` to.
+
+        Raises:
+            EOFError:  If either stream is closed before its trailer is
+                found.
+        """
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+        self.stdout.reset(marker, stdout_sinks)
+        self.stderr.reset(marker, stderr_sinks)
+        streams = (self.stdout, self.stderr)
+
+        def fail(error: Exception) -> None:
+            finished.set_exception(error)
+            for each in streams:
+                loop.remove_reader(each.fd)
+
+        def on_readable(stream: TeeStream) -> None:
+            try:
+                bytes_read = stream.read(self.buffer)
+            except OSError as error:
+                fail(error)
+                return
+            if bytes_read == 0:
+                fail(EOFError("The stream closed before its trailer."))
+                return
+            if stream.done:
+                loop.remove_reader(stream.fd)
+                if all(each.done for each in streams):
+                    finished.set_result(None)
+
+        for stream in streams:
+            loop.add_reader(stream.fd, on_readable, stream)
+        try:
+            await finished
+        finally:
+            for stream in streams:
+                loop.remove_reader(stream.fd)
@@ -8,34 +8,82 @@
 
 from __future__ import annotations
 
+import concurrent.futures
+import hashlib
 import json
 import os
 import random
 import shutil
 import string
 import tempfile
+import threading
 from collections.abc import Iterable, Mapping
 from datetime import datetime, timedelta
 from distutils import dir_util
 from pathlib import Path
+from time import monotonic
 from types import SimpleNamespace
-from typing import Iterator, List, Optional, Union
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+    Union,
+)
 
 from .html_utilities import (
-    append_html,
+    DEFAULT_BUFFER_SIZE,
+    MAX_LINE_WIDTH,
     child_logger_card,
+    child_logger_card_parts,
+    child_logger_duration_update,
     closing_html_text,
     command_card,
+    flatten,
     html_message_card,
     message_card,
     nested_simplenamespace_to_dict,
     opening_html_text,
     parent_logger_card_html,
+    parent_logger_card_parts,
+    relative_url,
+    schedule_card,
+    write_assets,
+    write_html,
 )
 from .shell import Shell
+from .shell_pool import ShellPool, warm_shell_pool
 from .stats_collector import stats_collectors
 from .trace import trace_collector
 
+AUXILIARY_COMMANDS = {
+    "pwd": "pwd",
+    "environment": "env",
+    "umask": "umask",
+    "hostname": "hostname",
+    "user": "whoami",
+    "group": "id -gn",
+    "shell": "printenv SHELL",
+    "ulimit": "ulimit -a",
+}
+STRIPPED_AUXILIARY_KEYS = [
+    "pwd",
+    "umask",
+    "hostname",
+    "user",
+    "group",
+    "shell",
+]
+INVARIANT_AUXILIARY_KEYS = ["hostname", "user", "group", "shell", "ulimit"]
+ULIMIT_POLICIES = ["invalidate", "volatile", "cache"]
+
+# Bump this whenever the HTML rendered for a log entry changes, such
+# that cached fragments from older versions aren't reused.
+HTML_FRAGMENT_VERSION = 3
+
 
 class ShellLogger:
     """
@@ -94,7 +142,37 @@ class ShellLogger:
             :class:`ShellLogger`, updated when the :func:`finalize`
             method is called.
         shell (Shell):  The :class:`Shell` in which all commands will be
-            run when logging.
+            run when logging.  It's spawned the first time it's needed,
+            so loading or re-rendering a log doesn't start any
+            processes.
+        aux_store (dict):  A mapping from content hashes to the
+            environment and ``ulimit`` text captured when running
+            commands.  Each distinct value is stored only once, and the
+            log entries refer to it by hash.  This is shared between a
+            parent and all its children.
+        diff_environment (bool):  Whether or not to record, with each
+            command, how its environment differs from that of the
+            previous command.
+        max_workers (int):  The maximum number of commands submitted
+            via :func:`submit` or :func:`log_many` to run concurrently.
+        live_html (bool):  Whether or not the HTML log file is written
+            as the :class:`ShellLogger` runs, rather than all at once
+            when it's finalized.
+        minify_html (bool):  Whether or not to leave the cosmetic
+            whitespace (e.g., indentation) out of the HTML log file.
+        html_buffer_size (int):  The size (in bytes) of the buffer used
+            when writing the HTML log file.
+        collapse_progress (bool):  Whether or not to collapse output
+            redrawn in place (e.g., by progress bars) to its final state
+            in the HTML log file.
+        max_line_width (int | None):  The number of characters of each
+            line of output shown in the HTML log file before the rest is
+            hidden, to be expanded on demand.
+        output_budget (tuple[int, int] | None):  How many lines at the
+            start and end of each command's ``stdout`` and ``stderr``
+            are shown in the HTML log file, if not all of them.
+        asset_dir (Path | None):  The directory of styles and scripts
+            shared by HTML log files, if they're not embedded in each.
     """
 
     @staticmethod
@@ -130,7 +208,7 @@ class ShellLogger:
         with path.open("r") as jf:
             return json.load(jf, cls=ShellLoggerDecoder)
 
-    def __init__(  # noqa: PLR0913
+    def __init__(  # noqa: PLR0913, PLR0915
         self,
         name: str,
         *,
@@ -143,6 +221,18 @@ class ShellLogger:
         init_time: Optional[datetime] = None,
         done_time: Optional[datetime] = None,
         duration: Optional[str] = None,
+        aux_store: Optional[Dict[str, str]] = None,
+        diff_environment: bool = False,
+        max_workers: Optional[int] = None,
+        aux_ttl: Optional[float] = None,
+        ulimit_policy: str = "invalidate",
+        live_html: bool = False,
+        minify_html: bool = False,
+        html_buffer_size: int = DEFAULT_BUFFER_SIZE,
+        collapse_progress: bool = False,
+        max_line_width: Optional[int] = MAX_LINE_WIDTH,
+        output_budget: Optional[Tuple[int, int]] = None,
+        asset_dir: Optional[Path] = None,
     ) -> None:
         """
         Initialize a :class:`ShellLogger` object.
@@ -171,10 +261,84 @@ class ShellLogger:
                 :class:`ShellLogger` was finalized.
             duration:  A string representation of the total duration of
                 the :class:`ShellLogger`.
+            aux_store:  Optionally provide an existing mapping from
+                content hashes to environment and ``ulimit`` text.
+                Parent :class:`ShellLogger` objects give theirs to their
+                children.
+            diff_environment:  Whether or not to record, with each
+                command, how its environment differs from that of the
+                previous command.  Either way, a command card in the
+                HTML log file only shows the environment if it changed;
+                otherwise it links to the earlier card showing it.
+            max_workers:  The maximum number of commands submitted via
+                :func:`submit` or :func:`log_many` to run concurrently,
+                each in its own :class:`Shell`.  Defaults to the number
+                of CPUs.
+            aux_ttl:  How long (in seconds) the auxiliary information
+                that shouldn't change over the life of a :class:`Shell`
+                (e.g., its hostname) is cached before it's fetched
+                again.  If omitted, it's cached until
+                :func:`refresh_aux` is called.
+            ulimit_policy:  How to cache the ``ulimit`` information.
+                ``"invalidate"`` caches it until a command mentioning
+                ``ulimit`` is run, ``"volatile"`` fetches it with every
+                command, and ``"cache"`` treats it like the rest of the
+                invariant information.
+            live_html:  Whether or not to write each entry to the HTML
+                log file as soon as it's done (e.g., when :func:`log`
+                returns), such that the log can be followed while the
+                :class:`ShellLogger` runs, and :func:`finalize` only
+                needs to write what's left.  A child's card is closed
+                when it's finalized, or when its parent logs something
+                after it.  Anything logged to a child after its card is
+                closed shows up when the log is finalized, which then
+                rewrites the whole file.
+            minify_html:  Whether or not to leave the cosmetic
+                whitespace (e.g., indentation) out of the HTML log file,
+                making it smaller and quicker to write.
+            html_buffer_size:  The size (in bytes) of the buffer used
+                when writing the HTML log file.  The whole file is
+                written through a single handle, so a larger buffer
+                means fewer, larger writes.
+            collapse_progress:  Whether or not to collapse the output of
+                each command to what a terminal would show in the HTML
+                log file, i.e., keep only the final state of lines
+                redrawn in place via carriage returns, backspaces, or
+                cursor controls (e.g., by progress bars).  The
+                ``stdout``/``stderr`` stream logs are left untouched,
+                and the number of bytes left out of each is recorded in
+                the command's ``elided_bytes``.
+            max_line_width:  The number of characters of each line of
+                output shown in the HTML log file before the rest is
+                hidden behind a button to show it, such that very long
+                lines (e.g., minified JSON) don't stall the browser.
+                ``None`` shows every line in full.  Output that looks
+                binary is summarized, and links to the stream log,
+                regardless.
+            output_budget:  How many lines at the start and at the end
+                of each command's ``stdout`` and ``stderr`` to show in
+                the HTML log file.  Any lines in between are replaced
+                with a note saying how many were left out, which links
+                to the stream log.  ``None`` shows every line.  This
+                can be overridden for each command (see :func:`log`).
+            asset_dir:  Where to write the styles and scripts used by
+                the HTML log file, such that it links to them rather
+                than embedding them (over 500 KB).  They're named by a
+                hash of their contents, so one directory can be shared
+                by any number of logs, even from different versions of
+                ``shell-logger``.  The links are relative to the
+                :attr:`log_dir`, where the HTML log file is opened from
+                (see :func:`finalize`), so it should be moved along with
+                the ``asset_dir``.  ``None`` embeds them, making the HTML
+                log file self-contained.
+
+        Raises:
+            ValueError:  If the ``ulimit_policy`` isn't one of the
+                above.
 
         Note:
-            The ``log``, ``init_time``, ``done_time``, and ``duration``
-            parameters are mainly used when importing
+            The ``log``, ``init_time``, ``done_time``, ``duration``, and
+            ``aux_store`` parameters are mainly used when importing
             :class:`ShellLogger` objects from a JSON file, and can
             generally be omitted.
         """
@@ -187,7 +351,38 @@ class ShellLogger:
         self.duration = duration
         self.indent = indent
         self.login_shell = login_shell
-        self.shell = Shell(Path.cwd(), login_shell=self.login_shell)
+        self._shell: Optional[Shell] = None
+        self._shell_pwd = Path.cwd()
+        self._shell_owner: Optional[ShellLogger] = None
+        self._shell_user: Optional[ShellLogger] = None
+        self.aux_store = aux_store if aux_store is not None else {}
+        self.diff_environment = diff_environment
+        self.max_workers = max_workers or os.cpu_count() or 1
+        if ulimit_policy not in ULIMIT_POLICIES:
+            message = (
+                f"The `ulimit_policy` must be one of {ULIMIT_POLICIES}, not "
+                f"'{ulimit_policy}'."
+            )
+            raise ValueError(message)
+        self.aux_ttl = aux_ttl
+        self.ulimit_policy = ulimit_policy
+        self.live_html = live_html
+        self.minify_html = minify_html
+        self.html_buffer_size = html_buffer_size
+        self.collapse_progress = collapse_progress
+        self.max_line_width = max_line_width
+        self.output_budget = output_budget
+        self.asset_dir = None if asset_dir is None else asset_dir.resolve()
+        self._parent: Optional[ShellLogger] = None
+        self._html_lock = threading.Lock()
+        self._html_open = False
+        self._html_done = False
+        self._html_written = 0
+        self._html_closed = False
+        self._html_duration_pending = False
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._shell_pool: Optional[ShellPool] = None
+        self._futures: List[concurrent.futures.Future] = []
 
         # Create the log directory, if needed.
         if log_dir is None:
@@ -224,6 +419,25 @@ class ShellLogger:
             else:
                 self.html_file.touch()
 
+    @property
+    def shell(self) -> Shell:
+        """
+        The :class:`Shell` in which commands are run when logging.
+
+        It's leased from the :data:`warm_shell_pool` on first use, and
+        changed to the working directory this :class:`ShellLogger` was
+        created in, unless it's shared with the parent (see
+        :func:`add_child`).
+        """
+        if self._shell_owner is not None:
+            return self._shell_owner.shell
+        if self._shell is None:
+            shell = warm_shell_pool.lease(login_shell=self.login_shell)
+            if shell.last_pwd != str(self._shell_pwd):
+                shell.cd(self._shell_pwd, chdir=False)
+            self._shell = shell
+        return self._shell
+
     def is_parent(self) -> bool:
         """
         Check whether this is a parent logger.
@@ -311,7 +525,22 @@ class ShellLogger:
             if isinstance(log, ShellLogger):
                 log.change_log_dir(self.log_dir)
 
-    def add_child(self, child_name: str) -> ShellLogger:
+    def share_aux_store(self) -> None:
+        """
+        Share the :attr:`aux_store` with all children recursively.
+
+        Any auxiliary text the children already hold is merged into this
+        :class:`ShellLogger` object's :attr:`aux_store` first.
+        """
+        for log in self.log_book:
+            if isinstance(log, ShellLogger):
+                self.aux_store.update(log.aux_store)
+                log.aux_store = self.aux_store
+                log.share_aux_store()
+
+    def add_child(
+        self, child_name: str, *, share_shell: bool = False
+    ) -> ShellLogger:
         """
         Add a child logger.
 
@@ -324,6 +553,15 @@ class ShellLogger:
         Parameters:
             child_name:  The name of the child :class:`ShellLogger`
                 object.
+            share_shell:  Whether the child should run its commands in
+                this :class:`ShellLogger` object's :class:`Shell`,
+                rather than spawning its own, such that a whole tree of
+                loggers only starts one shell (e.g., avoiding sourcing a
+                login profile over and over).  Each logger still keeps
+                its own working directory, but the rest of the shell's
+                state (e.g., environment variables) is shared, and
+                loggers sharing a shell mustn't run commands in it
+                concurrently.
 
         Returns:
             ShellLogger:  A child :class:`ShellLogger` object.
@@ -336,7 +574,22 @@ class ShellLogger:
             html_file=self.html_file,
             indent=(self.indent + 1),
             login_shell=self.login_shell,
+            aux_store=self.aux_store,
+            diff_environment=self.diff_environment,
+            max_workers=self.max_workers,
+            aux_ttl=self.aux_ttl,
+            ulimit_policy=self.ulimit_policy,
+            live_html=self.live_html,
+            minify_html=self.minify_html,
+            html_buffer_size=self.html_buffer_size,
+            collapse_progress=self.collapse_progress,
+            max_line_width=self.max_line_width,
+            output_budget=self.output_budget,
+            asset_dir=self.asset_dir,
         )
+        child._parent = self
+        if share_shell:
+            child._shell_owner = self._shell_owner or self
         self.log_book.append(child)
         return child
 
@@ -387,6 +640,7 @@ class ShellLogger:
         print(msg, end=end)
         log = {"msg": msg, "timestamp": str(datetime.now()), "cmd": None}
         self.log_book.append(log)
+        self._stream_html()
 
     def html_print(self, msg: str, msg_title: str = "HTML Message") -> None:
         """
@@ -403,6 +657,7 @@ class ShellLogger:
             "cmd": None,
         }
         self.log_book.append(log)
+        self._stream_html()
 
     def to_html(self) -> Union[Iterator[str], List[Iterator[str]]]:
         """
@@ -420,6 +675,7 @@ class ShellLogger:
             This lazy evaluation was done to avoid loading *all* the
             data for the log file into memory at once.
         """
+        self._wait_quietly()
         html = []
         for log in self.log_book:
             # If this is a child ShellLogger...
@@ -428,39 +684,160 @@ class ShellLogger:
                 if log.duration is None:
                     log.__update_duration()
                 html.append(child_logger_card(log))
-
-            # Otherwise, if this is a message being logged...
-            elif log["cmd"] is None:
-                if log.get("msg_title") is None:
-                    html.append(message_card(log))
-                else:
-                    html.append(html_message_card(log))
-
-            # Otherwise, if this is a command being logged...
             else:
-                html.append(command_card(log, self.stream_dir))
+                html.append(self.cached_entry_html(log))
         if self.is_parent():
-            return parent_logger_card_html(self.name, html)
+            return parent_logger_card_html(
+                self.name, html, minify=self.minify_html
+            )
         return html
 
-    def finalize(self) -> None:
+    def entry_html(self, log: dict) -> Iterator[str]:
         """
-        Finalize the :class:`ShellLogger` object.
+        Convert a log entry (other than a child logger) to HTML.
+
+        Parameters:
+            log:  An entry from the :attr:`log_book`.
 
-        Write the HTML log file.
+        Returns:
+            A generator that will lazily yield strings corresponding to
+            the elements of the entry's card.
         """
-        if self.is_parent():
-            html_text = opening_html_text() + "\n"
-            with self.html_file.open("w") as f:
-                f.write(html_text)
+        # If this is the schedule of a graph of commands...
+        minify = self.minify_html
+        if log.get("schedule") is not None:
+            return schedule_card(log, minify=minify)
+
+        # Otherwise, if this is a message being logged...
+        if log["cmd"] is None:
+            if log.get("msg_title") is None:
+                return message_card(log, minify=minify)
+            return html_message_card(log, minify=minify)
+
+        # Otherwise, this is a command being logged.
+        return command_card(
+            log,
+            self.stream_dir,
+            self.aux_store,
+            minify=minify,
+            collapse_progress=self.collapse_progress,
+            max_line_width=self.max_line_width,
+            html_dir=self.log_dir,
+            output_budget=self.output_budget,
+        )
+
+    def cached_entry_html(self, log: dict) -> Iterator[str]:
+        """
+        Convert a log entry to HTML, reusing it if it was done before.
+
+        Rendering a command's card means reading all its output from the
+        :attr:`stream_dir`, so the HTML for each command is saved
+        alongside its output, keyed by its ``cmd_id`` and a hash of the
+        entry.  Finalizing again (e.g., after appending to a log via
+        :func:`append`) then only renders the new or changed entries,
+        and copies the rest into the HTML log file as is.  Fragments the
+        HTML log file no longer uses are deleted when it's finalized.
+
+        Parameters:
+            log:  An entry from the :attr:`log_book`.
+
+        Yields:
+            The HTML for the entry, a line at a time when it's cached.
+        """
+        if log["cmd"] is None:
+            yield from flatten(self.entry_html(log))
+            return
+        fragment = self._fragment_path(log)
+        if fragment.exists():
+            with fragment.open() as f:
+                yield from f
+            return
+        fragment.parent.mkdir(exist_ok=True)
+        partial = fragment.with_suffix(".partial")
+        with partial.open("w") as f:
+            for element in flatten(self.entry_html(log)):
+                f.write(element)
+                yield element
+        partial.replace(fragment)
+
+    def _fragment_path(self, log: dict) -> Path:
+        """
+        Get where the HTML for a command's log entry is cached.
 
-        for element in self.to_html():
-            append_html(element, output=self.html_file)
+        Parameters:
+            log:  An entry from the :attr:`log_book` for a command.
+
+        Returns:
+            The fragment file, named by the entry's ``cmd_id`` and a hash
+            of the entry and the settings it's rendered with.
+        """
+        digest = hashlib.sha256(
+            json.dumps(
+                [
+                    HTML_FRAGMENT_VERSION,
+                    self.minify_html,
+                    self.collapse_progress,
+                    self.max_line_width,
+                    self.log_dir,
+                    self.output_budget,
+                    {k: v for k, v in log.items() if k != "elided_bytes"},
+                ],
+                sort_keys=True,
+                default=str,
+            ).encode()
+        ).hexdigest()
+        return self.stream_dir / "fragments" / f"{log['cmd_id']}_{digest}.html"
+
+    def _prune_fragments(self) -> None:
+        """
+        Delete the cached HTML fragments the log no longer uses.
+
+        A new fragment is cached whenever an entry, or the way it's
+        rendered, changes (see :func:`cached_entry_html`), so once the
+        HTML log file is written, any fragment that isn't in it is
+        stale, as is anything left partially written.
+        """
+        used = set()
+        loggers = [self]
+        while loggers:
+            logger = loggers.pop()
+            for log in logger.log_book:
+                if isinstance(log, ShellLogger):
+                    loggers.append(log)
+                elif log["cmd"] is not None:
+                    used.add(logger._fragment_path(log))
+        fragment_dir = self.stream_dir / "fragments"
+        if not fragment_dir.is_dir():
+            return
+        for fragment in fragment_dir.iterdir():
+            if fragment not in used:
+                fragment.unlink()
+
+    def finalize(self) -> None:
+        """
+        Finalize the :class:`ShellLogger` object.
 
+        Write the HTML log file.  If it's been written as the
+        :class:`ShellLogger` ran (see ``live_html``), only what's left
+        is written, unless something was logged to a child logger after
+        its card was closed, in which case the whole file is rewritten.
+        """
+        if self.live_html:
+            self._wait_quietly()
+            if not self.is_parent():
+                self.__update_duration()
+                self._html_done = True
+                self._stream_html()
+                return
+            if self._has_late_entries():
+                with self._html_lock:
+                    self._write_html_at_once()
+            else:
+                self._write_html(final=True)
+        else:
+            self._write_html_at_once()
         if self.is_parent():
-            with self.html_file.open("a") as html:
-                html.write(closing_html_text())
-                html.write("\n")
+            self._prune_fragments()
 
             # Create a symlink in `log_dir` to the HTML file in
             # `stream_dir`.
@@ -480,6 +857,164 @@ class ShellLogger:
                     self, jf, cls=ShellLoggerEncoder, sort_keys=True, indent=4
                 )
 
+    def _has_late_entries(self) -> bool:
+        """
+        Check for entries logged to closed child logger cards.
+
+        Returns:
+            Whether or not any child logger in the tree has entries
+            that were logged after its card was written to the HTML log
+            file and closed.
+        """
+        loggers = [self]
+        while loggers:
+            logger = loggers.pop()
+            if logger._html_closed and logger._html_written < len(
+                logger.log_book
+            ):
+                return True
+            loggers.extend(
+                log for log in logger.log_book if isinstance(log, ShellLogger)
+            )
+        return False
+
+    def _write_html_at_once(self) -> None:
+        """Write the whole HTML log file."""
+        mode = "w" if self.is_parent() else "a"
+        with self.html_file.open(mode, buffering=self.html_buffer_size) as f:
+            if self.is_parent():
+                f.write(self._opening_html_text() + "\n")
+            write_html(self.to_html(), output=f)
+            if self.is_parent():
+                f.write(closing_html_text())
+                f.write("\n")
+
+    def _opening_html_text(self) -> str:
+        """
+        Get the start of the HTML log file, through its header.
+
+        If there's an :attr:`asset_dir`, any styles and scripts it
+        doesn't have yet are written to it first.
+
+        Returns:
+            The opening HTML text.
+        """
+        if self.asset_dir is None:
+            return opening_html_text()
+        write_assets(self.asset_dir)
+        return opening_html_text(relative_url(self.asset_dir, self.log_dir))
+
+    def _stream_html(self) -> None:
+        """
+        Write any newly finished entries to the HTML log file.
+
+        This does nothing unless the HTML is written as the
+        :class:`ShellLogger` runs (see ``live_html``).  The entries of
+        the whole tree of loggers are written by the top-level parent,
+        in order, so an entry is only written once everything before it
+        is done.
+        """
+        if not self.live_html:
+            return
+        root = self
+        while root._parent is not None:
+            root = root._parent
+        if root.is_parent():
+            root._write_html()
+
+    def _write_html(self, *, final: bool = False) -> None:
+        """
+        Write the top-level parent's unwritten entries to the HTML file.
+
+        Parameters:
+            final:  Whether or not to close the document, along with any
+                child logger cards still open.
+        """
+        with self._html_lock:
+            mode = "a" if self._html_open else "w"
+            with self.html_file.open(
+                mode, buffering=self.html_buffer_size
+            ) as f:
+                header, indent, footer = parent_logger_card_parts(
+                    self.name, minify=self.minify_html
+                )
+                if not self._html_open:
+                    f.write(self._opening_html_text() + "\n")
+                    f.write(header)
+                    self._html_open = True
+                if self._write_entries(f, indent, final=final) and final:
+                    f.write(footer)
+                    f.write(closing_html_text())
+                    f.write("\n")
+
+    def _write_entries(self, f: TextIO, indent: str, *, final: bool) -> bool:
+        """
+        Write this logger's unwritten entries to the HTML file.
+
+        Parameters:
+            f:  The HTML file to write to.
+            indent:  The indentation of this logger's entries.
+            final:  Whether or not to close any child logger cards still
+                open.
+
+        Returns:
+            Whether or not all the entries were written.  Writing stops
+            at the first one that isn't done yet.
+        """
+        while self._html_written < len(self.log_book):
+            log = self.log_book[self._html_written]
+            if isinstance(log, ShellLogger):
+                last = self._html_written == len(self.log_book) - 1
+                if not log._write_card(f, indent, done=final or not last):
+                    return False
+            elif log["cmd"] is not None and log["duration"] is None:
+                return False
+            else:
+                f.writelines(flatten(self.cached_entry_html(log), indent))
+            self._html_written += 1
+        return True
+
+    def _write_card(self, f: TextIO, indent: str, *, done: bool) -> bool:
+        """
+        Write a child logger's card to the HTML file, or as much as can be.
+
+        Parameters:
+            f:  The HTML file to write to.
+            indent:  The indentation of the card.
+            done:  Whether or not the child logger should be considered
+                done, even if it hasn't been finalized.
+
+        Returns:
+            Whether or not the card was closed.
+        """
+        done = done or self._html_done
+        if done and self.duration is None:
+            self.__update_duration()
+        if not self._html_open:
+            header, _, _ = child_logger_card_parts(
+                self.name,
+                self.duration if done else "in progress",
+                minify=self.minify_html,
+            )
+            f.writelines(flatten(header, indent))
+            self._html_open = True
+            self._html_duration_pending = not done
+        _, body_indent, footer = child_logger_card_parts(
+            self.name, "", minify=self.minify_html
+        )
+        body_indent = indent + body_indent
+        if not self._write_entries(f, body_indent, final=done) or not done:
+            return False
+        if self._html_duration_pending:
+            f.writelines(
+                flatten(
+                    child_logger_duration_update(self.duration), body_indent
+                )
+            )
+        f.writelines(flatten(footer, indent))
+        self._html_closed = True
+        return True
+
     def log(  # noqa: PLR0913
         self,
         msg: str,
@@ -491,6 +1026,7 @@ class ShellLogger:
         return_info: bool = False,
         verbose: bool = False,
         stdin_redirect: bool = True,
+        output_budget: Optional[Tuple[int, int]] = None,
         **kwargs,
     ) -> dict:
         """
@@ -518,6 +1054,10 @@ class ShellLogger:
                 some cases (e.g., involving ``bsub``) the redirect
                 causes problems, and we need the flexibility to revert
                 back to standard behavior.
+            output_budget:  How many lines at the start and at the end
+                of ``stdout`` and ``stderr`` to show in the HTML log
+                file, if not the :attr:`output_budget` of the
+                :class:`ShellLogger`.
             **kwargs:  Any other keyword arguments to pass on to
                 :func:`_run`.
 
@@ -534,6 +1074,296 @@ class ShellLogger:
             To conserve memory, ``stdout`` and ``stderr`` will be
             written to files as they are being generated.
         """
+        log, run_kwargs = self._prepare_log(
+            msg,
+            cmd,
+            cwd=cwd,
+            live_stdout=live_stdout,
+            live_stderr=live_stderr,
+            return_info=return_info,
+            verbose=verbose,
+            stdin_redirect=stdin_redirect,
+            output_budget=output_budget,
+            **kwargs,
+        )
+        result = self._run(cmd, **run_kwargs)
+        return self._record_log(log, result)
+
+    def submit(
+        self, msg: str, cmd: str, **kwargs
+    ) -> concurrent.futures.Future:
+        """
+        Execute a command in the background, and log it when it's done.
+
+        The command runs in a :class:`Shell` leased from a pool of up to
+        :attr:`max_workers` shells, such that independent commands can
+        run concurrently.  Its entry in the :attr:`log_book` is reserved
+        now, so entries appear in the order commands were submitted,
+        regardless of the order in which they finish.
+
+        Since any of the pooled shells may run it, the command is run in
+        a subshell, in the directory and with the exported environment
+        variables this logger's own shell has when it's submitted
+        (unless a ``cwd`` is given), such that it can't change the
+        directory or environment seen by any other command.  Variables
+        that were unset, or not exported, in this logger's shell aren't
+        seen as such.
+
+        If running the command raises (e.g., because its shell exited),
+        the future raises it, and the command's entry records the error,
+        such that the log can still be written.
+
+        Parameters:
+            msg:  A message to be recorded with the command.
+            cmd:  The shell command to be executed.
+            **kwargs:  Any other keyword arguments accepted by
+                :func:`log`.
+
+        Returns:
+            A future for the dictionary :func:`log` would return.
+        """
+        future, _ = self._submit(msg, cmd, **kwargs)
+        return future
+
+    def _submit(
+        self, msg: str, cmd: str, **kwargs
+    ) -> Tuple[concurrent.futures.Future, int]:
+        """
+        Execute a command in the background, and log it when it's done.
+
+        Parameters:
+            msg:  A message to be recorded with the command.
+            cmd:  The shell command to be executed.
+            **kwargs:  Any other keyword arguments accepted by
+                :func:`log`.
+
+        Returns:
+            A future for the dictionary :func:`log` would return, and
+            where the command's entry is reserved in the
+            :attr:`log_book`.
+        """
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                self.max_workers, thread_name_prefix=self.name
+            )
+            self._shell_pool = ShellPool(
+                self.max_workers, login_shell=self.login_shell
+            )
+        log, run_kwargs = self._prepare_log(msg, cmd, **kwargs)
+        run_kwargs["pwd"] = run_kwargs.get("pwd") or self._shell_pwd
+        run_kwargs["subshell"] = True
+        shell = (self._shell_owner or self)._shell
+        if shell is not None:
+            run_kwargs["exports"], _ = shell.auxiliary_command(
+                posix="export -p", strip=True
+            )
+        index = len(self.log_book)
+        self.log_book.append(log)
+        future = self._executor.submit(
+            self._run_pooled, log, index, cmd, run_kwargs
+        )
+        self._futures.append(future)
+        return future, index
+
+    def log_many(
+        self, commands: Sequence[Tuple[str, str]], **kwargs
+    ) -> List[dict]:
+        """
+        Execute commands concurrently, and log the corresponding info.
+
+        The commands are run as for :func:`submit`, so they see this
+        logger's working directory and exported environment, but can't
+        change them.
+
+        Parameters:
+            commands:  The message and command for each command to run.
+            **kwargs:  Any other keyword arguments accepted by
+                :func:`log`, which apply to all the ``commands``.
+
+        Returns:
+            The dictionaries :func:`log` would return for each command,
+            in the order the ``commands`` were given.
+        """
+        futures = [self.submit(msg, cmd, **kwargs) for msg, cmd in commands]
+        return [future.result() for future in futures]
+
+    def wait(self) -> None:
+        """
+        Wait for all the commands submitted via :func:`submit` to finish.
+
+        Raises:
+            Exception:  The first exception raised by a submitted
+                command, if any, once they've all finished.
+        """
+        futures, self._futures = self._futures, []
+        concurrent.futures.wait(futures)
+        for future in futures:
+            future.result()
+
+    def _wait_quietly(self) -> None:
+        """
+        Wait for all the submitted commands to finish, ignoring errors.
+
+        A command that raised has its entry in the :attr:`log_book`
+        filled in with the error (see :func:`_record_failure`), and the
+        exception is left to :func:`submit` 's future, such that the log
+        can still be written.
+        """
+        futures, self._futures = self._futures, []
+        concurrent.futures.wait(futures)
+
+    def _run_pooled(
+        self, log: dict, index: int, cmd: str, run_kwargs: dict
+    ) -> dict:
+        """
+        Execute a submitted command in a pooled :class:`Shell`.
+
+        Parameters:
+            log:  The initial log information from :func:`_prepare_log`.
+            index:  Where the entry is reserved in the :attr:`log_book`.
+            cmd:  The shell command to be executed.
+            run_kwargs:  The keyword arguments with which to run the
+                command.
+
+        Returns:
+            The dictionary :func:`log` would return.
+
+        Raises:
+            Exception:  Whatever was raised running the command (e.g., if
+                the shell exited), once the reserved entry is filled in
+                with a note saying the command failed.
+        """
+        try:
+            with self._shell_pool.shell() as shell:
+                result = self._run(cmd, shell=shell, **run_kwargs)
+        except Exception as error:
+            self._record_failure(log, index, error)
+            raise
+        return self._record_log(log, result, index=index)
+
+    def _record_failure(
+        self, log: dict, index: int, error: BaseException
+    ) -> None:
+        """
+        Fill in a reserved entry for a command that couldn't be run.
+
+        The entry becomes a message, as there's no output or auxiliary
+        information for a command card, such that the log can still be
+        written.
+
+        Parameters:
+            log:  The initial log information from :func:`_prepare_log`.
+            index:  Where the entry is reserved in the :attr:`log_book`.
+            error:  What was raised running the command.
+        """
+        self.log_book[index] = {
+            "msg": f"{log['cmd']}\n\n{error}",
+            "msg_title": f"{log['msg']} (failed)",
+            "timestamp": log["timestamp"],
+            "cmd": None,
+            "cmd_id": log["cmd_id"],
+            "error": str(error),
+        }
+        self._stream_html()
+
+    async def async_log(  # noqa: PLR0913
+        self,
+        msg: str,
+        cmd: str,
+        *,
+        cwd: Optional[Path] = None,
+        live_stdout: bool = False,
+        live_stderr: bool = False,
+        return_info: bool = False,
+        verbose: bool = False,
+        stdin_redirect: bool = True,
+        output_budget: Optional[Tuple[int, int]] = None,
+        **kwargs,
+    ) -> dict:
+        """
+        Execute a command, and log the corresponding information.
+
+        This is the same as :func:`log`, but rather than blocking while
+        the command runs, it waits on the shell's pipes via the running
+        event loop, so many loggers can run commands concurrently on a
+        single thread.  The :attr:`log_book` entries are the same as
+        those recorded by :func:`log`.
+
+        Parameters:
+            msg:  A message to be recorded with the command.
+            cmd:  The shell command to be executed.
+            cwd:  Where to execute the command.
+            live_stdout:  Print ``stdout`` as it is being produced.
+            live_stderr:  Print ``stderr`` as it is being produced.
+            return_info:  If set to ``True``, ``stdout`` and ``stderr``
+                will be returned.
+            verbose:  Print the command before it is executed.
+            stdin_redirect:  Whether or not to redirect ``stdin`` to
+                ``/dev/null``.
+            output_budget:  How many lines at the start and at the end
+                of ``stdout`` and ``stderr`` to show in the HTML log
+                file, if not the :attr:`output_budget` of the
+                :class:`ShellLogger`.
+            **kwargs:  Any other keyword arguments to pass on to
+                :func:`_async_run`.
+
+        Returns:
+            A dictionary containing ``stdout``, ``stderr``, ``trace``,
+            and ``return_code`` keys, as for :func:`log`.
+        """
+        log, run_kwargs = self._prepare_log(
+            msg,
+            cmd,
+            cwd=cwd,
+            live_stdout=live_stdout,
+            live_stderr=live_stderr,
+            return_info=return_info,
+            verbose=verbose,
+            stdin_redirect=stdin_redirect,
+            output_budget=output_budget,
+            **kwargs,
+        )
+        result = await self._async_run(cmd, **run_kwargs)
+        return self._record_log(log, result)
+
+    def _prepare_log(  # noqa: PLR0913
+        self,
+        msg: str,
+        cmd: str,
+        *,
+        cwd: Optional[Path] = None,
+        live_stdout: bool = False,
+        live_stderr: bool = False,
+        return_info: bool = False,
+        verbose: bool = False,
+        stdin_redirect: bool = True,
+        output_budget: Optional[Tuple[int, int]] = None,
+        **kwargs,
+    ) -> Tuple[dict, dict]:
+        """
+        Set up the log entry and stream files for a command.
+
+        Parameters:
+            msg:  A message to be recorded with the command.
+            cmd:  The shell command to be executed.
+            cwd:  Where to execute the command.
+            live_stdout:  Print ``stdout`` as it is being produced.
+            live_stderr:  Print ``stderr`` as it is being produced.
+            return_info:  Whether or not to capture ``stdout`` and
+                ``stderr`` as strings.
+            verbose:  Print the command before it is executed.
+            stdin_redirect:  Whether or not to redirect ``stdin`` to
+                ``/dev/null``.
+            output_budget:  How many lines at the start and at the end
+                of ``stdout`` and ``stderr`` to show in the HTML log
+                file, if not the :attr:`output_budget`.
+            **kwargs:  Any other keyword arguments to pass on to
+                :func:`_run`.
+
+        Returns:
+            The initial log information, and the keyword arguments with
+            which to run the command.
+        """
         start_time = datetime.now()
 
         # Create a unique command ID that will be used to find the
@@ -568,23 +1398,39 @@ class ShellLogger:
             "cwd": cwd,
             "return_code": 0,
         }
-
-        # Execute the command.
-        result = self._run(
-            cmd,
-            quiet_stdout=not live_stdout,
-            quiet_stderr=not live_stderr,
-            stdout_str=return_info,
-            stderr_str=return_info,
-            trace_str=return_info,
-            stdout_path=stdout_path,
-            stderr_path=stderr_path,
-            trace_path=trace_path,
-            devnull_stdin=stdin_redirect,
-            pwd=cwd,
+        if output_budget is not None:
+            log["output_budget"] = output_budget
+        run_kwargs = {
+            "quiet_stdout": not live_stdout,
+            "quiet_stderr": not live_stderr,
+            "stdout_str": return_info,
+            "stderr_str": return_info,
+            "trace_str": return_info,
+            "stdout_path": stdout_path,
+            "stderr_path": stderr_path,
+            "trace_path": trace_path,
+            "devnull_stdin": stdin_redirect,
+            "pwd": cwd,
             **kwargs,
-        )
+        }
+        return log, run_kwargs
+
+    def _record_log(
+        self, log: dict, result: SimpleNamespace, index: Optional[int] = None
+    ) -> dict:
+        """
+        Complete a command's log entry, and save it to the log book.
+
+        Parameters:
+            log:  The initial log information from :func:`_prepare_log`.
+            result:  The result of running the command.
+            index:  Where the entry was reserved in the
+                :attr:`log_book`, if it was; otherwise it's appended.
 
+        Returns:
+            A dictionary containing ``stdout``, ``stderr``, ``trace``,
+            and ``return_code`` keys.
+        """
         # Update the log information and save it to the `log_book`.
         h = int(result.wall / 3600000)
         m = int(result.wall / 60000) % 60
@@ -592,19 +1438,90 @@ class ShellLogger:
         log["duration"] = f"{h}h {m}m {s}s"
         log["return_code"] = result.returncode
         log = {**log, **nested_simplenamespace_to_dict(result)}
-        self.log_book.append(log)
+
+        # Store the environment and `ulimit` once per distinct value, and
+        # only keep references to them in the log entry.
+        environment = log.pop("environment")
+        log["environment_hash"] = self.store_aux(environment)
+        log["ulimit_hash"] = self.store_aux(log.pop("ulimit"))
+        log["environment_diff"] = None
+        log["environment_ref"] = None
+        if index is None:
+            index = len(self.log_book)
+            self.log_book.append(log)
+        previous = next(
+            (
+                entry
+                for entry in reversed(self.log_book[:index])
+                if isinstance(entry, dict) and "environment_hash" in entry
+            ),
+            None,
+        )
+
+        # If the environment hasn't changed since the previous command,
+        # refer to the card that shows it, rather than showing it again.
+        if previous is not None:
+            if previous["environment_hash"] == log["environment_hash"]:
+                log["environment_ref"] = (
+                    previous.get("environment_ref") or previous["cmd_id"]
+                )
+            if self.diff_environment:
+                log["environment_diff"] = self.environment_diff(
+                    self.aux_store[previous["environment_hash"]], environment
+                )
+        self.log_book[index] = log
+        self._stream_html()
         return {
             "return_code": log["return_code"],
             "stdout": result.stdout,
             "stderr": result.stderr,
         }
 
-    def _run(self, command: str, **kwargs) -> SimpleNamespace:
+    def store_aux(self, text: str) -> str:
+        """
+        Save auxiliary text in the content-addressed store.
+
+        Parameters:
+            text:  The text to store (e.g., the environment).
+
+        Returns:
+            The hash by which the text can be retrieved from the
+            :attr:`aux_store`.
+        """
+        key = hashlib.sha256(text.encode()).hexdigest()
+        self.aux_store.setdefault(key, text)
+        return key
+
+    @staticmethod
+    def environment_diff(old: str, new: str) -> str:
+        """
+        Determine how an environment changed.
+
+        Parameters:
+            old:  The prior environment, as printed by ``env``.
+            new:  The new environment, as printed by ``env``.
+
+        Returns:
+            The lines of ``old`` that are no longer present, prefixed
+            with ``-``, followed by the lines of ``new`` that weren't
+            present before, prefixed with ``+``.
+        """
+        old_lines, new_lines = old.splitlines(), new.splitlines()
+        old_set, new_set = set(old_lines), set(new_lines)
+        removed = [f"-{line}" for line in old_lines if line not in new_set]
+        added = [f"+{line}" for line in new_lines if line not in old_set]
+        return "\n".join(removed + added)
+
+    def _run(
+        self, command: str, *, shell: Optional[Shell] = None, **kwargs
+    ) -> SimpleNamespace:
         """
         Execute a command, capturing various information as you go.
 
         Parameters:
             command:  The command to execute.
+            shell:  The :class:`Shell` to run the command in, if not
+                :attr:`shell`.
             **kwargs:  Additional arguments to be passed on to the
                 :class:`StatsCollector` s, :class:`Trace` s,
                 :func:`shell.run`, etc.
@@ -616,16 +1533,119 @@ class ShellLogger:
         Todo:
             * Replace `**kwargs` with actual parameters.
         """
-        completed_process, trace_output = None, None
         for key in ["stdout_str", "stderr_str", "trace_str"]:
             if key not in kwargs:
                 kwargs[key] = True
 
-        # Change to the directory in which to execute the command.
-        old_pwd = Path.cwd()
-        if kwargs.get("pwd"):
-            self.shell.cd(kwargs.get("pwd"))
-        aux_info = self.auxiliary_information()
+        # The shell changes to the directory in which to execute the
+        # command (if any) as part of running it, so there's no need to
+        # change directories here.
+        own_shell = shell is None
+        shell = self.shell if shell is None else shell
+        if own_shell and self._switch_shell():
+            shell.cd(self._shell_pwd, chdir=False)
+        aux_info = self.auxiliary_information(shell, pwd=kwargs.get("pwd"))
+
+        # Run the command with any collectors the user has requested.
+        command, collectors, trace_output = self._start_collectors(
+            command, **kwargs
+        )
+        completed_process = shell.run(command, **kwargs)
+        self._invalidate_aux(shell, command)
+        self._finish_collectors(
+            completed_process, collectors, trace_output, **kwargs
+        )
+
+        if own_shell:
+            self._remember_pwd(shell.last_pwd)
+        return SimpleNamespace(
+            **completed_process.__dict__, **aux_info.__dict__
+        )
+
+    async def _async_run(self, command: str, **kwargs) -> SimpleNamespace:
+        """
+        Execute a command without blocking.
+
+        This is the same as :func:`_run`, but the shell is awaited via
+        the running event loop.
+
+        Parameters:
+            command:  The command to execute.
+            **kwargs:  Additional arguments to be passed on to the
+                :class:`StatsCollector` s, :class:`Trace` s,
+                :func:`shell.async_run`, etc.
+
+        Returns:
+            The command run, along with its output, and various metadata
+            and diagnostic information captured while it ran.
+        """
+        for key in ["stdout_str", "stderr_str", "trace_str"]:
+            if key not in kwargs:
+                kwargs[key] = True
+        shell = self.shell
+        async with shell.async_lock():
+            if self._switch_shell():
+                await shell.async_cd(self._shell_pwd)
+            aux_info = await self._async_auxiliary_information(
+                shell, pwd=kwargs.get("pwd")
+            )
+            command, collectors, trace_output = self._start_collectors(
+                command, **kwargs
+            )
+            completed_process = await shell.async_run(command, **kwargs)
+            self._invalidate_aux(shell, command)
+            self._finish_collectors(
+                completed_process, collectors, trace_output, **kwargs
+            )
+            self._remember_pwd(shell.last_pwd)
+        return SimpleNamespace(
+            **completed_process.__dict__, **aux_info.__dict__
+        )
+
+    def _switch_shell(self) -> bool:
+        """
+        Note that this logger is about to run a command in its shell.
+
+        Returns:
+            Whether or not another logger sharing the shell ran a
+            command in it last, in which case the shell needs to be
+            changed back to this logger's working directory.
+        """
+        owner = self._shell_owner or self
+        switching = (
+            owner._shell_user is not None and owner._shell_user is not self
+        )
+        owner._shell_user = self
+        return switching
+
+    def _remember_pwd(self, pwd: Union[Path, str, None]) -> None:
+        """
+        Remember where this logger left its shell after a command.
+
+        Parameters:
+            pwd:  The shell's working directory, if known.
+        """
+        if pwd:
+            self._shell_pwd = Path(pwd)
+
+    @staticmethod
+    def _start_collectors(
+        command: str, **kwargs
+    ) -> Tuple[str, list, Optional[Path]]:
+        """
+        Start up any stats or trace collectors the user has requested.
+
+        Parameters:
+            command:  The command to execute.
+            **kwargs:  Additional arguments to be passed on to the
+                :class:`StatsCollector` s and :class:`Trace` s.
+
+        Returns:
+            The command to run (which is wrapped by the trace, if
+            any), the stats collectors started, and where the trace
+            output will be written.
+        """
+        trace_output = None
 
         # Stats collectors use a multiprocessing manager that creates
         # unix domain sockets with names determined by
@@ -637,10 +1657,7 @@ class ShellLogger:
         # /usr/include/linux/un.h`.
         old_tmpdir = os.environ.get("TMPDIR")
         os.environ["TMPDIR"] = "/tmp"
-
-        # Start up any stats or trace collectors the user has requested.
         collectors = stats_collectors(**kwargs)
-        stats = {} if len(collectors) > 0 else None
         for collector in collectors:
             collector.start()
         if old_tmpdir is not None:
@@ -652,9 +1669,27 @@ class ShellLogger:
             trace = trace_collector(**kwargs)
             command = trace.command(command)
             trace_output = trace.output_path
+        return command, collectors, trace_output
+
+    @staticmethod
+    def _finish_collectors(
+        completed_process: SimpleNamespace,
+        collectors: list,
+        trace_output: Optional[Path],
+        **kwargs,
+    ) -> None:
+        """
+        Stop any collectors, and add what they gathered to the results.
 
-        # Run the command, and stop any collectors that were started.
-        completed_process = self.shell.run(command, **kwargs)
+        Parameters:
+            completed_process:  The result of running the command,
+                which is updated with the ``stats`` and ``trace``.
+            collectors:  The stats collectors that were started.
+            trace_output:  Where the trace output was written, if
+                anywhere.
+            **kwargs:  Additional arguments passed on to :func:`_run`.
+        """
+        stats = {} if len(collectors) > 0 else None
         for collector in collectors:
             stats[collector.stat_name] = collector.finish()
         completed_process.trace_path = trace_output
@@ -665,47 +1700,175 @@ class ShellLogger:
         else:
             completed_process.trace = None
 
-        # Change back to the original directory and return the results.
-        if kwargs.get("pwd"):
-            self.shell.cd(old_pwd)
-        return SimpleNamespace(
-            **completed_process.__dict__, **aux_info.__dict__
-        )
-
-    def auxiliary_information(self) -> SimpleNamespace:
+    def auxiliary_information(
+        self, shell: Optional[Shell] = None, *, pwd: Optional[Path] = None
+    ) -> SimpleNamespace:
         """
         Grab auxiliary information.
 
         Capture all sorts of auxiliary information before running a
-        command.
+        command.  All the information is gathered in a single round trip
+        to the shell.  The information that shouldn't change over the
+        life of the shell (its hostname, user, group, shell, and
+        ``ulimit``) is only fetched the first time, and then cached
+        until it expires (see the ``aux_ttl`` and ``ulimit_policy``
+        parameters) or :func:`refresh_aux` is called.
+
+        Parameters:
+            shell:  The :class:`Shell` to query, if not :attr:`shell`.
+            pwd:  The directory the command will be run in, if not the
+                shell's working directory.
 
         Returns:
             The working directory, environment, umask, hostname, user,
             group, shell, and ulimit.
         """
-        pwd, _ = self.shell.auxiliary_command(posix="pwd", strip=True)
-        environment, _ = self.shell.auxiliary_command(posix="env")
-        umask, _ = self.shell.auxiliary_command(posix="umask", strip=True)
-        hostname, _ = self.shell.auxiliary_command(
-            posix="hostname", strip=True
+        shell = self.shell if shell is None else shell
+        aux, _ = shell.auxiliary_commands(
+            self._uncached_aux_commands(shell),
+            strip=STRIPPED_AUXILIARY_KEYS,
+            pwd=pwd,
         )
-        user, _ = self.shell.auxiliary_command(posix="whoami", strip=True)
-        group, _ = self.shell.auxiliary_command(posix="id -gn", strip=True)
-        shell, _ = self.shell.auxiliary_command(
-            posix="printenv SHELL", strip=True
+        return self._cache_aux(shell, aux)
+
+    async def async_auxiliary_information(
+        self, *, pwd: Optional[Path] = None
+    ) -> SimpleNamespace:
+        """
+        Grab auxiliary information without blocking.
+
+        This is the same as :func:`auxiliary_information`, but awaits
+        the shell via the running event loop.
+
+        Parameters:
+            pwd:  The directory the command will be run in, if not the
+                shell's working directory.
+
+        Returns:
+            The working directory, environment, umask, hostname, user,
+            group, shell, and ulimit.
+        """
+        shell = self.shell
+        async with shell.async_lock():
+            return await self._async_auxiliary_information(shell, pwd=pwd)
+
+    async def _async_auxiliary_information(
+        self, shell: Shell, *, pwd: Optional[Path] = None
+    ) -> SimpleNamespace:
+        """
+        Grab auxiliary information while holding the shell's lock.
+
+        Parameters:
+            shell:  The shell to query, whose lock the caller holds.
+            pwd:  The directory the command will be run in, if not the
+                shell's working directory.
+
+        Returns:
+            The working directory, environment, umask, hostname, user,
+            group, shell, and ulimit.
+        """
+        aux, _ = await shell.async_auxiliary_commands(
+            self._uncached_aux_commands(shell),
+            strip=STRIPPED_AUXILIARY_KEYS,
+            pwd=pwd,
         )
-        ulimit, _ = self.shell.auxiliary_command(posix="ulimit -a")
+        return self._cache_aux(shell, aux)
+
+    def refresh_aux(self) -> None:
+        """
+        Forget the cached auxiliary information.
+
+        The information that shouldn't change over the life of a
+        :class:`Shell` (e.g., its hostname) is fetched afresh before the
+        next command run in this logger's shells.  Call this if you've
+        changed it (e.g., via ``newgrp``).
+        """
+        shells = [(self._shell_owner or self)._shell]
+        if self._shell_pool is not None:
+            with self._shell_pool.condition:
+                shells.extend(self._shell_pool.idle)
+        for shell in shells:
+            if shell is not None:
+                shell.refresh_aux()
+
+    def _cacheable_aux_keys(self) -> List[str]:
+        """
+        Determine which auxiliary information may be cached.
+
+        Returns:
+            The keys of the invariant auxiliary information, less
+            ``ulimit`` if it's to be fetched with every command.
+        """
+        return [
+            key
+            for key in INVARIANT_AUXILIARY_KEYS
+            if key != "ulimit" or self.ulimit_policy != "volatile"
+        ]
+
+    def _uncached_aux_commands(self, shell: Shell) -> Dict[str, str]:
+        """
+        Determine which auxiliary commands need to be run.
+
+        Parameters:
+            shell:  The :class:`Shell` to query.
+
+        Returns:
+            The subset of :data:`AUXILIARY_COMMANDS` whose output isn't
+            in the shell's (unexpired) cache.
+        """
+        if (
+            self.aux_ttl is not None
+            and shell.aux_cache_time is not None
+            and monotonic() - shell.aux_cache_time > self.aux_ttl
+        ):
+            shell.refresh_aux()
+        cacheable = self._cacheable_aux_keys()
+        return {
+            key: command
+            for key, command in AUXILIARY_COMMANDS.items()
+            if key not in cacheable or key not in shell.aux_cache
+        }
+
+    def _cache_aux(self, shell: Shell, aux: Dict[str, str]) -> SimpleNamespace:
+        """
+        Combine freshly fetched auxiliary information with that cached.
+
+        Parameters:
+            shell:  The :class:`Shell` that was queried.
+            aux:  The output of the commands given by
+                :func:`_uncached_aux_commands`.
+
+        Returns:
+            All the auxiliary information.
+        """
+        fetched = {
+            key: aux[key] for key in self._cacheable_aux_keys() if key in aux
+        }
+        if fetched:
+            shell.aux_cache_misses += 1
+            if shell.aux_cache_time is None:
+                shell.aux_cache_time = monotonic()
+            shell.aux_cache.update(fetched)
+        else:
+            shell.aux_cache_hits += 1
         return SimpleNamespace(
-            pwd=pwd,
-            environment=environment,
-            umask=umask,
-            hostname=hostname,
-            user=user,
-            group=group,
-            shell=shell,
-            ulimit=ulimit,
+            **{
+                key: aux[key] if key in aux else shell.aux_cache[key]
+                for key in AUXILIARY_COMMANDS
+            }
         )
 
+    def _invalidate_aux(self, shell: Shell, command: str) -> None:
+        """
+        Forget the cached ``ulimit`` if a command may have changed it.
+
+        Parameters:
+            shell:  The :class:`Shell` the command was run in.
+            command:  The command that was run.
+        """
+        if self.ulimit_policy == "invalidate" and "ulimit" in command:
+            shell.refresh_aux(["ulimit"])
+
 
 class ShellLoggerEncoder(json.JSONEncoder):
     """
@@ -733,9 +1896,17 @@ class ShellLoggerEncoder(json.JSONEncoder):
             The JSON serialization of the given object.
         """
         if isinstance(obj, ShellLogger):
+            # Child loggers share the parent's `aux_store`, so only
+            # serialize it once.  Private attributes (e.g., the pool of
+            # shells running submitted commands) aren't serialized.
             return {
                 **{"__type__": "ShellLogger"},
-                **{k: self.default(v) for k, v in obj.__dict__.items()},
+                **{
+                    k: self.default(v)
+                    for k, v in obj.__dict__.items()
+                    if not k.startswith("_")
+                    and (k != "aux_store" or obj.is_parent())
+                },
             }
         if isinstance(obj, (int, float, str, bytes)):
             return obj
@@ -800,7 +1971,7 @@ class ShellLoggerDecoder(json.JSONDecoder):
         if "__type__" not in obj:
             return obj
         if obj["__type__"] == "ShellLogger":
-            return ShellLogger(
+            logger = ShellLogger(
                 obj["name"],
                 log_dir=obj["log_dir"],
                 stream_dir=obj["stream_dir"],
@@ -811,13 +1982,38 @@ class ShellLoggerDecoder(json.JSONDecoder):
                 init_time=obj["init_time"],
                 done_time=obj["done_time"],
                 duration=obj["duration"],
+                aux_store=obj.get("aux_store"),
+                diff_environment=obj.get("diff_environment", False),
+                max_workers=obj.get("max_workers"),
+                aux_ttl=obj.get("aux_ttl"),
+                ulimit_policy=obj.get("ulimit_policy", "invalidate"),
+                live_html=obj.get("live_html", False),
+                minify_html=obj.get("minify_html", False),
+                html_buffer_size=obj.get(
+                    "html_buffer_size", DEFAULT_BUFFER_SIZE
+                ),
+                collapse_progress=obj.get("collapse_progress", False),
+                max_line_width=obj.get("max_line_width", MAX_LINE_WIDTH),
+                output_budget=obj.get("output_budget"),
+                asset_dir=obj.get("asset_dir"),
             )
+            for log in logger.log_book:
+                if isinstance(log, ShellLogger):
+                    log._parent = logger
+
+            # Children are decoded before their parent, so hand them
+            # the parent's `aux_store` now.
+            if logger.is_parent():
+                logger.share_aux_store()
+            return logger
         if obj["__type__"] == "datetime":
             return datetime.strptime(obj["value"], obj["format"])
         if obj["__type__"] == "Path":
             return Path(obj["value"])
         if obj["__type__"] == "tuple":
             return tuple(obj["items"])
+        # Older logs serialized each `ShellLogger`'s `Shell`, but shells
+        # are now spawned only when needed, so don't spawn one here.
         if obj["__type__"] == "Shell":
-            return Shell(Path(obj["pwd"]), login_shell=obj["login_shell"])
+            return None
         return None
@@ -0,0 +1,332 @@
+"""Provides the :class:`ShellPool` class."""
+
+# © 2023 National Technology & Engineering Solutions of Sandia, LLC
+# (NTESS).  Under the terms of Contract DE-NA0003525 with NTESS, the
+# U.S. Government retains certain rights in this software.
+
+# SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import annotations
+
+import atexit
+import contextlib
+import os
+import subprocess
+import threading
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, Iterator, List, Tuple
+
+from .shell import Shell
+
+# How long (in seconds) to wait for an idle shell to exit when the pool
+# is closed, before killing it.
+CLOSE_TIMEOUT = 1.0
+
+
+class ShellPool:
+    """
+    Manage a bounded pool of :class:`Shell` objects.
+
+    Shells are spawned as they're needed, up to the pool's ``size``,
+    and are reused once they're released.  If every shell is leased,
+    leasing another blocks until one is released.
+
+    Attributes:
+        size (int):  The maximum number of shells in the pool.
+        login_shell (bool):  Whether or not the shells spawned should
+            be login shells.
+        idle (List[Shell]):  The shells available to be leased.
+        spawned (int):  The number of shells spawned so far.
+        condition (threading.Condition):  Guards the pool's state, and
+            is notified whenever a shell is released.
+    """
+
+    def __init__(self, size: int, *, login_shell: bool = False) -> None:
+        """
+        Initialize a :class:`ShellPool` object.
+
+        Parameters:
+            size:  The maximum number of shells in the pool.
+            login_shell:  Whether or not the shells spawned should be
+                login shells.
+
+        Raises:
+            ValueError:  If the ``size`` isn't positive.
+        """
+        if size < 1:
+            message = (
+                f"A `ShellPool` must hold at least one shell, not {size}."
+            )
+            raise ValueError(message)
+        self.size = size
+        self.login_shell = login_shell
+        self.idle: List[Shell] = []
+        self.spawned = 0
+        self.condition = threading.Condition()
+
+    def lease(self) -> Shell:
+        """
+        Take a shell out of the pool.
+
+        Returns:
+            An idle shell, if there is one; otherwise a new one (leased
+            from the :data:`warm_shell_pool`), if the pool isn't full;
+            otherwise the next one to be released.
+        """
+        with self.condition:
+            while not self.idle and self.spawned >= self.size:
+                self.condition.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.spawned += 1
+        try:
+            return warm_shell_pool.lease(login_shell=self.login_shell)
+        except BaseException:
+            self.discard()
+            raise
+
+    def release(self, shell: Shell) -> None:
+        """
+        Return a shell to the pool.
+
+        Parameters:
+            shell:  The shell that was leased.
+        """
+        with self.condition:
+            self.idle.append(shell)
+            self.condition.notify()
+
+    def discard(self) -> None:
+        """
+        Make room in the pool for a shell that's no longer usable.
+
+        A shell is discarded, rather than released, if something went
+        wrong while it was leased (e.g., it exited), such that another
+        can be spawned in its place.
+        """
+        with self.condition:
+            self.spawned -= 1
+            self.condition.notify()
+
+    @contextlib.contextmanager
+    def shell(self) -> Iterator[Shell]:
+        """
+        Lease a shell for the duration of a ``with`` block.
+
+        Yields:
+            The leased shell, which is released afterwards, or
+            discarded if an exception was raised.
+        """
+        shell = self.lease()
+        try:
+            yield shell
+        except BaseException:
+            self.discard()
+            raise
+        self.release(shell)
+
+
+class WarmShellPool:
+    """
+    Keep idle :class:`Shell` objects spawned ahead of time.
+
+    Spawning a shell (and sourcing a login profile, for login shells)
+    can dominate the time taken by short-lived loggers, so this pool
+    spawns shells in a background thread, such that they're ready to go
+    when they're needed.  Leased shells aren't returned to the pool;
+    once a shell of a given type has been leased (or :func:`prewarm`
+    was called for it), the pool keeps topping itself back up to
+    ``size`` idle shells of that type.
+
+    A shell inherits the environment and working directory of the
+    process when it's spawned, so idle shells spawned before either
+    changed are discarded rather than leased.
+
+    Setting the ``size`` to 0 opts out of keeping idle shells, such that
+    each one is spawned when it's leased.  Any idle shells left are
+    closed when the process exits.
+
+    Attributes:
+        size (int):  The number of idle shells of each type to keep.
+        idle (Dict[bool, List[Tuple[Shell, tuple]]]):  The idle shells,
+            along with the process' state when they were spawned, keyed
+            by whether or not they're login shells.
+        refilling (Dict[bool, bool]):  Whether or not a background
+            thread is spawning shells of each type.
+        hits (int):  The number of leases served by an idle shell.
+        misses (int):  The number of leases that had to spawn a shell.
+        stale (int):  The number of idle shells discarded because the
+            process' environment or working directory changed.
+        spawned (int):  The number of shells spawned.
+        spawn_time (float):  How long (in seconds) it took to spawn all
+            the shells.
+        max_spawn_time (float):  How long (in seconds) it took to spawn
+            the slowest shell.
+        lock (threading.Lock):  Guards the pool's state.
+    """
+
+    def __init__(self, size: int = 2) -> None:
+        """
+        Initialize a :class:`WarmShellPool` object.
+
+        Parameters:
+            size:  The number of idle shells of each type to keep.
+        """
+        self.size = size
+        self.idle: Dict[bool, List[Tuple[Shell, tuple]]] = {
+            False: [],
+            True: [],
+        }
+        self.refilling = {False: False, True: False}
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.spawned = 0
+        self.spawn_time = 0.0
+        self.max_spawn_time = 0.0
+        self.lock = threading.Lock()
+
+    def lease(self, *, login_shell: bool = False) -> Shell:
+        """
+        Take a shell out of the pool.
+
+        Parameters:
+            login_shell:  Whether or not the shell should be a login
+                shell.
+
+        Returns:
+            An idle shell, if there is one; otherwise a newly spawned
+            one.  Either way, the pool is topped up in the background.
+        """
+        state, shell = self.process_state(), None
+        with self.lock:
+            while self.idle[login_shell] and shell is None:
+                idle_shell, spawn_state = self.idle[login_shell].pop()
+                if spawn_state == state:
+                    shell = idle_shell
+                else:
+                    self.stale += 1
+            if shell is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        self.prewarm(login_shell=login_shell)
+        return shell if shell is not None else self.spawn(login_shell)
+
+    @staticmethod
+    def process_state() -> tuple:
+        """
+        Get the state of the process that spawned shells inherit.
+
+        Returns:
+            The process' working directory and environment.
+        """
+        return str(Path.cwd()), tuple(sorted(os.environ.items()))
+
+    def prewarm(self, *, login_shell: bool = False) -> None:
+        """
+        Top up the idle shells of a given type in the background.
+
+        Parameters:
+            login_shell:  Whether or not to spawn login shells.
+        """
+        with self.lock:
+            if self.refilling[login_shell] or self.size < 1:
+                return
+            self.refilling[login_shell] = True
+        threading.Thread(
+            target=self.refill, args=(login_shell,), daemon=True
+        ).start()
+
+    def refill(self, login_shell: bool) -> None:  # noqa: FBT001
+        """
+        Spawn shells until there are enough idle ones of a given type.
+
+        Parameters:
+            login_shell:  Whether or not to spawn login shells.
+        """
+        try:
+            while True:
+                with self.lock:
+                    if len(self.idle[login_shell]) >= self.size:
+                        return
+                state = self.process_state()
+                shell = self.spawn(login_shell)
+                with self.lock:
+                    self.idle[login_shell].append((shell, state))
+        finally:
+            with self.lock:
+                self.refilling[login_shell] = False
+
+    def spawn(self, login_shell: bool) -> Shell:  # noqa: FBT001
+        """
+        Spawn a shell, and record how long it took.
+
+        Parameters:
+            login_shell:  Whether or not to spawn a login shell.
+
+        Returns:
+            The new shell.
+        """
+        start = perf_counter()
+        shell = Shell(login_shell=login_shell)
+        seconds = perf_counter() - start
+        with self.lock:
+            self.spawned += 1
+            self.spawn_time += seconds
+            self.max_spawn_time = max(self.max_spawn_time, seconds)
+        return shell
+
+    def close(self) -> None:
+        """
+        Close the idle shells.
+
+        Each shell is asked to exit, and killed if it doesn't in time.
+        This is done when the process exits for the
+        :data:`warm_shell_pool`.
+        """
+        with self.lock:
+            shells = [
+                shell for idle in self.idle.values() for shell, _ in idle
+            ]
+            for idle in self.idle.values():
+                idle.clear()
+        for shell in shells:
+            shell.shell_subprocess.terminate()
+        for shell in shells:
+            try:
+                shell.shell_subprocess.wait(timeout=CLOSE_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                shell.shell_subprocess.kill()
+                shell.shell_subprocess.wait()
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Summarize how well the pool is keeping up.
+
+        Returns:
+            The number of pool hits and misses, the number of stale
+            shells discarded, the number of shells spawned, and the mean
+            and maximum time (in seconds) taken to spawn one.
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "spawned": self.spawned,
+                "mean_spawn_time": (
+                    self.spawn_time / self.spawned if self.spawned else 0.0
+                ),
+                "max_spawn_time": self.max_spawn_time,
+            }
+
+
+warm_shell_pool = WarmShellPool()
+"""
+The process-wide pool that :class:`ShellLogger` objects lease from.
+
+Set ``warm_shell_pool.size = 0`` to stop it keeping idle shells.
+"""
+atexit.register(warm_shell_pool.close)
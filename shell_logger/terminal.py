@@ -0,0 +1,291 @@
+"""Provides the :class:`ProgressCollapser` class."""
+
+# © 2023 National Technology & Engineering Solutions of Sandia, LLC
+# (NTESS).  Under the terms of Contract DE-NA0003525 with NTESS, the
+# U.S. Government retains certain rights in this software.
+
+# SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import annotations
+
+import re
+from typing import Iterable, Iterator, List, Tuple, Union
+
+CURSOR_CONTROL = re.compile("(\r|\x08|\x1b\\[([0-9;]*)([A-GJK]))")
+"""Matches the carriage returns, backspaces, and CSI sequences that move
+the cursor or erase text, capturing the CSI parameters and final
+character."""
+
+ESCAPE_SEQUENCE = re.compile(
+    "(\x1b(?:\\[[0-?]*[ -/]*[@-~]|\\][^\x07\x1b]*(?:\x07|\x1b\\\\)?"
+    "|[ -/]*[0-~])?)"
+)
+"""Matches the (zero-width) escape sequences left once the cursor
+controls have been handled, e.g., to change the color of the text."""
+
+
+def byte_size(text: str) -> int:
+    """
+    Get the size of some text once it's encoded as UTF-8.
+
+    Parameters:
+        text:  The text to measure.
+
+    Returns:
+        The number of bytes.
+    """
+    return len(text) if text.isascii() else len(text.encode())
+
+
+class ProgressCollapser:
+    """
+    Collapse output that was redrawn in place to its final state.
+
+    Progress bars (e.g., from ``pip``, ``wget``, CMake, or Ninja) redraw
+    a line over and over, via carriage returns, backspaces, and cursor
+    control sequences.  A terminal only shows the final state of each
+    line, but the output itself holds every redraw, which can make for
+    megabyte-long lines.  This emulates just enough of a terminal to
+    find what it would show:  carriage returns, backspaces, moving the
+    cursor (``CSI`` ``A`` through ``G``), and erasing the line or the
+    rest of the screen (``CSI`` ``K`` and ``J``).  Any other escape
+    sequences (e.g., colors) are kept, but take up no space.
+
+    Lines without any of the above are passed through as is.
+
+    Attributes:
+        window (int):  How many of the most recent lines the cursor can
+            move back up to.  Older lines are final.
+        elided (int):  The number of bytes of output dropped so far,
+            because they were overwritten or erased.
+    """
+
+    def __init__(self, window: int = 64) -> None:
+        """
+        Initialize a :class:`ProgressCollapser` object.
+
+        Parameters:
+            window:  How many of the most recent lines the cursor can
+                move back up to.
+        """
+        self.window = window
+        self.elided = 0
+
+    def collapse(self, lines: Iterable[str]) -> Iterator[str]:
+        r"""
+        Collapse the lines of output.
+
+        Parameters:
+            lines:  The lines of output, each ending in a newline except
+                perhaps the last.  Carriage returns mustn't have been
+                treated as line breaks (e.g., open files with
+                ``newline="\n"``).
+
+        Yields:
+            Each line as a terminal would show it, without the newline.
+        """
+        rows: List[Union[str, List[str]]] = [""]
+        row = col = 0
+        newline = False
+        for line in lines:
+            self.elided += byte_size(line)
+            newline = line.endswith("\n")
+            text = line[:-1] if newline else line
+            if (
+                row == len(rows) - 1
+                and col == 0
+                and rows[row] == ""
+                and not (
+                    ("\r" in text or "\x08" in text or "\x1b[" in text)
+                    and CURSOR_CONTROL.search(text)
+                )
+            ):
+                rows[row] = text
+            else:
+                row, col = self.draw(rows, row, col, text)
+            if newline:
+                row, col = row + 1, 0
+                if row == len(rows):
+                    rows.append("")
+            while len(rows) > self.window and row > 0:
+                yield self.emit(rows.pop(0), newline=True)
+                row -= 1
+        if not rows[-1] and (newline or len(rows) == 1):
+            rows.pop()
+        for i, final_row in enumerate(rows):
+            yield self.emit(final_row, newline=newline or i < len(rows) - 1)
+
+    def emit(self, row: Union[str, List[str]], *, newline: bool) -> str:
+        """
+        Finish with a line of output.
+
+        Parameters:
+            row:  The line, or the cells of the line, as shown.
+            newline:  Whether or not the line is followed by a newline.
+
+        Returns:
+            The line.
+        """
+        if isinstance(row, list):
+            row = "".join(row)
+        self.elided -= byte_size(row) + newline
+        return row
+
+    def draw(
+        self, rows: List[Union[str, List[str]]], row: int, col: int, text: str
+    ) -> Tuple[int, int]:
+        """
+        Draw some text, moving the cursor as it says to.
+
+        Parameters:
+            rows:  The lines within the window, each either as it was
+                output, or a list of the cells it's been drawn into.
+            row:  The line the cursor is on.
+            col:  The column the cursor is in.
+            text:  The text to draw, without any newlines.
+
+        Returns:
+            Where the cursor ends up, i.e., its line and column.
+        """
+        pieces = CURSOR_CONTROL.split(text)
+        col = self.write(self.cells(rows, row), col, pieces[0])
+        for i in range(1, len(pieces), 4):
+            control, params, final = pieces[i : i + 3]
+            if control == "\r":
+                col = 0
+            elif control == "\x08":
+                col = max(col - 1, 0)
+            else:
+                arg = params.split(";")[0]
+                count = int(arg) if arg else 0
+                if final in "JK":
+                    self.erase(rows, row, col, final, count)
+                else:
+                    row, col = self.move(rows, row, col, final, count)
+            col = self.write(self.cells(rows, row), col, pieces[i + 3])
+        return row, col
+
+    @staticmethod
+    def move(
+        rows: List[Union[str, List[str]]],
+        row: int,
+        col: int,
+        final: str,
+        count: int,
+    ) -> Tuple[int, int]:
+        """
+        Move the cursor.
+
+        Parameters:
+            rows:  The lines within the window.
+            row:  The line the cursor is on.
+            col:  The column the cursor is in.
+            final:  The final character of the CSI sequence, ``A``
+                through ``G``.
+            count:  The parameter of the CSI sequence, or 0 if it has
+                none.
+
+        Returns:
+            Where the cursor ends up, i.e., its line and column.
+        """
+        if final == "G":
+            return row, max(count - 1, 0)
+        count = max(count, 1)
+        if final == "C":
+            return row, col + count
+        if final == "D":
+            return row, max(col - count, 0)
+        if final in "AF":
+            row = max(row - count, 0)
+        else:
+            row = min(row + count, len(rows) - 1)
+        return row, 0 if final in "EF" else col
+
+    def erase(
+        self,
+        rows: List[Union[str, List[str]]],
+        row: int,
+        col: int,
+        final: str,
+        count: int,
+    ) -> None:
+        """
+        Erase part of the line, or of the screen.
+
+        Only erasing the rest of the screen is supported, since that's
+        all that's needed to redraw progress bars.
+
+        Parameters:
+            rows:  The lines within the window.
+            row:  The line the cursor is on.
+            col:  The column the cursor is in.
+            final:  The final character of the CSI sequence, ``J`` or
+                ``K``.
+            count:  The parameter of the CSI sequence, or 0 if it has
+                none.
+        """
+        cells = self.cells(rows, row)
+        if count == 0:
+            del cells[col:]
+            if final == "J":
+                del rows[row + 1 :]
+        elif final == "K" and count == 1:
+            cells[: col + 1] = [" "] * min(col + 1, len(cells))
+        elif final == "K":
+            cells.clear()
+
+    @staticmethod
+    def cells(rows: List[Union[str, List[str]]], row: int) -> List[str]:
+        """
+        Get the cells of a line, such that it can be drawn over.
+
+        Parameters:
+            rows:  The lines within the window.
+            row:  The line to get the cells of.
+
+        Returns:
+            A list of the characters in the line, with any escape
+            sequences attached to the character following them.
+        """
+        if isinstance(rows[row], str):
+            cells: List[str] = []
+            ProgressCollapser.write(cells, 0, rows[row])
+            rows[row] = cells
+        return rows[row]
+
+    @staticmethod
+    def write(cells: List[str], col: int, text: str) -> int:
+        """
+        Write over the cells of a line.
+
+        Parameters:
+            cells:  The cells of the line.
+            col:  The column to start writing at.
+            text:  The text to write, without any cursor controls.
+
+        Returns:
+            The column the cursor ends up in.
+        """
+        if not text:
+            return col
+        pending = ""
+        pieces = ESCAPE_SEQUENCE.split(text)
+        for i, piece in enumerate(pieces):
+            if i % 2:
+                pending += piece
+                continue
+            if not piece:
+                continue
+            characters = list(piece)
+            characters[0] = pending + characters[0]
+            pending = ""
+            if col > len(cells):
+                cells.extend(" " * (col - len(cells)))
+            cells[col : col + len(characters)] = characters
+            col += len(characters)
+        if pending:
+            if 0 < col <= len(cells):
+                cells[col - 1] += pending
+            else:
+                cells.append(pending)
+        return col
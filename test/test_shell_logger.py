@@ -6,18 +6,48 @@
 
 # SPDX-License-Identifier: BSD-3-Clause
 
+import asyncio
 import json
 import os
 import re
+import sys
+import threading
 from inspect import stack
+from io import BytesIO, StringIO
 from pathlib import Path
+from time import perf_counter, sleep
+from typing import Iterator, List
 
 import distro
 import pytest
 from _pytest.capture import CaptureFixture
 from _pytest.monkeypatch import MonkeyPatch
 
-from shell_logger import ShellLogger, ShellLoggerDecoder
+from shell_logger import CommandScheduler, ShellLogger, ShellLoggerDecoder
+from shell_logger import shell_logger as shell_logger_module
+from shell_logger.html_utilities import (
+    SCRIPTS,
+    STYLES,
+    Lines,
+    Nested,
+    append_html,
+    compile_split_template,
+    compile_template,
+    flatten,
+    hexdump,
+    html_encode,
+    html_header,
+    is_binary,
+    output_block_template,
+    output_line_html,
+    output_lines_html,
+    split_template,
+    stat_chart_template,
+    truncated_line_html,
+)
+from shell_logger.shell import TRAILER_SIZE, Shell, TeeEngine, TeeStream
+from shell_logger.shell_pool import WarmShellPool
+from shell_logger.terminal import ProgressCollapser
 
 try:
     import psutil
@@ -341,6 +371,74 @@ def test_finalize_creates_html_with_correct_information(
     assert "Child</" in html_text
 
 
+def test_environment_stored_once_per_distinct_value() -> None:
+    """
+    Ensure the environment and ``ulimit`` are stored by content hash.
+
+    Verify that identical environments are only stored once, that the
+    log entries hold references to them, that environment changes are
+    recorded when requested, and that all of this survives the round
+    trip through JSON.
+    """
+    logger = ShellLogger(
+        stack()[0][3], log_dir=Path.cwd(), diff_environment=True
+    )
+    logger.log("First", ":")
+    logger.log("Export", "export SHELL_LOGGER_TEST=yes")
+    logger.log("After", ":")
+    child = logger.add_child("Child")
+    child.log("Child", ":")
+    first, export, after, _ = logger.log_book
+    assert "environment" not in first
+    assert first["environment_hash"] == export["environment_hash"]
+    assert first["environment_hash"] != after["environment_hash"]
+    assert first["ulimit_hash"] == after["ulimit_hash"]
+    assert first["environment_diff"] is None
+    assert export["environment_diff"] == ""
+    assert after["environment_diff"] == "+SHELL_LOGGER_TEST=yes"
+    assert child.log_book[0]["environment_hash"] == first["environment_hash"]
+    assert "PATH=" in logger.aux_store[first["environment_hash"]]
+    assert child.aux_store is logger.aux_store
+    expected_hashes = 3
+    assert len(logger.aux_store) == expected_hashes
+    logger.finalize()
+    json_file = logger.stream_dir / f"{logger.name}.json"
+    with json_file.open("r") as jf:
+        loaded_logger = json.load(jf, cls=ShellLoggerDecoder)
+    assert loaded_logger.aux_store == logger.aux_store
+    assert loaded_logger.log_book[3].aux_store is loaded_logger.aux_store
+    with logger.html_file.open("r") as hf:
+        html_text = hf.read()
+    assert "PATH=" in html_text
+
+
+def test_environment_shown_once_per_snapshot(
+    tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    """Ensure cards refer to an unchanged environment shown earlier."""
+    monkeypatch.setenv("SHELL_LOGGER_SNAPSHOT", "unique")
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path)
+    logger.log("First", ":")
+    logger.log("Second", ":")
+    logger.log("Export", "export SHELL_LOGGER_TEST=yes")
+    logger.log("After", ":")
+    logger.print("A message.")
+    logger.log("Again", ":")
+    first, second, export, after, _, again = logger.log_book
+    assert first["environment_ref"] is None
+    assert second["environment_ref"] == first["cmd_id"]
+    assert export["environment_ref"] == first["cmd_id"]
+    assert after["environment_ref"] is None
+    assert again["environment_ref"] == after["cmd_id"]
+    logger.finalize()
+    html = logger.html_file.read_text()
+    assert html.count("SHELL_LOGGER_SNAPSHOT=unique") == 2  # noqa: PLR2004
+    assert html.count("The environment is the same as") == 3  # noqa: PLR2004
+    for entry in [first, after]:
+        assert f"id={entry['cmd_id']}-environment" in html
+        assert f'href="#{entry["cmd_id"]}-environment"' in html
+
+
 def test_log_dir_html_symlinks_to_stream_dir_html(
     shell_logger: ShellLogger,
 ) -> None:
@@ -548,6 +646,33 @@ def test_auxiliary_data() -> None:
         )
 
 
+def test_auxiliary_commands_are_framed() -> None:
+    """
+    Ensure batched auxiliary commands are split correctly.
+
+    Ensure output that doesn't end in a newline, or that ends in the
+    old end-of-transmission character, doesn't bleed into the output of
+    the next command in the batch.
+    """
+    shell = Shell()
+    results, stderr = shell.auxiliary_commands(
+        {
+            "eot": "printf 'x\\4'",
+            "echo": "echo hello",
+            "empty": ":",
+            "error": "echo oops 1>&2",
+        },
+        strip=["echo"],
+    )
+    assert results == {
+        "eot": "x\x04",
+        "echo": "hello",
+        "empty": "",
+        "error": "",
+    }
+    assert stderr == "oops\n"
+
+
 def test_working_directory() -> None:
     """
     Ensure the working directory is captured.
@@ -799,6 +924,22 @@ def test_change_pwd() -> None:
     assert result.pwd == directory2
 
 
+def test_output_resembling_end_of_output() -> None:
+    """
+    Ensure output can't be confused with the end of a command.
+
+    Ensure output that ends in the old end-of-transmission character, or
+    that doesn't end in a newline, is captured in full, and that the
+    return code still comes through.
+    """
+    logger = ShellLogger(stack()[0][3], log_dir=Path.cwd())
+    result = logger._run("printf 'abc\\4'; printf 'def\\4' 1>&2; false")
+    assert result.stdout == "abc\x04"
+    assert result.stderr == "def\x04"
+    assert result.returncode == 1
+    assert logger._run("printf 'no newline'").stdout == "no newline"
+
+
 def test_returncode() -> None:
     """Ensure we get the expected return code when a command fails."""
     logger = ShellLogger(stack()[0][3], log_dir=Path.cwd())
@@ -842,6 +983,22 @@ def test_sgr_gets_converted_to_html() -> None:
     assert "background-color: rgb(240, 140, 10)" in html_text
 
 
+def test_non_sgr_escape_sequences_get_stripped() -> None:
+    """Ensure escape sequences other than SGR don't consume any text."""
+    assert html_encode("a\x1b[2Kb m c") == "ab m c"
+    assert html_encode("x\x1b[?25ly\x1b[1A") == "xy"
+    assert html_encode("\x1b]0;title\x07text") == "text"
+    assert html_encode("\x1b]8;;https://x\x1b\\link\x1b]8;;\x1b\\") == "link"
+    assert html_encode("\x1b(Blone\x1b") == "lone"
+    assert html_encode("<\x1b[01;35m&\x1b[m>") == (
+        '&lt;<span style="font-weight: bold;">'
+        '<span style="color: magenta;">&amp;</span></span>&gt;'
+    )
+    assert html_encode("\x1b[32mnot reset") == (
+        '<span style="color: green;">not reset</span>'
+    )
+
+
 def test_html_print(capsys: CaptureFixture) -> None:
     """
     Ensure :func:`html_print` doesn't print to the console.
@@ -940,3 +1097,902 @@ def test_invalid_decodings() -> None:
         return_info=True,
     )
     assert result["stdout"] == "Hello\n"
+    stdout_file = next(logger.stream_dir.glob("*_stdout"))
+    assert stdout_file.read_bytes() == b"\xfdHello\n"
+
+
+def test_multibyte_characters_split_across_reads() -> None:
+    """Ensure characters split between reads are decoded correctly."""
+    stream = TeeStream(0)
+    raw, text = BytesIO(), StringIO()
+    stream.reset(b"MARKER", ([raw], [text]))
+    stream.feed(b"caf\xc3")
+    stream.feed(b"\xa9 \xe2\x82")
+    stream.feed(b"\xac\nMARK")
+    assert not stream.done
+    stream.feed(b"ER:0\nMARK")
+    assert not stream.done
+    stream.feed(b"ER\n")
+    assert stream.done
+    assert stream.trailer == b":0\n"
+    assert raw.getvalue() == "caf\u00e9 \u20ac\n".encode()
+    assert text.getvalue() == "caf\u00e9 \u20ac\n"
+
+
+def test_stream_files_are_only_sinks(tmp_path: Path) -> None:
+    """Ensure output moved straight into the stream files is intact."""
+    shell = Shell()
+    stdout_path, stderr_path = tmp_path / "stdout", tmp_path / "stderr"
+    stdout_path.write_bytes(b"Earlier output\n")
+    result = shell.run(
+        "seq 1 200000; seq 1 1000 1>&2; printf 'No newline'; false",
+        quiet_stdout=True,
+        quiet_stderr=True,
+        stdout_path=stdout_path,
+        stderr_path=stderr_path,
+    )
+    expected = "".join(f"{i}\n" for i in range(1, 200001)) + "No newline"
+    assert result.returncode == 1
+    assert result.stdout_bytes == len(expected)
+    assert stdout_path.read_text() == "Earlier output\n" + expected
+    assert stderr_path.read_text() == "".join(f"{i}\n" for i in range(1, 1001))
+    result = shell.run(
+        "echo Again", quiet_stdout=True, stdout_path=stdout_path
+    )
+    assert result.returncode == 0
+    assert stdout_path.read_text().endswith("No newlineAgain\n")
+
+
+def test_tee_engine_byte_counts(tmp_path: Path) -> None:
+    """Ensure bytes are counted exactly, however the output is read."""
+    stdout_fd, stdout_wfd = os.pipe()
+    stderr_fd, stderr_wfd = os.pipe()
+    engine = TeeEngine(stdout_fd, stderr_fd, buffer_size=3)
+    writes = [
+        (stdout_wfd, "caf\u00e9 \u20ac\n".encode()),
+        (stderr_wfd, "\u00fcber\n".encode()),
+        (stdout_wfd, b"\xe2\x98"),
+        (stderr_wfd, b"\xf0\x9f"),
+        (stdout_wfd, b"\x83\n"),
+        (stderr_wfd, b"\x90\x8d\n"),
+    ]
+    writes += [(fd, b"MARKER:0MARKER\n") for fd in (stdout_wfd, stderr_wfd)]
+
+    def write_all() -> None:
+        for fd, data in writes:
+            os.write(fd, data)
+            sleep(0.01)
+
+    writer = threading.Thread(target=write_all)
+    writer.start()
+    sinks = {fd: (BytesIO(), StringIO()) for fd in (stdout_wfd, stderr_wfd)}
+    engine.run(
+        b"MARKER",
+        ([sinks[stdout_wfd][0]], [sinks[stdout_wfd][1]]),
+        ([sinks[stderr_wfd][0]], [sinks[stderr_wfd][1]]),
+    )
+    writer.join()
+    for stream, fd in [
+        (engine.stdout, stdout_wfd),
+        (engine.stderr, stderr_wfd),
+    ]:
+        expected = b"".join(data for each, data in writes[:-2] if each == fd)
+        raw, text = sinks[fd]
+        assert stream.byte_count == len(expected)
+        assert raw.getvalue() == expected
+        assert text.getvalue() == expected.decode()
+    for fd in (stdout_fd, stdout_wfd, stderr_fd, stderr_wfd):
+        os.close(fd)
+
+    shell = Shell()
+    shell.tee_engine.buffer = bytearray(3)
+    command = (
+        "for i in 1 2 3; do printf '\\303\\251\\342\\202\\254%s\\n' $i; "
+        "printf '\\360\\237\\220\\215%s\\n' $i >&2; done"
+    )
+    stdout = "".join(f"\u00e9\u20ac{i}\n" for i in range(1, 4))
+    stderr = "".join(f"\U0001f40d{i}\n" for i in range(1, 4))
+    result = shell.run(
+        command,
+        stdout_str=True,
+        stderr_str=True,
+        quiet_stdout=True,
+        quiet_stderr=True,
+    )
+    assert (result.stdout, result.stderr) == (stdout, stderr)
+    assert result.stdout_bytes == len(stdout.encode())
+    assert result.stderr_bytes == len(stderr.encode())
+    result = shell.run(
+        command,
+        quiet_stdout=True,
+        quiet_stderr=True,
+        stdout_path=tmp_path / "stdout",
+        stderr_path=tmp_path / "stderr",
+    )
+    assert result.stdout_bytes == (tmp_path / "stdout").stat().st_size
+    assert result.stderr_bytes == (tmp_path / "stderr").stat().st_size
+    assert (tmp_path / "stderr").read_text() == stderr
+
+
+def test_async_log(tmp_path: Path) -> None:
+    """Ensure many loggers can run commands concurrently in one loop."""
+    parent = ShellLogger(stack()[0][3], log_dir=tmp_path)
+    children = [parent.add_child(f"Child {i}") for i in range(4)]
+    parent.log("Synchronous", "echo sync", return_info=True)
+
+    async def run_all() -> list:
+        return await asyncio.gather(
+            *(
+                child.async_log(
+                    f"Sleep {i}",
+                    f"sleep 1; echo child {i}; (exit {i})",
+                    cwd=tmp_path,
+                    return_info=True,
+                )
+                for i, child in enumerate(children)
+            )
+        )
+
+    cwd = Path.cwd()
+    start = perf_counter()
+    results = asyncio.run(run_all())
+    assert perf_counter() - start < len(children) - 1
+    for i, (child, result) in enumerate(zip(children, results, strict=True)):
+        assert result == {
+            "return_code": i,
+            "stdout": f"child {i}\n",
+            "stderr": "",
+        }
+        assert child.log_book[0].keys() == parent.log_book[-1].keys()
+        assert child.log_book[0]["pwd"] == str(tmp_path)
+    assert Path.cwd() == cwd
+    parent.finalize()
+    html_text = parent.html_file.read_text()
+    assert "child 3" in html_text
+
+
+def test_async_log_same_shell(tmp_path: Path) -> None:
+    """Ensure concurrent commands in one shell are run one at a time."""
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path)
+    child = logger.add_child("Child", share_shell=True)
+
+    async def run_all() -> list:
+        return await asyncio.gather(
+            *(
+                log.async_log(
+                    f"Echo {i}",
+                    f"echo start {i}; sleep 0.2; echo end {i}",
+                    return_info=True,
+                )
+                for i, log in enumerate([logger, logger, child, child])
+            )
+        )
+
+    def run() -> None:
+        results.extend(asyncio.run(run_all()))
+
+    results: list = []
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    for i, result in enumerate(results):
+        assert result == {
+            "return_code": 0,
+            "stdout": f"start {i}\nend {i}\n",
+            "stderr": "",
+        }
+    assert len(logger.log_book) == len(child.log_book) + 1
+
+
+def test_log_many(tmp_path: Path) -> None:
+    """Ensure commands can run concurrently in a pool of shells."""
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path, max_workers=4)
+    future = logger.submit("First", "sleep 1; echo first", return_info=True)
+    start = perf_counter()
+    results = logger.log_many(
+        [(f"Command {i}", f"sleep 1; echo {i}; (exit {i})") for i in range(3)],
+        cwd=tmp_path,
+        return_info=True,
+    )
+    assert perf_counter() - start < len(results)
+    assert future.result()["stdout"] == "first\n"
+    assert [result["return_code"] for result in results] == [0, 1, 2]
+    assert [log["msg"] for log in logger.log_book] == [
+        "First",
+        "Command 0",
+        "Command 1",
+        "Command 2",
+    ]
+    assert len({log["cmd_id"] for log in logger.log_book}) == len(
+        logger.log_book
+    )
+    logger.finalize()
+    json_file = logger.stream_dir / f"{logger.name}.json"
+    with json_file.open() as jf:
+        loaded_logger = json.load(jf, cls=ShellLoggerDecoder)
+    assert loaded_logger.max_workers == logger.max_workers
+    assert "Command 2" in logger.html_file.read_text()
+
+
+@pytest.mark.parametrize("live_html", [False, True])
+def test_submitted_command_error(
+    tmp_path: Path,
+    live_html: bool,  # noqa: FBT001
+) -> None:
+    """Ensure a submitted command that raises doesn't break the log."""
+    logger = ShellLogger(
+        stack()[0][3], log_dir=tmp_path, max_workers=2, live_html=live_html
+    )
+    failed = logger.submit("Exit.", "kill -9 $$")
+    slow = logger.submit("Slow.", "sleep 0.5; echo slow")
+    with pytest.raises(RuntimeError, match="kill -9"):
+        logger.wait()
+    assert slow.done()
+    assert isinstance(failed.exception(), RuntimeError)
+    entry = logger.log_book[0]
+    assert entry["cmd"] is None
+    assert "kill -9" in entry["error"]
+    assert logger.log_book[1]["duration"] is not None
+    logger.log("After.", "echo after")
+    logger.finalize()
+    html = logger.html_file.read_text()
+    assert "Exit. (failed)" in html
+    assert html.index("Exit. (failed)") < html.index("Slow.")
+    assert html.index("Slow.") < html.index("After.")
+    assert html.endswith("</html>\n")
+
+
+def test_submitted_commands_are_isolated(
+    tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    """Ensure a pooled shell doesn't carry state between commands."""
+    (tmp_path / "sub").mkdir()
+    monkeypatch.chdir(tmp_path)
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path, max_workers=1)
+    logger.submit("Change state.", "cd sub; export X=1").result()
+    result = logger.submit(
+        "Check state.", 'pwd; echo "X=$X"', return_info=True
+    ).result()
+    assert result["stdout"] == f"{tmp_path}\nX=\n"
+    logger.log("Change directory.", "cd sub")
+    result = logger.submit("Check directory.", "pwd", return_info=True)
+    assert result.result()["stdout"] == f"{tmp_path / 'sub'}\n"
+
+
+def test_submitted_commands_see_environment(tmp_path: Path) -> None:
+    """Ensure a submitted command sees the logger shell's environment."""
+    (tmp_path / "sub").mkdir()
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path, max_workers=1)
+    logger.log("Set environment.", "export FOO='bar  baz'")
+    result = logger.submit(
+        "Check environment.",
+        'echo "FOO=$FOO"; echo "PWD=$PWD"',
+        cwd=tmp_path / "sub",
+        return_info=True,
+    ).result()
+    assert result["stdout"] == f"FOO=bar  baz\nPWD={tmp_path / 'sub'}\n"
+    assert result["stderr"] == ""
+
+
+def test_command_scheduler(tmp_path: Path) -> None:
+    """Ensure a graph of commands runs in dependency and priority order."""
+    history = tmp_path / "history.json"
+    history.write_text(
+        json.dumps({"log_book": [{"cmd": "sleep 0.5", "wall": 5000}]})
+    )
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path, max_workers=1)
+    scheduler = CommandScheduler(logger, history=[history])
+    scheduler.add("short", "Short.", "echo short")
+    scheduler.add("long", "Long.", "sleep 0.5")
+    scheduler.add(
+        "after", "After both.", "echo after", after=["short", "long"]
+    )
+    scheduler.add("fail", "Fail.", "false", after=["long"])
+    scheduler.add("skipped", "Skipped.", "echo skipped", after=["fail"])
+    results = scheduler.run()
+    assert set(results) == {"short", "long", "after", "fail"}
+    assert [log["msg"] for log in logger.log_book[:2]] == ["Long.", "Short."]
+    schedule = logger.log_book[-1]["schedule"]
+    statuses = {node["name"]: node["status"] for node in schedule["nodes"]}
+    assert statuses == {
+        "short": "succeeded",
+        "long": "succeeded",
+        "after": "succeeded",
+        "fail": "failed",
+        "skipped": "skipped",
+    }
+    assert schedule["critical_path"][0] == "long"
+    logger.finalize()
+    html_text = logger.html_file.read_text()
+    assert "Critical path" in html_text
+    scheduler.add("cycle", "Cycle.", "true", after=["cycle"])
+    with pytest.raises(ValueError, match="cycle"):
+        scheduler.run()
+
+
+def test_command_scheduler_error(tmp_path: Path) -> None:
+    """Ensure a command that raises doesn't stop the rest of the graph."""
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path, max_workers=1)
+    logger.print("Before the graph.")
+    scheduler = CommandScheduler(logger)
+    scheduler.add("crash", "Crash.", "kill -9 $$")
+    scheduler.add("after", "After the crash.", "true", after=["crash"])
+    scheduler.add("independent", "Independent.", "sleep 0.1")
+    with pytest.raises(RuntimeError, match="kill -9"):
+        scheduler.run()
+    schedule = logger.log_book[-1]["schedule"]
+    nodes = {node["name"]: node for node in schedule["nodes"]}
+    assert nodes["crash"]["status"] == "failed"
+    assert "kill -9" in nodes["crash"]["error"]
+    assert nodes["after"]["status"] == "skipped"
+    assert nodes["independent"]["status"] == "succeeded"
+    assert schedule["critical_path"] == ["independent"]
+    entry = logger.log_book[scheduler.nodes["independent"].index]
+    assert entry["msg"] == "Independent."
+    assert nodes["independent"]["start"] == entry["start"]
+    logger.finalize()
+    html = logger.html_file.read_text()
+    assert "Crash. (failed)" in html
+    assert "Independent." in html
+    assert "Critical path" in html
+    assert html.endswith("</html>\n")
+
+
+def test_shells_are_spawned_lazily(tmp_path: Path) -> None:
+    """Ensure loading and re-rendering a log doesn't spawn shells."""
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path)
+    for i in range(3):
+        logger.add_child(f"Child {i}").print(f"Message {i}")
+    logger.log("Parent command", "echo parent")
+    logger.finalize()
+    json_file = logger.stream_dir / f"{logger.name}.json"
+    assert '"Shell"' not in json_file.read_text()
+    loaded_logger = ShellLogger.append(json_file)
+    loaded_logger.finalize()
+    children = [
+        log for log in loaded_logger.log_book if isinstance(log, ShellLogger)
+    ]
+    assert [child._shell for child in [loaded_logger, *children]] == [None] * 4
+    assert (
+        ShellLoggerDecoder.dict_to_object(
+            {"__type__": "Shell", "pwd": str(tmp_path), "login_shell": False}
+        )
+        is None
+    )
+    assert (
+        loaded_logger.log("Spawn", "pwd", return_info=True)["return_code"] == 0
+    )
+    assert loaded_logger._shell is not None
+
+
+def test_children_can_share_a_shell(tmp_path: Path) -> None:
+    """Ensure children sharing a shell keep their own directories."""
+    parent = ShellLogger(stack()[0][3], log_dir=tmp_path)
+    child = parent.add_child("Child", share_shell=True)
+    grandchild = child.add_child("Grandchild", share_shell=True)
+    other = parent.add_child("Other")
+    assert child.shell is parent.shell
+    assert grandchild.shell is parent.shell
+    assert other.shell is not parent.shell
+    (tmp_path / "child dir").mkdir()
+    child.log("Move the child", f"cd '{tmp_path / 'child dir'}'")
+    child.log("Export", "export SHARED_BY_CHILD=yes")
+    parent_pwd = parent.log("Parent", "pwd", return_info=True)["stdout"]
+    assert parent_pwd.strip() == str(Path.cwd())
+    assert child.log("Child", "pwd", return_info=True)["stdout"].strip() == (
+        str(tmp_path / "child dir")
+    )
+    grandchild_pwd = grandchild.log("Grandchild", "pwd", return_info=True)
+    assert grandchild_pwd["stdout"].strip() == str(Path.cwd())
+    shared = parent.log("Env", "printenv SHARED_BY_CHILD", return_info=True)
+    assert shared["stdout"] == "yes\n"
+
+
+def test_shell_cd(tmp_path: Path) -> None:
+    """Ensure the shell knows where it is after changing directories."""
+    shell = Shell()
+    (tmp_path / "a dir").mkdir()
+    shell.cd(tmp_path / "a dir", chdir=False)
+    assert shell.last_pwd == str(tmp_path / "a dir")
+    assert shell.pwd() == str(tmp_path / "a dir")
+    before = shell.cd(tmp_path / "missing", chdir=False)
+    assert before == str(tmp_path / "a dir")
+    assert shell.last_pwd == str(tmp_path / "a dir")
+    assert shell.pwd() == str(tmp_path / "a dir")
+
+
+def test_warm_shell_pool(monkeypatch: MonkeyPatch) -> None:
+    """Ensure shells are spawned ahead of time, and stale ones dropped."""
+
+    def wait_for_idle_shell() -> None:
+        for _ in range(100):
+            if pool.idle[False]:
+                return
+            sleep(0.05)
+
+    pool = WarmShellPool(size=1)
+    assert isinstance(pool.lease(), Shell)
+    wait_for_idle_shell()
+    shell = pool.lease()
+    assert shell.run(
+        "echo warm", stdout_str=True, quiet_stdout=True
+    ).stdout == ("warm\n")
+    wait_for_idle_shell()
+    monkeypatch.setenv("SHELL_LOGGER_WARM_POOL_TEST", "changed")
+    shell = pool.lease()
+    result = shell.run(
+        "printenv SHELL_LOGGER_WARM_POOL_TEST",
+        stdout_str=True,
+        quiet_stdout=True,
+    )
+    assert result.stdout == "changed\n"
+    metrics = pool.metrics()
+    assert (metrics["hits"], metrics["misses"], metrics["stale"]) == (1, 2, 1)
+    assert metrics["spawned"] >= metrics["misses"]
+    assert metrics["max_spawn_time"] >= metrics["mean_spawn_time"] > 0
+
+
+def test_warm_shell_pool_opt_out_and_close() -> None:
+    """Ensure the pool can keep no idle shells, and close those it has."""
+    cold = WarmShellPool(size=0)
+    assert isinstance(cold.lease(), Shell)
+    sleep(0.2)
+    assert cold.idle[False] == []
+    assert not cold.refilling[False]
+    assert cold.metrics()["spawned"] == 1
+    pool = WarmShellPool(size=1)
+    pool.prewarm()
+    for _ in range(100):
+        if pool.idle[False]:
+            break
+        sleep(0.05)
+    idle_shell, _ = pool.idle[False][0]
+    pool.close()
+    assert pool.idle[False] == []
+    assert idle_shell.shell_subprocess.poll() is not None
+
+
+def test_invariant_auxiliary_information_is_cached(tmp_path: Path) -> None:
+    """Ensure the invariant auxiliary information is fetched only once."""
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path)
+    logger.log("Cache the invariant information.", "echo 1")
+    logger.log("Lower the limit.", "ulimit -S -n 256")
+    logger.log("Refetch the limits.", "echo 2")
+    shell = logger.shell
+    open_files = next(
+        line for line in shell.aux_cache["ulimit"].splitlines() if "-n" in line
+    )
+    assert open_files.endswith("256")
+    logger.refresh_aux()
+    assert shell.aux_cache == {}
+    logger.log("Refetch everything.", "echo 3")
+    logger.log("Use the cache.", "echo 4")
+    assert (shell.aux_cache_hits, shell.aux_cache_misses) == (2, 3)
+    assert logger.log_book[-1]["hostname"] == logger.log_book[0]["hostname"]
+    expiring = ShellLogger(
+        stack()[0][3], log_dir=tmp_path, aux_ttl=0, ulimit_policy="volatile"
+    )
+    for i in range(3):
+        expiring.log("Expire the cache.", f"echo {i}")
+    assert (
+        expiring.shell.aux_cache_hits,
+        expiring.shell.aux_cache_misses,
+    ) == (
+        0,
+        3,
+    )
+    with pytest.raises(ValueError, match="ulimit_policy"):
+        ShellLogger(stack()[0][3], log_dir=tmp_path, ulimit_policy="never")
+
+
+def test_cwd_is_set_in_the_command_frame(
+    tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    """Ensure a ``cwd`` doesn't change the process' working directory."""
+
+    def chdir(path: Path) -> None:
+        message = f"Changed the process' working directory to {path}."
+        raise AssertionError(message)
+
+    cwd = tmp_path / "a directory"
+    cwd.mkdir()
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path)
+    start = logger.log("Start.", "pwd", return_info=True)["stdout"]
+    monkeypatch.setattr(os, "chdir", chdir)
+    result = logger.log("Elsewhere.", "pwd", cwd=cwd, return_info=True)
+    assert result["stdout"] == f"{cwd}\n"
+    assert logger.log_book[-1]["pwd"] == str(cwd)
+    assert logger.log("Back.", "pwd", return_info=True)["stdout"] == start
+    missing = logger.log(
+        "Missing.",
+        "echo unreachable",
+        cwd=tmp_path / "missing",
+        return_info=True,
+    )
+    assert missing["return_code"] != 0
+    assert "unreachable" not in missing["stdout"]
+    assert (
+        logger.log("Still back.", "pwd", return_info=True)["stdout"] == start
+    )
+
+
+def test_live_html(tmp_path: Path) -> None:
+    """Ensure the HTML can be written as the logger runs."""
+
+    def tags(logger: ShellLogger) -> List[str]:
+        body = logger.html_file.read_text().split("</head>")[1]
+        body = re.sub(r"<script>.*?</script>", "", body, flags=re.DOTALL)
+        return re.findall(r"</?\w+", body)
+
+    loggers = []
+    for live_html in [True, False]:
+        logger = ShellLogger(
+            stack()[0][3], log_dir=tmp_path, live_html=live_html
+        )
+        logger.log("First command.", "echo first")
+        if live_html:
+            html = logger.html_file.read_text()
+            assert "First command." in html
+            assert "</html>" not in html
+        child = logger.add_child("Child")
+        child.log("Child command.", "echo child")
+        if live_html:
+            assert "Child command." in logger.html_file.read_text()
+        logger.print("After the child.")
+        logger.finalize()
+        loggers.append(logger)
+        if live_html:
+            html = logger.html_file.read_text()
+            assert html.index("Child command.") < html.index(
+                "After the child."
+            )
+            assert html.endswith("</html>\n")
+            assert f"(Duration: {child.duration})" in html
+    assert tags(loggers[0]) == tags(loggers[1])
+
+
+def test_finalize_prunes_stale_fragments(tmp_path: Path) -> None:
+    """Ensure cached HTML the log no longer uses is deleted."""
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path)
+    logger.log("First command.", "echo first")
+    child = logger.add_child("Child")
+    child.log("Child command.", "echo child")
+    logger.finalize()
+    fragment_dir = logger.stream_dir / "fragments"
+    first = sorted(fragment_dir.iterdir())
+    assert len(first) == 2  # noqa: PLR2004
+    (fragment_dir / "interrupted.partial").write_text("<div>")
+    logger.minify_html = child.minify_html = True
+    logger.finalize()
+    second = sorted(fragment_dir.iterdir())
+    assert len(second) == len(first)
+    assert not set(first) & set(second)
+    html = logger.html_file.read_text()
+    logger.finalize()
+    assert sorted(fragment_dir.iterdir()) == second
+    assert logger.html_file.read_text() == html
+
+
+def test_live_html_late_child_entries(tmp_path: Path) -> None:
+    """Ensure entries logged to a child after its card closed are kept."""
+
+    def tags(logger: ShellLogger) -> List[str]:
+        body = logger.html_file.read_text().split("</head>")[1]
+        body = re.sub(r"<script>.*?</script>", "", body, flags=re.DOTALL)
+        return re.findall(r"</?\w+", body)
+
+    loggers = []
+    for live_html in [True, False]:
+        logger = ShellLogger(
+            stack()[0][3], log_dir=tmp_path, live_html=live_html
+        )
+        child = logger.add_child("Child")
+        child.log("Child command.", "echo child")
+        logger.print("After the child.")
+        child.log("Late command.", "echo late")
+        child.add_child("Late grandchild").print("Late grandchild entry.")
+        logger.finalize()
+        loggers.append(logger)
+        html = logger.html_file.read_text()
+        assert html.index("Child command.") < html.index("Late command.")
+        assert html.index("Late grandchild entry.") < html.index(
+            "After the child."
+        )
+        assert html.endswith("</html>\n")
+    assert tags(loggers[0]) == tags(loggers[1])
+
+
+def test_refinalize_only_renders_new_commands(
+    tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    """Ensure finalizing an appended log reuses the prior HTML."""
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path)
+    logger.log("First command.", "echo first")
+    logger.add_child("Child").log("Child command.", "echo child")
+    logger.finalize()
+    rendered = []
+
+    def command_card(log: dict, *args, **kwargs) -> Iterator[str]:
+        rendered.append(log["msg"])
+        return original_command_card(log, *args, **kwargs)
+
+    original_command_card = shell_logger_module.command_card
+    monkeypatch.setattr(shell_logger_module, "command_card", command_card)
+    appended = ShellLogger.append(logger.html_file)
+    appended.finalize()
+    assert rendered == []
+    assert appended.html_file.read_text() == logger.html_file.read_text()
+    appended.log("Appended command.", "echo appended")
+    appended.finalize()
+    assert rendered == ["Appended command."]
+    html = appended.html_file.read_text()
+    assert html.index("Child command.") < html.index("Appended command.")
+
+
+def test_minify_html(tmp_path: Path) -> None:
+    """Ensure the HTML can be minified without changing its structure."""
+
+    def tags(logger: ShellLogger) -> List[str]:
+        body = logger.html_file.read_text().split("</head>")[1]
+        return re.findall(r"</?\w+", body)
+
+    loggers = []
+    for minify_html in [True, False]:
+        logger = ShellLogger(
+            f"{stack()[0][3]}_{minify_html}",
+            log_dir=tmp_path,
+            minify_html=minify_html,
+        )
+        logger.log("Parent command.", "echo parent")
+        logger.add_child("Child").log("Child command.", "echo child")
+        logger.finalize()
+        loggers.append(logger)
+    minified, indented = (
+        logger.html_file.read_text().split("</head>")[1] for logger in loggers
+    )
+    assert len(minified) < len(indented)
+    assert not re.search(r"^[ \t]+<", minified, flags=re.MULTILINE)
+    assert "Child command." in minified
+    assert tags(loggers[0]) == tags(loggers[1])
+
+
+def test_append_html_deeply_nested(tmp_path: Path) -> None:
+    """Ensure trees of loggers deeper than the recursion limit render."""
+    depth = sys.getrecursionlimit() + 200
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path)
+    child = logger
+    for i in range(depth):
+        child = child.add_child(f"Level {i}")
+    child.print("Innermost.")
+    html_file = tmp_path / "deep.html"
+    append_html(logger.to_html(), b"<br>\n", output=html_file)
+    html = html_file.read_text()
+    assert html.count("Level ") == depth
+    assert html.index(f"Level {depth - 1}") < html.index("Innermost.")
+    assert html.endswith("<br>\n")
+    with pytest.raises(TypeError):
+        append_html(["<p>", 42], output=html_file)
+
+
+def test_compiled_templates() -> None:
+    """Ensure compiled templates match :meth:`str.format`."""
+    fields = {"labels": [1, 2], "data": [3.5, 4], "title": "100%", "id": "x"}
+    render = compile_template(stat_chart_template)
+    assert render(**fields, unused="ignored") == stat_chart_template.format(
+        **fields
+    )
+    assert compile_template(stat_chart_template) is render
+    assert compile_split_template(
+        output_block_template, "table_contents"
+    ) is compile_split_template(output_block_template, "table_contents")
+    header, indent, footer = split_template(
+        output_block_template, "table_contents", name="stdout", cmd_id="%s"
+    )
+    assert header + indent + "{table_contents}\n" + footer == (
+        output_block_template.replace("{name}", "stdout").replace(
+            "{cmd_id}", "%s"
+        )
+    )
+
+
+@pytest.mark.parametrize("minify", [True, False])
+def test_output_lines_html(minify: bool) -> None:  # noqa: FBT001
+    """Ensure a batch of lines renders the same as each line alone."""
+    lines = [
+        "plain  ",
+        "100% <b> & </b>",
+        "\x1b[1;31mbold \x1b[0m  ",
+        "\x1b[38;5;200mcolor\x1b[0m",
+        "",
+    ]
+    expected = "".join(
+        output_line_html(line, line_no, minify=minify)
+        for line_no, line in enumerate(lines, 7)
+    )
+    html = output_lines_html(lines, 7, minify=minify)
+    assert html == expected
+    assert isinstance(html, Lines)
+    assert "".join(flatten(Nested("  ", [html]))) == "".join(
+        flatten(Nested("  ", [expected]))
+    )
+    html = output_lines_html(["progress\rdone"], 0, minify=minify)
+    assert not isinstance(html, Lines)
+
+
+def test_progress_collapser() -> None:
+    """Ensure output redrawn in place collapses to its final state."""
+    collapser = ProgressCollapser()
+    lines = [
+        "plain\n",
+        "0%\r50%\r100%\n",
+        "[1/2] cc a.c\r\x1b[K[2/2] cc b.c\n",
+        "\x1b[32mone\x1b[0m\n",
+        "two\n",
+        "\x1b[2A\x1b[32mONE\x1b[0m\x1b[2E",
+        "12345\x08\x08ab\x1b[3Gc",
+    ]
+    assert list(collapser.collapse(lines)) == [
+        "plain",
+        "100%",
+        "[2/2] cc b.c",
+        "\x1b[32mONE\x1b[0m",
+        "two",
+        "12cab",
+    ]
+    raw = sum(len(line) for line in lines)
+    collapsed = len(
+        "plain\n100%\n[2/2] cc b.c\n\x1b[32mONE\x1b[0m\ntwo\n12cab"
+    )
+    assert collapser.elided == raw - collapsed
+
+
+def test_collapse_progress(tmp_path: Path) -> None:
+    """Ensure progress is collapsed in the HTML, but not the stream."""
+    logger = ShellLogger(
+        stack()[0][3], log_dir=tmp_path, collapse_progress=True
+    )
+    logger.log(
+        "Progress.",
+        r"printf 'start\n'; printf 'step%s\r' 1 2; printf 'step3\ndone\n'",
+    )
+    logger.finalize()
+    html = logger.html_file.read_text()
+    assert "<pre>step3</pre>" in html
+    assert "step2" not in html
+    assert "12 bytes of output redrawn in place were left out." in html
+    assert logger.log_book[0]["elided_bytes"] == {"stdout": 12, "stderr": 0}
+    stdout_file = next(logger.stream_dir.glob("*_stdout"))
+    assert stdout_file.read_bytes() == b"start\nstep1\rstep2\rstep3\ndone\n"
+
+
+def test_binary_output(tmp_path: Path) -> None:
+    """Ensure binary output is summarized, and links to the stream."""
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path)
+    logger.log("Binary.", "head -c 100000 /dev/urandom; printf 'ELF\\0\\0\\0'")
+    logger.log("Text.", "printf 'caf\\303\\251\\n'")
+    logger.finalize()
+    opened = tmp_path / logger.html_file.name
+    html = opened.read_text()
+    assert "Binary output (100,006 bytes) isn't shown." in html
+    assert "00000000: " in html
+    assert html.count("Binary output") == 1
+    href = re.search(r'<a href="([^"]+)">raw output</a>', html)[1]
+    assert (opened.parent / href).read_bytes().endswith(b"ELF\0\0\0")
+    assert "café" in html
+    assert is_binary(b"text\0with\0many\0nuls\0")
+    assert not is_binary("plain café text\n".encode())
+    assert hexdump(b"ab\x00") == [f"00000000: 6162 00{' ' * 32}  ab."]
+
+
+@pytest.mark.parametrize("max_line_width", [None, 100])
+def test_max_line_width(tmp_path: Path, max_line_width: int) -> None:
+    """Ensure lines that are too long are truncated until expanded."""
+    logger = ShellLogger(
+        stack()[0][3], log_dir=tmp_path, max_line_width=max_line_width
+    )
+    logger.log("Long line.", r"printf 'ab%.0s' $(seq 100); echo '<end>'")
+    logger.finalize()
+    html = logger.html_file.read_text()
+    if max_line_width is None:
+        assert "ab" * 100 + "&lt;end&gt;</pre>" in html
+        assert "more characters" not in html
+    else:
+        assert "ab" * 50 + '<button type="button" class="expand-line"' in html
+        assert "105 more characters</button>" in html
+        assert "<template>" + "ab" * 50 + "&lt;end&gt;</template>" in html
+    assert truncated_line_html("a\x1b[31mred", 3) == (
+        'a<button type="button" class="expand-line" '
+        'onclick="this.replaceWith(this.nextElementSibling.content)">'
+        '8 more characters</button><template><span style="color: red;">'
+        "red</span></template>"
+    )
+
+
+def test_output_budget(tmp_path: Path) -> None:
+    """Ensure only the first and last lines of output are shown."""
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path, output_budget=(3, 2))
+    logger.log("Budgeted.", "seq 1000 1999")
+    logger.log("Unbudgeted.", "seq 5000 5999", output_budget=(1000, 0))
+    logger.log("Short.", "seq 7000 7004")
+    logger.finalize()
+    html = logger.html_file.read_text()
+    assert all(f"<pre>{i}</pre>" in html for i in [1000, 1001, 1002, 1999])
+    assert "<pre>1003</pre>" not in html
+    assert "<pre>1997</pre>" not in html
+    assert '<div line-number="998"></div>' in html
+    assert "995 lines left out." in html
+    assert "<pre>5500</pre>" in html
+    assert all(f"<pre>{i}</pre>" in html for i in range(7000, 7005))
+    assert html.count("lines left out.") == 1
+    log = logger.log_book[0]
+    stdout_file = f"{log['timestamp']}_{log['cmd_id']}_stdout"
+    href = f"./{logger.stream_dir.name}/{stdout_file}"
+    assert f'<a href="{href}">raw output</a>' in html
+    assert (tmp_path / href).exists()
+    assert logger.log_book[1]["output_budget"] == (1000, 0)
+
+
+def test_asset_dir(tmp_path: Path) -> None:
+    """Ensure styles and scripts can be shared rather than embedded."""
+    asset_dir = tmp_path / "assets"
+    loggers = []
+    for i, asset_dir_arg in enumerate([asset_dir, asset_dir, None]):
+        logger = ShellLogger(
+            f"{stack()[0][3]} {i}", log_dir=tmp_path, asset_dir=asset_dir_arg
+        )
+        logger.log("Hello.", "echo hello")
+        logger.finalize()
+        loggers.append(logger)
+    assets = sorted(path.name for path in asset_dir.iterdir())
+    assert len(assets) == len(STYLES) + len(SCRIPTS)
+    bootstrap = next(name for name in assets if "bootstrap.min" in name)
+    assert re.fullmatch(r"bootstrap\.min\.[0-9a-f]{16}\.css", bootstrap)
+    opened = [tmp_path / logger.html_file.name for logger in loggers]
+    assert all(path.is_symlink() for path in opened)
+    shared, _, embedded = (path.read_text() for path in opened)
+    assert len(shared) < len(embedded) - 500_000
+    href = f"./assets/{bootstrap}"
+    assert f'<link rel="stylesheet" href="{href}">' in shared
+    assert (opened[0].parent / href).exists()
+    assert 'id="search-icon"' in shared
+    assert "<pre>hello</pre>" in shared
+    assert html_header() is html_header()
+
+
+def test_log_from_long_working_directory(tmp_path: Path) -> None:
+    """Ensure a long working directory doesn't hide the trailer."""
+    long_dir = tmp_path.joinpath(*[c * 100 for c in "abcd"])
+    long_dir.mkdir(parents=True)
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path)
+    results = []
+
+    def run() -> None:
+        results.append(logger.log("Change directory.", f"cd {long_dir}"))
+        results.append(logger.log("Print.", "echo hello"))
+        results.append(logger.log("Print.", "pwd", return_info=True))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    assert len(str(long_dir)) > TRAILER_SIZE
+    assert results[2]["stdout"].strip() == str(long_dir)
+    log = logger.log_book[1]
+    stdout_file = f"{log['timestamp']}_{log['cmd_id']}_stdout"
+    assert (logger.stream_dir / stdout_file).read_bytes() == b"hello\n"
+
+
+def test_log_from_working_directory_with_newline(tmp_path: Path) -> None:
+    """Ensure a newline in the working directory doesn't end the trailer."""
+    odd_dir = tmp_path / "new\nline"
+    odd_dir.mkdir()
+    logger = ShellLogger(stack()[0][3], log_dir=tmp_path)
+    logger.log("Change directory.", "cd \"$(printf 'new\\nline')\"")
+    result = logger.log("Print.", "echo hello", return_info=True)
+    assert result["stdout"] == "hello\n"
+    logger.log("Print.", "echo hello")
+    log = logger.log_book[2]
+    stdout_file = f"{log['timestamp']}_{log['cmd_id']}_stdout"
+    assert (logger.stream_dir / stdout_file).read_bytes() == b"hello\n"
+    assert logger.shell.last_pwd == str(odd_dir)